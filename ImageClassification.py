@@ -1,5 +1,7 @@
 # File-level ingest module for Autopsy to classify images
 from java.lang import Integer
+from java.lang import RuntimeException
+from java.util import ArrayList
 from java.util.logging import Level
 from java.text import NumberFormat
 from java.awt import Color
@@ -7,6 +9,11 @@ from java.awt import Toolkit
 from java.awt import Dimension
 from java.awt import GridBagLayout
 from java.awt import GridBagConstraints
+from java.awt import RenderingHints
+from java.awt.image import BufferedImage
+from java.io import ByteArrayOutputStream
+from java.io import IOException
+from javax.imageio import ImageIO
 from java.awt.Dialog import ModalityType
 from javax.swing import JPanel
 from javax.swing import JDialog
@@ -22,6 +29,8 @@ from javax.swing.text import NumberFormatter
 from org.sleuthkit.datamodel import BlackboardArtifact
 from org.sleuthkit.datamodel import BlackboardAttribute
 from org.sleuthkit.datamodel import TskData
+from org.sleuthkit.datamodel import TskCoreException
+from org.sleuthkit.datamodel import ReadContentInputStream
 from org.sleuthkit.autopsy.ingest import IngestModule
 from org.sleuthkit.autopsy.ingest import FileIngestModule
 from org.sleuthkit.autopsy.ingest import IngestModuleFactoryAdapter
@@ -30,24 +39,91 @@ from org.sleuthkit.autopsy.ingest import IngestServices
 from org.sleuthkit.autopsy.ingest import ModuleDataEvent
 from org.sleuthkit.autopsy.ingest import IngestModuleIngestJobSettings
 from org.sleuthkit.autopsy.ingest import IngestModuleIngestJobSettingsPanel
+from org.sleuthkit.autopsy.ingest import IngestModuleReferenceCounter
 from org.sleuthkit.autopsy.ingest.IngestModule import IngestModuleException
 from org.sleuthkit.autopsy.coreutils import Logger
 from org.sleuthkit.autopsy.casemodule import Case
 from org.sleuthkit.autopsy.casemodule.services import Blackboard
 
-import inspect
+import jarray
+import hashlib
 import socket
 import json
-import struct
 import io
+import threading
 import os, sys, subprocess
 
+from image_classification import ConnectionPool
+from image_classification import BinaryResults
+from image_classification import Compressor
+from image_classification import LoadBalancer
+from image_classification import BatchBuffer
+from image_classification import AsyncClassifier
+from image_classification import connection_error
+from image_classification import ImageReadError
+from image_classification import ResultCache
+from image_classification import md5_of_image
+from image_classification import SharedDetectionStore
+from image_classification import KnownFiles
+from image_classification import model_key
+from image_classification import Prefilter
+from image_classification import prefilter
+from image_classification import ResultFilter
+from image_classification import IngestMetrics
+from image_classification import RateLimiter
+from image_classification import IngestJournal
+from image_classification import journal
+from image_classification import MemoryImage
+from image_classification import restore_detections
+from image_classification import Prioritizer
+from image_classification import priority
+from image_classification import NearDuplicateIndex
+from image_classification import difference_hash
+from image_classification import fetch_capabilities
+from image_classification import merge_classes_of_interest
+from image_classification import similarity
+
 CONFIG_FILE_NAME = 'config.json'
+CACHE_FILE_NAME = 'detections_cache.db'
 DEFAULT_MIN_FILE_SIZE = 5
 DEFAULT_MIN_PROBABILITY = 50
+DEFAULT_MIN_IMAGE_SIDE = 32
+DEFAULT_DOWNSCALE_MAX_SIDE = 0
 DEFAULT_IMAGES_FORMAT = "jpg;png;jpeg"
 DEFAULT_PORT = 1337
 DEFAULT_HOST = "127.0.0.1"
+DEFAULT_POOL_SIZE = 4
+DEFAULT_PROBE_INTERVAL = 5.0
+DEFAULT_CONNECT_TIMEOUT = 5.0
+DEFAULT_READ_TIMEOUT = 120.0
+DEFAULT_MAX_RETRIES = 2
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RESET_TIMEOUT = 30.0
+DEFAULT_BINARY_RESULTS = False
+DEFAULT_COMPRESSION = False
+DEFAULT_ADAPTIVE_CONCURRENCY = True
+DEFAULT_SERVER_FILTERING = True
+DEFAULT_BATCH_SIZE = 1
+DEFAULT_BATCH_MAX_AGE = 2.0
+DEFAULT_ASYNC_WORKERS = 0
+DEFAULT_REQUESTS_IN_FLIGHT = 2
+DEFAULT_CACHE_ENABLED = True
+DEFAULT_CACHE_MAX_ENTRIES = 1000000
+DEFAULT_JOURNAL_ENABLED = True
+READ_BUFFER_SIZE = 1024 * 1024
+DEFAULT_SEND_BUFFER_SIZE = 256 * 1024
+DEFAULT_METRICS_INTERVAL = 60
+DEFAULT_IMAGE_LOGS_PER_SECOND = 10
+DEFAULT_ARTIFACT_FLUSH_SIZE = 50
+ARTIFACT_FLUSH_MAX_AGE = 5.0
+DEFAULT_PRIORITY_SCHEDULING = True
+DEFAULT_MAX_PENDING_IMAGES = 1000
+DEFAULT_NEAR_DUPLICATES = False
+DEFAULT_NEAR_DUPLICATE_MAX_DISTANCE = 4
+DEFAULT_MODEL_VERSION = ""
+DEFAULT_SHARED_STORE_PATH = ""
+DEFAULT_KNOWN_FILES_PATH = ""
+DEFAULT_SKIP_KNOWN_FILES = False
 DEFAULT_CLASSES_OF_INTEREST = '[{"name":"person","enabled":true},{"name":"bicycle","enabled":true},{"name":"car","enabled":true},{"name":"motorbike","enabled":true},{"name":"aeroplane","enabled":true},{"name":"bus","enabled":true},{"name":"train","enabled":true},{"name":"truck","enabled":true},{"name":"boat","enabled":true},{"name":"traffic light","enabled":true},{"name":"fire hydrant","enabled":true},{"name":"stop sign","enabled":true},{"name":"parking meter","enabled":true},{"name":"bench","enabled":true},{"name":"bird","enabled":true},{"name":"cat","enabled":true},{"name":"dog","enabled":true},{"name":"horse","enabled":true},{"name":"sheep","enabled":true},{"name":"cow","enabled":true},{"name":"elephant","enabled":true},{"name":"bear","enabled":true},{"name":"zebra","enabled":true},{"name":"giraffe","enabled":true},{"name":"backpack","enabled":true},{"name":"umbrella","enabled":true},{"name":"handbag","enabled":true},{"name":"tie","enabled":true},{"name":"suitcase","enabled":true},{"name":"frisbee","enabled":true},{"name":"skis","enabled":true},{"name":"snowboard","enabled":true},{"name":"sports ball","enabled":true},{"name":"kite","enabled":true},{"name":"baseball bat","enabled":true},{"name":"baseball glove","enabled":true},{"name":"skateboard","enabled":true},{"name":"surfboard","enabled":true},{"name":"tennis racket","enabled":true},{"name":"bottle","enabled":true},{"name":"wine glass","enabled":true},{"name":"cup","enabled":true},{"name":"fork","enabled":true},{"name":"knife","enabled":true},{"name":"spoon","enabled":true},{"name":"bowl","enabled":true},{"name":"banana","enabled":true},{"name":"apple","enabled":true},{"name":"sandwich","enabled":true},{"name":"orange","enabled":true},{"name":"broccoli","enabled":true},{"name":"carrot","enabled":true},{"name":"hot dog","enabled":true},{"name":"pizza","enabled":true},{"name":"donut","enabled":true},{"name":"cake","enabled":true},{"name":"chair","enabled":true},{"name":"sofa","enabled":true},{"name":"pottedplant","enabled":true},{"name":"bed","enabled":true},{"name":"diningtable","enabled":true},{"name":"toilet","enabled":true},{"name":"tvmonitor","enabled":true},{"name":"laptop","enabled":true},{"name":"mouse","enabled":true},{"name":"remote","enabled":true},{"name":"keyboard","enabled":true},{"name":"cell phone","enabled":true},{"name":"microwave","enabled":true},{"name":"oven","enabled":true},{"name":"toaster","enabled":true},{"name":"sink","enabled":true},{"name":"refrigerator","enabled":true},{"name":"book","enabled":true},{"name":"clock","enabled":true},{"name":"vase","enabled":true},{"name":"scissors","enabled":true},{"name":"teddy bear","enabled":true},{"name":"hair drier","enabled":true},{"name":"toothbrush","enabled":true}]'
 
 
@@ -91,16 +167,420 @@ class AutopsyImageClassificationModuleFactory(IngestModuleFactoryAdapter):
         return AutopsyImageClassificationModuleWithUISettingsPanel(self.settings)
 
 
+# Resources shared by all the file ingest module instances (one per ingest
+# thread) of the same ingest job
+class IngestJobResources(object):
+    _logger = Logger.getLogger(AutopsyImageClassificationModuleFactory.moduleName)
+    _lock = threading.Lock()
+    _reference_counter = IngestModuleReferenceCounter()
+    _jobs = {}
+
+    # The message is only formatted with the arguments when the level is logged
+    def log(self, level, msg, *args):
+        if self._logger.isLoggable(level):
+            self._logger.logp(level, self.__class__.__name__, sys._getframe(1).f_code.co_name,
+                              msg % args if args else msg)
+
+    def __init__(self, job_id, data_source_id, settings):
+        self.job_id = job_id
+        self.metrics = IngestMetrics()
+        self.metrics_interval = settings.getMetricsInterval()
+        self.image_log_limiter = RateLimiter(settings.getImageLogsPerSecond())
+        # The artifacts of several files are indexed and announced to the UI together
+        self.blackboard = Case.getCurrentCase().getServices().getBlackboard()
+        self.artifact_buffer = BatchBuffer(self.write_artifacts, settings.getArtifactFlushSize(),
+                                           ARTIFACT_FLUSH_MAX_AGE)
+        # Lookup structures built once per job, as they are used for every file
+        self.prefilter = Prefilter(settings.getImageFormats(), settings.getMinFileSize() * 1024,
+                                   settings.getMinImageSide())
+        self.result_filter = ResultFilter(settings.getMinProbability(), settings.getClassesOfInterest())
+        # What the server runs and supports, asked once for the whole job.
+        # Servers from before the handshake are taken to run the configured
+        # model version, and to detect the classes of interest in their order.
+        self.capabilities = self.get_server_capabilities(settings)
+        self.model_version = settings.getModelVersion()
+        self.class_names = [class_of_interest['name'] for class_of_interest in settings.getClassesOfInterest()]
+        if self.capabilities is not None:
+            self.model_version = self.capabilities.model
+            self.class_names = self.capabilities.class_names
+            unknown_classes = self.capabilities.unknown_classes(self.result_filter.enabled_classes)
+            if unknown_classes:
+                self.log(Level.WARNING, "Classes of interest not detected by the model: %s",
+                         ", ".join(sorted(unknown_classes)))
+        # Cached responses are only valid for the model, and class list, they come from
+        self.cache = None
+        if settings.isCacheEnabled():
+            cache_location = os.path.join(os.path.dirname(os.path.abspath(__file__)), CACHE_FILE_NAME)
+            self.cache = ResultCache(cache_location, settings.getCacheMaxEntries(),
+                                     model_key(self.model_version, self.class_names))
+        self.shared_store = None
+        if settings.getSharedStorePath():
+            self.shared_store = SharedDetectionStore(settings.getSharedStorePath(), self.model_version,
+                                                     self.class_names)
+        # The server drops the detections the result filter would, so they are
+        # never sent nor parsed; the result filter still runs on what is left.
+        # The cache and the shared store serve other filters, of other jobs and
+        # cases, so they keep all the detections and the filter is not sent.
+        self.server_filter = None
+        if settings.isServerFiltering() and self.capabilities is not None and \
+                self.capabilities.supports_filtering():
+            if self.cache is None and self.shared_store is None:
+                self.server_filter = self.result_filter.server_filter(self.class_names)
+            else:
+                self.log(Level.INFO, "Stored detections are kept unfiltered, the server does not filter them")
+        self.known_files = None
+        if settings.getKnownFilesPath():
+            self.known_files = KnownFiles(settings.getKnownFilesPath())
+            self.log(Level.INFO, "%d known files hashes read from %s", len(self.known_files),
+                     settings.getKnownFilesPath())
+        # Detections of the images classified by this job, by perceptual hash
+        self.near_duplicates = None
+        if settings.isNearDuplicates():
+            self.near_duplicates = NearDuplicateIndex(settings.getNearDuplicateMaxDistance())
+        self.journal = None
+        if settings.isJournalEnabled():
+            self.journal = IngestJournal(os.path.join(self.get_report_directory(),
+                                                      "journal-" + str(data_source_id) + ".txt"),
+                                         self.get_journal_fingerprint(settings))
+
+        # Every asynchronous worker holds one connection
+        pool_size = max(settings.getServerPoolSize(), settings.getAsyncWorkers())
+        endpoints = settings.getAllServerEndpoints()
+        # The class ids of the binary results are the positions in the class list
+        binary_results = None
+        if settings.isBinaryResults():
+            if self.capabilities is None or self.capabilities.supports_binary_results():
+                binary_results = BinaryResults(self.class_names)
+            else:
+                self.log(Level.INFO, "The server does not send binary results, JSON results are used")
+        # Shared by all the connections, so what is learned about each file type is too
+        compressor = None
+        if settings.isCompression():
+            if self.capabilities is None or self.capabilities.supports_compression():
+                compressor = Compressor(metrics=self.metrics)
+            else:
+                self.log(Level.INFO, "The server does not support compression, images are sent as they are")
+        batch_size = settings.getBatchSize()
+        if self.capabilities is not None:
+            batch_size = self.capabilities.batch_size(batch_size)
+        # Up to every connection with all its requests in flight
+        max_concurrency = 0
+        if settings.isAdaptiveConcurrency():
+            max_concurrency = pool_size
+            if settings.getAsyncWorkers() > 0:
+                max_concurrency *= settings.getRequestsInFlight()
+        if len(endpoints) > 1:
+            self.pool = LoadBalancer(endpoints, pool_size, settings.getServerReadTimeout(),
+                                     settings.getSendBufferSize(), self.metrics,
+                                     probe_interval=settings.getServerProbeInterval(),
+                                     connect_timeout=settings.getServerConnectTimeout(),
+                                     max_retries=settings.getServerMaxRetries(),
+                                     failure_threshold=settings.getServerFailureThreshold(),
+                                     reset_timeout=settings.getServerResetTimeout(),
+                                     binary_results=binary_results, compressor=compressor,
+                                     max_concurrency=max_concurrency, server_filter=self.server_filter)
+        else:
+            self.pool = ConnectionPool(settings.getServerHost(), settings.getServerPort(), pool_size,
+                                       settings.getServerReadTimeout(), settings.getSendBufferSize(), self.metrics,
+                                       connect_timeout=settings.getServerConnectTimeout(),
+                                       max_retries=settings.getServerMaxRetries(),
+                                       failure_threshold=settings.getServerFailureThreshold(),
+                                       reset_timeout=settings.getServerResetTimeout(),
+                                       binary_results=binary_results, compressor=compressor,
+                                       max_concurrency=max_concurrency, server_filter=self.server_filter)
+        self.batch_buffer = None
+        self.async_classifier = None
+        # Images can only be reordered while they wait for the asynchronous
+        # workers, so the more of them wait the earlier the ones that matter
+        # are classified
+        self.prioritizer = None
+        if settings.getAsyncWorkers() > 0:
+            max_pending_images = None
+            if settings.isPriorityScheduling():
+                self.prioritizer = Prioritizer(settings.getHighValuePaths(), settings.getLowValuePaths())
+                max_pending_images = settings.getMaxPendingImages()
+            self.async_classifier = AsyncClassifier(self.pool, settings.getAsyncWorkers(),
+                                                    settings.getRequestsInFlight(), batch_size, max_pending_images)
+        elif batch_size > 1:
+            self.batch_buffer = BatchBuffer(self.classify_batch, batch_size, settings.getBatchMaxAge())
+
+    # If the resources can not be created the module does not hold them, and
+    # the next module of the job tries again
+    @classmethod
+    def acquire(cls, context, settings):
+        job_id = context.getJobId()
+        with cls._lock:
+            if cls._reference_counter.incrementAndGet(job_id) == 1:
+                try:
+                    cls._jobs[job_id] = IngestJobResources(job_id, context.getDataSource().getId(), settings)
+                except:
+                    cls._reference_counter.decrementAndGet(job_id)
+                    raise
+            return cls._jobs[job_id]
+
+    @classmethod
+    def release(cls, job_id):
+        with cls._lock:
+            if cls._reference_counter.decrementAndGet(job_id) > 0:
+                return
+            resources = cls._jobs.pop(job_id)
+        resources.close()
+
+    # Sends a batch of (module, file, image, file_hash, perceptual_hash) items to
+    # the server and hands each result back to the module that queued the file
+    def classify_batch(self, items):
+        images = [image for module, file, image, file_hash, perceptual_hash in items]
+        try:
+            results = self.pool.get_batch_detections(images)
+        except (socket.error, IOError, ValueError, ImageReadError) as e:
+            results = [connection_error(e)] * len(items)
+
+        # One file that can not be handled does not cost the others of the batch their artifacts
+        for (module, file, image, file_hash, perceptual_hash), detections in zip(items, results):
+            try:
+                module.handle_detections(file, image, file_hash, perceptual_hash, detections)
+            except Exception as e:
+                self.log(Level.SEVERE, "Error handling the result of %s: %s", image.name, e)
+
+    # The content hash is needed to look the image up, or to store its detections
+    def needs_content_hash(self):
+        return self.cache is not None or self.shared_store is not None or self.known_files is not None
+
+    # Returns the detections already known for the image, from the local cache
+    # or else from the shared store, or None
+    def get_stored_detections(self, file_hash):
+        if self.cache is not None:
+            with self.metrics.timer('cache'):
+                detections = self.cache.get(file_hash)
+            if detections is not None:
+                self.metrics.increment('cacheHits')
+                return detections
+        if self.shared_store is not None:
+            with self.metrics.timer('sharedStore'):
+                detections = self.shared_store.get(file_hash)
+            if detections is not None:
+                self.metrics.increment('sharedStoreHits')
+                if self.cache is not None:
+                    self.cache.put(file_hash, detections)
+                return detections
+        return None
+
+    # Errors are not stored, so the image is classified again next time
+    def store_detections(self, file_hash, detections):
+        if self.cache is not None:
+            self.cache.put(file_hash, detections)
+        if self.shared_store is not None:
+            try:
+                self.shared_store.put(file_hash, detections)
+            except (IOError, OSError) as e:
+                self.metrics.increment('sharedStoreErrors')
+                self.log(Level.WARNING, "Error writing to the shared detection store: %s", e)
+
+    # Capabilities of the first server that answers the handshake, or None if
+    # none does. The other servers are expected to run the same model.
+    def get_server_capabilities(self, settings):
+        capabilities = None
+        for host, port, weight in settings.getAllServerEndpoints():
+            try:
+                server_capabilities = fetch_capabilities(host, port, settings.getServerConnectTimeout())
+            except (socket.error, ValueError) as e:
+                self.log(Level.WARNING, "Capabilities of server %s:%s not received: %s", host, port, e)
+                continue
+            if server_capabilities is None:
+                self.log(Level.INFO, "Server %s:%s does not tell its capabilities", host, port)
+            elif capabilities is None:
+                capabilities = server_capabilities
+                self.log(Level.INFO, "Capabilities of server %s:%s: %s", host, port,
+                         json.dumps(capabilities.to_dict()))
+            elif (server_capabilities.model, server_capabilities.class_names) != \
+                    (capabilities.model, capabilities.class_names):
+                self.log(Level.WARNING, "Server %s:%s runs %s instead of %s, its results may differ", host, port,
+                         server_capabilities.model, capabilities.model)
+        return capabilities
+
+    # Files already processed with the same settings are found in the journal
+    # when the ingest of a data source is run again
+    def get_journal_fingerprint(self, settings):
+        results_settings = [sorted(self.prefilter.extensions), settings.getMinFileSize(),
+                            settings.getMinImageSide(), settings.getMinProbability(),
+                            sorted(self.result_filter.enabled_classes), self.model_version]
+        return hashlib.md5(json.dumps(results_settings).encode('utf-8')).hexdigest()
+
+    def is_file_done(self, file):
+        return self.journal is not None and self.journal.is_done(file.getId())
+
+    def record_outcome(self, file, outcome):
+        if self.journal is not None:
+            self.journal.record(file.getId(), outcome)
+
+    # Queues the artifacts created for one file
+    def add_artifacts(self, artifacts):
+        if artifacts:
+            self.artifact_buffer.add(artifacts)
+
+    # Indexes the artifacts of a group of files for keyword search and fires a
+    # single event for all of them, so the UI refreshes once per group
+    def write_artifacts(self, artifact_groups):
+        artifacts = [artifact for artifacts in artifact_groups for artifact in artifacts]
+        with self.metrics.timer('artifactFlush'):
+            for artifact in artifacts:
+                try:
+                    self.blackboard.indexArtifact(artifact)
+                except Blackboard.BlackboardException as e:
+                    self.log(Level.SEVERE, "Error indexing artifact %s", artifact.getDisplayName())
+
+            IngestServices.getInstance().fireModuleDataEvent(
+                ModuleDataEvent(AutopsyImageClassificationModuleFactory.moduleName,
+                                BlackboardArtifact.ARTIFACT_TYPE.TSK_INTERESTING_FILE_HIT,
+                                ArrayList(artifacts)))
+        self.metrics.increment('artifactFlushes')
+
+    # The artifacts are flushed, and the journal, the pool and the cache
+    # closed, even when handling the last images fails
+    def close(self):
+        try:
+            if self.batch_buffer is not None:
+                self.batch_buffer.flush()
+            if self.async_classifier is not None:
+                self.async_classifier.close()
+        finally:
+            try:
+                self.artifact_buffer.flush()
+            finally:
+                if self.journal is not None:
+                    self.journal.close()
+                if isinstance(self.pool, LoadBalancer):
+                    self.log(Level.INFO, "Classification servers: %s", json.dumps(self.pool.state()))
+                self.pool.close()
+                if self.cache is not None:
+                    self.log(Level.INFO, "Detections cache hits: %d, misses: %d", self.cache.hits,
+                             self.cache.misses)
+                    self.cache.close()
+                if self.shared_store is not None:
+                    self.log(Level.INFO, "Shared detection store hits: %d, misses: %d", self.shared_store.hits,
+                             self.shared_store.misses)
+                self.report_metrics()
+
+    # Logs a snapshot of the metrics once every metrics interval
+    def log_metrics_snapshot(self):
+        if self.metrics.is_snapshot_due(self.metrics_interval):
+            self.log(Level.INFO, "Metrics of ingest job %s: %s", self.job_id, json.dumps(self.metrics.snapshot()))
+
+    # Directory of the module in the case, where its reports and journals are kept
+    def get_report_directory(self):
+        report_directory = os.path.join(Case.getCurrentCase().getModuleDirectory(),
+                                        AutopsyImageClassificationModuleFactory.moduleName)
+        if not os.path.isdir(report_directory):
+            os.makedirs(report_directory)
+        return report_directory
+
+    # Writes the metrics of the job in the case module directory and posts a summary to the inbox
+    def report_metrics(self):
+        snapshot = self.metrics.snapshot()
+        report_location = os.path.join(self.get_report_directory(), "metrics-job-" + str(self.job_id) + ".json")
+        with open(report_location, 'w') as f:
+            f.write(json.dumps(snapshot, indent=2, sort_keys=True))
+
+        counters = snapshot['counters']
+        summary = "Classified " + str(counters.get('imagesClassified', 0)) + " images (" + \
+                  str(snapshot['imagesPerSecond']) + " images/s), " + \
+                  str(counters.get('cacheHits', 0)) + " from cache, " + \
+                  str(sum(snapshot['skipped'].values())) + " files skipped, " + \
+                  str(counters.get('errors', 0)) + " errors"
+        if snapshot['compressionRatio'] is not None:
+            summary += ", compression ratio " + str(snapshot['compressionRatio'])
+        message = IngestMessage.createMessage(IngestMessage.MessageType.INFO,
+                                              AutopsyImageClassificationModuleFactory.moduleName, summary,
+                                              "Metrics written to " + report_location)
+        IngestServices.getInstance().postMessage(message)
+        self.log(Level.INFO, "%s, metrics written to %s", summary, report_location)
+
+
+# Image read straight from the case data source, so files inside disk images
+# do not need to be extracted to the local disk first
+class AbstractFileImage(object):
+
+    def __init__(self, file):
+        self.file = file
+        self.name = file.getParentPath() + file.getName()
+        self.extension = "." + file.getNameExtension()
+        self.size = file.getSize()
+
+    def open(self):
+        return AbstractFileReader(self.file)
+
+    def read_header(self, size):
+        buffer = jarray.zeros(min(size, self.size), 'b')
+        try:
+            nr_of_bytes_read = self.file.read(buffer, 0, len(buffer))
+        except TskCoreException as e:
+            raise IOError("Error reading " + self.file.getName() + ": " + e.getMessage())
+        return buffer[:max(nr_of_bytes_read, 0)].tostring()
+
+
+# File like reader of an AbstractFile.
+# The content is read in large blocks, whatever the size asked by the caller.
+class AbstractFileReader(object):
+
+    def __init__(self, file):
+        self.file = file
+        self.offset = 0
+        self.buffer = jarray.zeros(READ_BUFFER_SIZE, 'b')
+        self.data = b''
+        self.position = 0
+
+    def read(self, size):
+        chunks = []
+        while size > 0:
+            if self.position == len(self.data) and not self.fill():
+                break
+            chunk = self.data[self.position:self.position + size]
+            self.position += len(chunk)
+            size -= len(chunk)
+            chunks.append(chunk)
+        return b''.join(chunks)
+
+    def fill(self):
+        try:
+            nr_of_bytes_read = self.file.read(self.buffer, self.offset, len(self.buffer))
+        except TskCoreException as e:
+            raise IOError("Error reading " + self.file.getName() + ": " + e.getMessage())
+        if nr_of_bytes_read <= 0:
+            return False
+        self.offset += nr_of_bytes_read
+        self.data = self.buffer[:nr_of_bytes_read].tostring()
+        self.position = 0
+        return True
+
+    def close(self):
+        self.data = b''
+
+
 class AutopsyImageClassificationModule(FileIngestModule):
     _logger = Logger.getLogger(AutopsyImageClassificationModuleFactory.moduleName)
-    MAX_CHUNK_SIZE = 1024
 
-    def log(self, level, msg):
-        self._logger.logp(level, self.__class__.__name__, inspect.stack()[1][3], msg)
+    # The message is only formatted with the arguments when the level is logged
+    def log(self, level, msg, *args):
+        if self._logger.isLoggable(level):
+            self._logger.logp(level, self.__class__.__name__, sys._getframe(1).f_code.co_name,
+                              msg % args if args else msg)
+
+    # Messages logged for every image are rate limited, as there can be millions of them
+    def log_image(self, level, msg, *args):
+        if not self._logger.isLoggable(level) or not self.job_resources.image_log_limiter.allow():
+            return
+        suppressed = self.job_resources.image_log_limiter.take_suppressed()
+        if suppressed:
+            msg += " (%d similar messages suppressed)"
+            args += (suppressed,)
+        self._logger.logp(level, self.__class__.__name__, sys._getframe(1).f_code.co_name, msg % args)
 
     def __init__(self, settings):
         self.context = None
         self.local_settings = settings
+        self.job_resources = None
+        self.metrics = None
+        self.released = False
 
     # Where any setup and configuration is done
     # 'context' is an instance of org.sleuthkit.autopsy.ingest.IngestJobContext.
@@ -109,141 +589,280 @@ class AutopsyImageClassificationModule(FileIngestModule):
         self.context = context
         if not self.local_settings.isServerOnline():
             raise IngestModuleException(IngestModule(), "Server is down!")
-            pass
-        pass
+        self.job_resources = IngestJobResources.acquire(context, self.local_settings)
+        self.metrics = self.job_resources.metrics
 
     # Where the analysis is done.  Each file will be passed into here.
     # The 'file' object being passed in is of type org.sleuthkit.datamodel.AbstractFile.
     # See: http://www.sleuthkit.org/sleuthkit/docs/jni-docs/classorg_1_1sleuthkit_1_1datamodel_1_1_abstract_file.html
     def process(self, file):
+        self.metrics.increment('files')
+        self.job_resources.log_metrics_snapshot()
+
         # Skip non-files
         if is_non_file(file):
+            self.metrics.skipped('not a file')
             return IngestModule.ProcessResult.OK
 
-        file_name = file.getName().lower()
-        if not self.is_image(file_name):
+        # Neither named as an image nor identified as one, which needs no read.
+        # Not journaled either, as the check costs less than the journal entry.
+        mime_type = file.getMIMEType()
+        if not self.job_resources.prefilter.is_candidate(file.getName(), mime_type):
+            self.metrics.skipped(prefilter.SKIP_NOT_AN_IMAGE)
             return IngestModule.ProcessResult.OK
 
-        self.log(Level.INFO, 'Processing ' + file.getLocalAbsPath())
+        # Classified, or skipped, by a previous ingest that did not finish.
+        # Files that had errors are processed again.
+        if self.job_resources.is_file_done(file):
+            self.metrics.skipped('already processed')
+            return IngestModule.ProcessResult.OK
 
-        detections = self.get_detections(file.getLocalAbsPath())
+        # Found in a known files hash set, e.g. the NSRL, by the hash lookup module if it ran before this one
+        if self.local_settings.isSkipKnownFiles() and file.getKnown() == TskData.FileKnown.KNOWN:
+            self.metrics.skipped('known file')
+            self.job_resources.record_outcome(file, journal.SKIPPED)
+            return IngestModule.ProcessResult.OK
 
-        # Use blackboard class to index blackboard artifacts for keyword search
-        blackboard = Case.getCurrentCase().getServices().getBlackboard()
+        image = AbstractFileImage(file)
+        try:
+            # Uses the type found by the file type identification module, if it already ran
+            with self.metrics.timer('prefilter'):
+                skip_reason = self.job_resources.prefilter.check(image, mime_type)
+            if skip_reason is not None:
+                self.metrics.skipped(skip_reason)
+                self.job_resources.record_outcome(file, journal.SKIPPED)
+                self.log_image(Level.FINE, 'Skipping %s: %s', image.name, skip_reason)
+                return IngestModule.ProcessResult.OK
+
+            self.log_image(Level.INFO, 'Processing %s', image.name)
+
+            # Byte identical images are only classified once, across cases with a shared store
+            file_hash = None
+            if self.job_resources.needs_content_hash():
+                with self.metrics.timer('hash'):
+                    file_hash = self.get_content_hash(file, image)
+                if self.job_resources.known_files is not None and file_hash in self.job_resources.known_files:
+                    self.metrics.skipped('known file')
+                    self.job_resources.record_outcome(file, journal.SKIPPED)
+                    self.log_image(Level.FINE, 'Skipping %s: known file', image.name)
+                    return IngestModule.ProcessResult.OK
+                detections = self.job_resources.get_stored_detections(file_hash)
+                if detections is not None:
+                    self.log_image(Level.INFO, 'Using the stored detections of %s', image.name)
+                    self.post_detections(file, detections)
+                    self.job_resources.record_outcome(file, journal.CLASSIFIED)
+                    return IngestModule.ProcessResult.OK
+
+            # Resized and recompressed copies of an image classified by this job reuse its detections
+            perceptual_hash = None
+            if self.job_resources.near_duplicates is not None:
+                with self.metrics.timer('perceptualHash'):
+                    perceptual_hash = self.get_perceptual_hash(file, image)
+                if perceptual_hash is not None:
+                    near_duplicate = self.job_resources.near_duplicates.find(*perceptual_hash)
+                    if near_duplicate is not None:
+                        original_name, distance, detections = near_duplicate
+                        self.metrics.increment('nearDuplicates')
+                        self.log_image(Level.INFO, 'Using the detections of %s for its near duplicate %s',
+                                       original_name, image.name)
+                        self.post_detections(file, detections, "Near duplicate of %s (%d of 64 bits differ)" %
+                                             (original_name, distance))
+                        self.job_resources.record_outcome(file, journal.CLASSIFIED)
+                        return IngestModule.ProcessResult.OK
+
+            # Before the image is downscaled, which drops its EXIF data
+            image_priority = 0
+            if self.job_resources.prioritizer is not None:
+                with self.metrics.timer('priority'):
+                    image_priority = self.job_resources.prioritizer.priority(image, image.name)
+
+            if self.local_settings.getDownscaleMaxSide() > 0:
+                with self.metrics.timer('downscale'):
+                    image = self.downscale(file, image, self.local_settings.getDownscaleMaxSide())
+        except IOError as e:
+            self.metrics.increment('readErrors')
+            self.job_resources.record_outcome(file, journal.ERROR)
+            self.log(Level.SEVERE, 'Error reading %s: %s', image.name, e)
+            return IngestModule.ProcessResult.ERROR
+
+        # The file is classified, and its artifacts created, by a worker thread
+        if self.job_resources.async_classifier is not None:
+            self.job_resources.async_classifier.submit(
+                image,
+                lambda detections: self.handle_detections(file, image, file_hash, perceptual_hash, detections),
+                image_priority)
+            return IngestModule.ProcessResult.OK
 
+        # The file is classified, and its artifacts created, when the batch is flushed
+        if self.job_resources.batch_buffer is not None:
+            self.job_resources.batch_buffer.add((self, file, image, file_hash, perceptual_hash))
+            return IngestModule.ProcessResult.OK
+
+        with self.metrics.timer('request'):
+            detections = self.get_detections(image)
+        self.handle_detections(file, image, file_hash, perceptual_hash, detections)
+
+        self.log_image(Level.INFO, 'Finish...')
+        return IngestModule.ProcessResult.OK
+
+    # Reuses Autopsy's MD5 when the hash lookup module already calculated it
+    def get_content_hash(self, file, image):
+        md5 = file.getMd5Hash()
+        if md5:
+            return md5.lower()
+        return md5_of_image(image)
+
+    # The server resizes its input anyway, so big images are resized here to
+    # send fewer bytes. The image is decoded with subsampling, which avoids
+    # holding the full resolution image in memory.
+    # Returns the original image when it is small enough or can not be decoded.
+    def downscale(self, file, image, max_side):
+        image_stream = ImageIO.createImageInputStream(ReadContentInputStream(file))
+        if image_stream is None:
+            return image
+        try:
+            readers = ImageIO.getImageReaders(image_stream)
+            if not readers.hasNext():
+                return image
+            reader = readers.next()
+            try:
+                reader.setInput(image_stream, True, True)
+                width = reader.getWidth(0)
+                height = reader.getHeight(0)
+                if max(width, height) <= max_side:
+                    return image
+                read_param = reader.getDefaultReadParam()
+                subsampling = max(1, max(width, height) // max_side)
+                read_param.setSourceSubsampling(subsampling, subsampling, 0, 0)
+                decoded_image = reader.read(0, read_param)
+            finally:
+                reader.dispose()
+        # The readers also throw unchecked exceptions on corrupt images
+        except (IOException, RuntimeException) as e:
+            self.log(Level.WARNING, 'Sending the original image, error decoding %s: %s', image.name, e.getMessage())
+            return image
+        finally:
+            image_stream.close()
+
+        scale = float(max_side) / max(width, height)
+        scaled_width = max(1, int(round(width * scale)))
+        scaled_height = max(1, int(round(height * scale)))
+        scaled_image = BufferedImage(scaled_width, scaled_height, BufferedImage.TYPE_INT_RGB)
+        graphics = scaled_image.createGraphics()
+        graphics.setRenderingHint(RenderingHints.KEY_INTERPOLATION, RenderingHints.VALUE_INTERPOLATION_BILINEAR)
+        graphics.drawImage(decoded_image, 0, 0, scaled_width, scaled_height, None)
+        graphics.dispose()
+
+        encoded_image = ByteArrayOutputStream()
+        ImageIO.write(scaled_image, "jpg", encoded_image)
+        return MemoryImage(image.name, ".jpg", encoded_image.toByteArray().tostring(),
+                           float(scaled_width) / width)
+
+    # Returns the (perceptual hash, width, height) of the image, or None if it
+    # can not be decoded. Only a subsampled version of the image is decoded,
+    # and drawn on a small grayscale thumbnail.
+    def get_perceptual_hash(self, file, image):
+        side = similarity.THUMBNAIL_SIDE
+        image_stream = ImageIO.createImageInputStream(ReadContentInputStream(file))
+        if image_stream is None:
+            return None
+        try:
+            readers = ImageIO.getImageReaders(image_stream)
+            if not readers.hasNext():
+                return None
+            reader = readers.next()
+            try:
+                reader.setInput(image_stream, True, True)
+                width = reader.getWidth(0)
+                height = reader.getHeight(0)
+                read_param = reader.getDefaultReadParam()
+                subsampling = max(1, min(width, height) // (2 * side))
+                read_param.setSourceSubsampling(subsampling, subsampling, 0, 0)
+                decoded_image = reader.read(0, read_param)
+            finally:
+                reader.dispose()
+        # The readers also throw unchecked exceptions on corrupt images
+        except (IOException, RuntimeException) as e:
+            self.log(Level.WARNING, 'Error decoding %s for its perceptual hash: %s', image.name, e.getMessage())
+            return None
+        finally:
+            image_stream.close()
+
+        thumbnail = BufferedImage(side, side, BufferedImage.TYPE_BYTE_GRAY)
+        graphics = thumbnail.createGraphics()
+        graphics.setRenderingHint(RenderingHints.KEY_INTERPOLATION, RenderingHints.VALUE_INTERPOLATION_BILINEAR)
+        graphics.drawImage(decoded_image, 0, 0, side, side, None)
+        graphics.dispose()
+        pixels = thumbnail.getRaster().getPixels(0, 0, side, side, jarray.zeros(side * side, 'i'))
+        return difference_hash(pixels, side, side), width, height
+
+    def handle_detections(self, file, image, file_hash, perceptual_hash, detections):
+        # The boxes of a resized image are mapped back to the original image
+        detections = restore_detections(detections, getattr(image, 'scale', 1.0))
+        if isinstance(detections, list):
+            self.metrics.increment('imagesClassified')
+            if file_hash is not None:
+                self.job_resources.store_detections(file_hash, detections)
+            if perceptual_hash is not None:
+                image_hash, width, height = perceptual_hash
+                self.job_resources.near_duplicates.add(image_hash, image.name, width, height, detections)
+        else:
+            self.metrics.increment('errors')
+        with self.metrics.timer('blackboard'):
+            self.post_detections(file, detections)
+        # Recorded once the artifacts of the file exist
+        self.job_resources.record_outcome(file, journal.CLASSIFIED if isinstance(detections, list) else journal.ERROR)
+
+    # 'comment' is added to the artifacts, e.g. to tell where reused detections come from
+    def post_detections(self, file, detections, comment=None):
+        artifacts = []
         if isinstance(detections, list):
             if len(detections) == 0:
-                self.create_an_artifact(blackboard, file, "No known objects found")
+                artifacts.append(self.create_an_artifact(file, "No known objects found", comment))
             else:
-                for detection in detections:
-                    # only report the detections with high probability
-                    if detection["probability"] >= self.local_settings.getMinProbability():
-                        for classes in self.local_settings.getClassesOfInterest():
-                            if detection['className'] == classes['name'] and classes['enabled']:
-                                self.create_an_artifact(blackboard, file, detection["className"].title())
-                                break
+                # only report the detections of enabled classes with high probability
+                for detection in self.job_resources.result_filter.filter(detections):
+                    artifacts.append(self.create_an_artifact(file, detection["className"].title(), comment))
 
         else:
-            self.log(Level.INFO,
-                     'Error classifying image ' + file.getLocalAbsPath() + ' with error code: ' + detections[
-                         'errorCode'] + 'and message: ' + detections['errorMessage'])
-            self.create_an_artifact(blackboard, file, "ERROR - Processed with errors")
+            self.log_image(Level.INFO, 'Error classifying image %s%s with error code: %s and message: %s',
+                           file.getParentPath(), file.getName(), detections['errorCode'], detections['errorMessage'])
+            if detections['errorCode'] == 'SERVER_UNAVAILABLE':
+                # Not sent to the server at all, the file has to be ingested again
+                artifacts.append(self.create_an_artifact(file, "ERROR - Not processed, server unavailable"))
+            else:
+                artifacts.append(self.create_an_artifact(file, "ERROR - Processed with errors"))
 
-        self.log(Level.INFO, 'Finish...')
-        # lock.release()
-        return IngestModule.ProcessResult.OK
+        # Indexed, and announced to the UI, when the job flushes its artifacts
+        self.job_resources.add_artifacts(artifacts)
 
-    def create_an_artifact(self, blackboard, file, title):
+    def create_an_artifact(self, file, title, comment=None):
 
         art = file.newArtifact(BlackboardArtifact.ARTIFACT_TYPE.TSK_INTERESTING_FILE_HIT)
         att = BlackboardAttribute(BlackboardAttribute.ATTRIBUTE_TYPE.TSK_SET_NAME.getTypeID(),
                                   AutopsyImageClassificationModuleFactory.moduleName,
                                   title)
         art.addAttribute(att)
+        if comment is not None:
+            art.addAttribute(BlackboardAttribute(BlackboardAttribute.ATTRIBUTE_TYPE.TSK_COMMENT.getTypeID(),
+                                                 AutopsyImageClassificationModuleFactory.moduleName, comment))
+        return art
+
+    def get_detections(self, image):
         try:
-            # index the artifact for keyword search
-            blackboard.indexArtifact(art)
-        except Blackboard.BlackboardException as e:
-            self.log(Level.SEVERE, "Error indexing artifact " + art.getDisplayName())
-
-        # Fire an event to notify the UI and others that there is a new artifact
-        IngestServices.getInstance().fireModuleDataEvent(
-            ModuleDataEvent(AutopsyImageClassificationModuleFactory.moduleName,
-                            BlackboardArtifact.ARTIFACT_TYPE.TSK_INTERESTING_FILE_HIT))
-
-    def get_detections(self, file_path):
-        # Connect the socket
-        new_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        new_socket.connect((self.local_settings.getServerHost(), int(self.local_settings.getServerPort())))
-
-        filename, file_extension = os.path.splitext(file_path)
-        new_socket.sendall(file_extension)
-        self.receive_an_int_message(new_socket)
-
-        # get file size
-        file_size = os.path.getsize(file_path)
-        new_socket.sendall(file_size)
-        self.receive_an_int_message(new_socket)
-
-        self.send_image_and_get_data(new_socket, file_path, file_size)
-        ack_status = self.receive_an_int_message(new_socket)
-
-        while ack_status == -1:
-            self.log(Level.INFO, "Re-send image: " + file_path)
-            self.send_image_and_get_data(new_socket, file_path, file_size)
-            ack_status = self.receive_an_int_message(new_socket)
-
-        return_value = None
-        new_socket.sendall(1)
-
-        nr_of_bytes_to_receive = self.receive_an_int_message(new_socket)
-        self.log(Level.INFO, "Received nr of bytes: " + str(nr_of_bytes_to_receive))
-
-        new_socket.sendall(1)
-        # If there are no detections we can return now
-        if nr_of_bytes_to_receive == 0:
-            return_value = IngestModule.ProcessResult.OK
-        elif nr_of_bytes_to_receive > 0:
-            response = new_socket.recv(nr_of_bytes_to_receive)
-            while len(response) < nr_of_bytes_to_receive:
-                data = new_socket.recv(nr_of_bytes_to_receive - len(response))
-                if not data:
-                    break
-                response += data
-            self.log(Level.INFO, "Received from image: " + file_path + "the response: " + response)
-            return_value = json.loads(response)
-        new_socket.close()
+            return_value = self.job_resources.pool.get_detections(image)
+        except (socket.error, IOError, ValueError, ImageReadError) as e:
+            return_value = connection_error(e)
+        self.log_image(Level.INFO, "Received from image: %s the response: %s", image.name, return_value)
         return return_value
 
     # Where any shutdown code is run and resources are freed.
-    # TODO: Add any shutdown code that you need here.
+    # The job resources are kept: the images of this module still in flight
+    # are handled by the workers of the job until its last module releases them.
     def shutDown(self):
-        None
-
-    def receive_an_int_message(self, my_socket):
-        bytes_received = my_socket.recv(4)
-        ack_response = struct.unpack("!i", bytes_received)[0]
-        return ack_response
-
-    def send_image_and_get_data(self, new_socket, file_path, file_size):
-        # send file
-        with open(file_path, 'rb') as f:
-            file_readed_left = file_size
-            file_chunk = self.MAX_CHUNK_SIZE
-            while file_readed_left > 0:
-                if file_readed_left < self.MAX_CHUNK_SIZE:
-                    file_chunk = file_readed_left
-                new_socket.sendall(f.read(file_chunk))
-                file_readed_left = file_readed_left - file_chunk
-
-    def is_image(self, file_name):
-
-        valid = False
-        for image_format in self.local_settings.getImageFormats():
-            if file_name.endswith("." + image_format):
-                valid = True
-
-        return valid
+        if self.job_resources is not None and not self.released:
+            self.released = True
+            IngestJobResources.release(self.context.getJobId())
 
 
 class AutopsyImageClassificationModuleWithUISettings(IngestModuleIngestJobSettings):
@@ -256,9 +875,44 @@ class AutopsyImageClassificationModuleWithUISettings(IngestModuleIngestJobSettin
 
         self.server_host = ""
         self.server_port = ""
+        self.server_pool_size = DEFAULT_POOL_SIZE
+        self.server_endpoints = []
+        self.server_probe_interval = DEFAULT_PROBE_INTERVAL
+        self.server_connect_timeout = DEFAULT_CONNECT_TIMEOUT
+        self.server_read_timeout = DEFAULT_READ_TIMEOUT
+        self.server_max_retries = DEFAULT_MAX_RETRIES
+        self.server_failure_threshold = DEFAULT_FAILURE_THRESHOLD
+        self.server_reset_timeout = DEFAULT_RESET_TIMEOUT
+        self.binary_results = DEFAULT_BINARY_RESULTS
+        self.compression = DEFAULT_COMPRESSION
+        self.adaptive_concurrency = DEFAULT_ADAPTIVE_CONCURRENCY
+        self.server_filtering = DEFAULT_SERVER_FILTERING
+        self.batch_size = DEFAULT_BATCH_SIZE
+        self.batch_max_age = DEFAULT_BATCH_MAX_AGE
+        self.async_workers = DEFAULT_ASYNC_WORKERS
+        self.requests_in_flight = DEFAULT_REQUESTS_IN_FLIGHT
+        self.cache_enabled = DEFAULT_CACHE_ENABLED
+        self.cache_max_entries = DEFAULT_CACHE_MAX_ENTRIES
+        self.journal_enabled = DEFAULT_JOURNAL_ENABLED
+        self.send_buffer_size = DEFAULT_SEND_BUFFER_SIZE
+        self.metrics_interval = DEFAULT_METRICS_INTERVAL
+        self.image_logs_per_second = DEFAULT_IMAGE_LOGS_PER_SECOND
+        self.artifact_flush_size = DEFAULT_ARTIFACT_FLUSH_SIZE
+        self.priority_scheduling = DEFAULT_PRIORITY_SCHEDULING
+        self.high_value_paths = priority.DEFAULT_HIGH_VALUE_PATHS
+        self.low_value_paths = priority.DEFAULT_LOW_VALUE_PATHS
+        self.max_pending_images = DEFAULT_MAX_PENDING_IMAGES
+        self.near_duplicates = DEFAULT_NEAR_DUPLICATES
+        self.near_duplicate_max_distance = DEFAULT_NEAR_DUPLICATE_MAX_DISTANCE
+        self.model_version = DEFAULT_MODEL_VERSION
+        self.shared_store_path = DEFAULT_SHARED_STORE_PATH
+        self.known_files_path = DEFAULT_KNOWN_FILES_PATH
+        self.skip_known_files = DEFAULT_SKIP_KNOWN_FILES
         self.image_formats = ""
         self.min_file_size = 0
         self.min_probability = 0
+        self.min_image_side = DEFAULT_MIN_IMAGE_SIDE
+        self.downscale_max_side = DEFAULT_DOWNSCALE_MAX_SIDE
         self.classes_of_interest = []
         self.server_online = False
 
@@ -268,6 +922,116 @@ class AutopsyImageClassificationModuleWithUISettings(IngestModuleIngestJobSettin
     def getServerPort(self):
         return self.server_port
 
+    def getServerPoolSize(self):
+        return self.server_pool_size
+
+    # Servers used together with the one of the host and port fields, as
+    # {"host": ..., "port": ..., "weight": ...} objects
+    def getServerEndpoints(self):
+        return self.server_endpoints
+
+    # (host, port, weight) of every server, starting with the one of the host and port fields
+    def getAllServerEndpoints(self):
+        endpoints = [(self.server_host, int(self.server_port), 1.0)]
+        for endpoint in self.server_endpoints:
+            host, port = endpoint['host'], int(endpoint['port'])
+            if (host, port) != endpoints[0][:2]:
+                endpoints.append((host, port, float(endpoint.get('weight', 1.0))))
+        return endpoints
+
+    def getServerProbeInterval(self):
+        return self.server_probe_interval
+
+    def getServerConnectTimeout(self):
+        return self.server_connect_timeout
+
+    def getServerReadTimeout(self):
+        return self.server_read_timeout
+
+    def getServerMaxRetries(self):
+        return self.server_max_retries
+
+    def getServerFailureThreshold(self):
+        return self.server_failure_threshold
+
+    def getServerResetTimeout(self):
+        return self.server_reset_timeout
+
+    def isBinaryResults(self):
+        return self.binary_results
+
+    def isCompression(self):
+        return self.compression
+
+    def isAdaptiveConcurrency(self):
+        return self.adaptive_concurrency
+
+    def isServerFiltering(self):
+        return self.server_filtering
+
+    def getBatchSize(self):
+        return self.batch_size
+
+    def getBatchMaxAge(self):
+        return self.batch_max_age
+
+    def getAsyncWorkers(self):
+        return self.async_workers
+
+    def getRequestsInFlight(self):
+        return self.requests_in_flight
+
+    def isCacheEnabled(self):
+        return self.cache_enabled
+
+    def getCacheMaxEntries(self):
+        return self.cache_max_entries
+
+    def isJournalEnabled(self):
+        return self.journal_enabled
+
+    def getSendBufferSize(self):
+        return self.send_buffer_size
+
+    def getMetricsInterval(self):
+        return self.metrics_interval
+
+    def getImageLogsPerSecond(self):
+        return self.image_logs_per_second
+
+    def getArtifactFlushSize(self):
+        return self.artifact_flush_size
+
+    def isPriorityScheduling(self):
+        return self.priority_scheduling
+
+    def getHighValuePaths(self):
+        return self.high_value_paths
+
+    def getLowValuePaths(self):
+        return self.low_value_paths
+
+    def getMaxPendingImages(self):
+        return self.max_pending_images
+
+    def isNearDuplicates(self):
+        return self.near_duplicates
+
+    def getNearDuplicateMaxDistance(self):
+        return self.near_duplicate_max_distance
+
+    def getModelVersion(self):
+        return self.model_version
+
+    def getSharedStorePath(self):
+        return self.shared_store_path
+
+    def getKnownFilesPath(self):
+        return self.known_files_path
+
+    def isSkipKnownFiles(self):
+        return self.skip_known_files
+
     def getImageFormats(self):
         return self.image_formats
 
@@ -277,6 +1041,12 @@ class AutopsyImageClassificationModuleWithUISettings(IngestModuleIngestJobSettin
     def getMinProbability(self):
         return self.min_probability
 
+    def getMinImageSide(self):
+        return self.min_image_side
+
+    def getDownscaleMaxSide(self):
+        return self.downscale_max_side
+
     def getVersionNumber(self):
         return self.serialVersionUID
 
@@ -292,6 +1062,105 @@ class AutopsyImageClassificationModuleWithUISettings(IngestModuleIngestJobSettin
     def setServerPort(self, port):
         self.server_port = port
 
+    def setServerPoolSize(self, server_pool_size):
+        self.server_pool_size = server_pool_size
+
+    def setServerEndpoints(self, server_endpoints):
+        self.server_endpoints = server_endpoints
+
+    def setServerProbeInterval(self, server_probe_interval):
+        self.server_probe_interval = server_probe_interval
+
+    def setServerConnectTimeout(self, server_connect_timeout):
+        self.server_connect_timeout = server_connect_timeout
+
+    def setServerReadTimeout(self, server_read_timeout):
+        self.server_read_timeout = server_read_timeout
+
+    def setServerMaxRetries(self, server_max_retries):
+        self.server_max_retries = server_max_retries
+
+    def setServerFailureThreshold(self, server_failure_threshold):
+        self.server_failure_threshold = server_failure_threshold
+
+    def setServerResetTimeout(self, server_reset_timeout):
+        self.server_reset_timeout = server_reset_timeout
+
+    def setBinaryResults(self, binary_results):
+        self.binary_results = binary_results
+
+    def setCompression(self, compression):
+        self.compression = compression
+
+    def setAdaptiveConcurrency(self, adaptive_concurrency):
+        self.adaptive_concurrency = adaptive_concurrency
+
+    def setServerFiltering(self, server_filtering):
+        self.server_filtering = server_filtering
+
+    def setBatchSize(self, batch_size):
+        self.batch_size = batch_size
+
+    def setBatchMaxAge(self, batch_max_age):
+        self.batch_max_age = batch_max_age
+
+    def setAsyncWorkers(self, async_workers):
+        self.async_workers = async_workers
+
+    def setRequestsInFlight(self, requests_in_flight):
+        self.requests_in_flight = requests_in_flight
+
+    def setCacheEnabled(self, cache_enabled):
+        self.cache_enabled = cache_enabled
+
+    def setCacheMaxEntries(self, cache_max_entries):
+        self.cache_max_entries = cache_max_entries
+
+    def setJournalEnabled(self, journal_enabled):
+        self.journal_enabled = journal_enabled
+
+    def setSendBufferSize(self, send_buffer_size):
+        self.send_buffer_size = send_buffer_size
+
+    def setMetricsInterval(self, metrics_interval):
+        self.metrics_interval = metrics_interval
+
+    def setImageLogsPerSecond(self, image_logs_per_second):
+        self.image_logs_per_second = image_logs_per_second
+
+    def setArtifactFlushSize(self, artifact_flush_size):
+        self.artifact_flush_size = artifact_flush_size
+
+    def setPriorityScheduling(self, priority_scheduling):
+        self.priority_scheduling = priority_scheduling
+
+    def setHighValuePaths(self, high_value_paths):
+        self.high_value_paths = high_value_paths
+
+    def setLowValuePaths(self, low_value_paths):
+        self.low_value_paths = low_value_paths
+
+    def setMaxPendingImages(self, max_pending_images):
+        self.max_pending_images = max_pending_images
+
+    def setNearDuplicates(self, near_duplicates):
+        self.near_duplicates = near_duplicates
+
+    def setNearDuplicateMaxDistance(self, near_duplicate_max_distance):
+        self.near_duplicate_max_distance = near_duplicate_max_distance
+
+    def setModelVersion(self, model_version):
+        self.model_version = model_version
+
+    def setSharedStorePath(self, shared_store_path):
+        self.shared_store_path = shared_store_path
+
+    def setKnownFilesPath(self, known_files_path):
+        self.known_files_path = known_files_path
+
+    def setSkipKnownFiles(self, skip_known_files):
+        self.skip_known_files = skip_known_files
+
     def setImageFormats(self, image_formats):
         self.image_formats = image_formats
 
@@ -301,6 +1170,12 @@ class AutopsyImageClassificationModuleWithUISettings(IngestModuleIngestJobSettin
     def setMinProbability(self, min_probability):
         self.min_probability = min_probability
 
+    def setMinImageSide(self, min_image_side):
+        self.min_image_side = min_image_side
+
+    def setDownscaleMaxSide(self, downscale_max_side):
+        self.downscale_max_side = downscale_max_side
+
     def setIsServerOnline(self, is_server_online):
         self.server_online = is_server_online
 
@@ -311,8 +1186,11 @@ class AutopsyImageClassificationModuleWithUISettings(IngestModuleIngestJobSettin
 class AutopsyImageClassificationModuleWithUISettingsPanel(IngestModuleIngestJobSettingsPanel):
     _logger = Logger.getLogger(AutopsyImageClassificationModuleFactory.moduleName)
 
-    def log(self, level, msg):
-        self._logger.logp(level, self.__class__.__name__, inspect.stack()[1][3], msg)
+    # The message is only formatted with the arguments when the level is logged
+    def log(self, level, msg, *args):
+        if self._logger.isLoggable(level):
+            self._logger.logp(level, self.__class__.__name__, sys._getframe(1).f_code.co_name,
+                              msg % args if args else msg)
 
     def __init__(self, settings):
         self.local_settings = settings
@@ -329,9 +1207,44 @@ class AutopsyImageClassificationModuleWithUISettingsPanel(IngestModuleIngestJobS
             self.log(Level.INFO, "Configuration file not found, loading the default configuration")
             self.local_settings.setServerHost(DEFAULT_HOST)
             self.local_settings.setServerPort(DEFAULT_PORT)
+            self.local_settings.setServerPoolSize(DEFAULT_POOL_SIZE)
+            self.local_settings.setServerEndpoints([])
+            self.local_settings.setServerProbeInterval(DEFAULT_PROBE_INTERVAL)
+            self.local_settings.setServerConnectTimeout(DEFAULT_CONNECT_TIMEOUT)
+            self.local_settings.setServerReadTimeout(DEFAULT_READ_TIMEOUT)
+            self.local_settings.setServerMaxRetries(DEFAULT_MAX_RETRIES)
+            self.local_settings.setServerFailureThreshold(DEFAULT_FAILURE_THRESHOLD)
+            self.local_settings.setServerResetTimeout(DEFAULT_RESET_TIMEOUT)
+            self.local_settings.setBinaryResults(DEFAULT_BINARY_RESULTS)
+            self.local_settings.setCompression(DEFAULT_COMPRESSION)
+            self.local_settings.setAdaptiveConcurrency(DEFAULT_ADAPTIVE_CONCURRENCY)
+            self.local_settings.setServerFiltering(DEFAULT_SERVER_FILTERING)
+            self.local_settings.setBatchSize(DEFAULT_BATCH_SIZE)
+            self.local_settings.setBatchMaxAge(DEFAULT_BATCH_MAX_AGE)
+            self.local_settings.setAsyncWorkers(DEFAULT_ASYNC_WORKERS)
+            self.local_settings.setRequestsInFlight(DEFAULT_REQUESTS_IN_FLIGHT)
+            self.local_settings.setCacheEnabled(DEFAULT_CACHE_ENABLED)
+            self.local_settings.setCacheMaxEntries(DEFAULT_CACHE_MAX_ENTRIES)
+            self.local_settings.setJournalEnabled(DEFAULT_JOURNAL_ENABLED)
+            self.local_settings.setSendBufferSize(DEFAULT_SEND_BUFFER_SIZE)
+            self.local_settings.setMetricsInterval(DEFAULT_METRICS_INTERVAL)
+            self.local_settings.setImageLogsPerSecond(DEFAULT_IMAGE_LOGS_PER_SECOND)
+            self.local_settings.setArtifactFlushSize(DEFAULT_ARTIFACT_FLUSH_SIZE)
+            self.local_settings.setPriorityScheduling(DEFAULT_PRIORITY_SCHEDULING)
+            self.local_settings.setHighValuePaths(priority.DEFAULT_HIGH_VALUE_PATHS)
+            self.local_settings.setLowValuePaths(priority.DEFAULT_LOW_VALUE_PATHS)
+            self.local_settings.setMaxPendingImages(DEFAULT_MAX_PENDING_IMAGES)
+            self.local_settings.setNearDuplicates(DEFAULT_NEAR_DUPLICATES)
+            self.local_settings.setNearDuplicateMaxDistance(DEFAULT_NEAR_DUPLICATE_MAX_DISTANCE)
+            self.local_settings.setModelVersion(DEFAULT_MODEL_VERSION)
+            self.local_settings.setSharedStorePath(DEFAULT_SHARED_STORE_PATH)
+            self.local_settings.setKnownFilesPath(DEFAULT_KNOWN_FILES_PATH)
+            self.local_settings.setSkipKnownFiles(DEFAULT_SKIP_KNOWN_FILES)
             self.local_settings.setImageFormats(DEFAULT_IMAGES_FORMAT)
             self.local_settings.setMinFileSize(DEFAULT_MIN_FILE_SIZE)
             self.local_settings.setMinProbability(DEFAULT_MIN_PROBABILITY)
+            self.local_settings.setMinImageSide(DEFAULT_MIN_IMAGE_SIDE)
+            self.local_settings.setDownscaleMaxSide(DEFAULT_DOWNSCALE_MAX_SIDE)
             self.local_settings.setClassesOfInterest(json.loads(DEFAULT_CLASSES_OF_INTEREST))
             # self.saveSettings(None)
             return self.local_settings
@@ -346,6 +1259,26 @@ class AutopsyImageClassificationModuleWithUISettingsPanel(IngestModuleIngestJobS
 
             self.local_settings.setServerHost(json_configs['server']['host'])
             self.local_settings.setServerPort(json_configs['server']['port'])
+            self.local_settings.setServerPoolSize(int(json_configs['server'].get('poolSize', DEFAULT_POOL_SIZE)))
+            self.local_settings.setServerEndpoints(json_configs['server'].get('endpoints', []))
+            self.local_settings.setServerProbeInterval(float(json_configs['server'].get('probeInterval',
+                                                                                        DEFAULT_PROBE_INTERVAL)))
+            self.local_settings.setServerConnectTimeout(float(json_configs['server'].get('connectTimeout',
+                                                                                         DEFAULT_CONNECT_TIMEOUT)))
+            self.local_settings.setServerReadTimeout(float(json_configs['server'].get('readTimeout',
+                                                                                      DEFAULT_READ_TIMEOUT)))
+            self.local_settings.setServerMaxRetries(int(json_configs['server'].get('maxRetries', DEFAULT_MAX_RETRIES)))
+            self.local_settings.setServerFailureThreshold(int(json_configs['server'].get('failureThreshold',
+                                                                                         DEFAULT_FAILURE_THRESHOLD)))
+            self.local_settings.setServerResetTimeout(float(json_configs['server'].get('resetTimeout',
+                                                                                       DEFAULT_RESET_TIMEOUT)))
+            self.local_settings.setBinaryResults(bool(json_configs['server'].get('binaryResults',
+                                                                                 DEFAULT_BINARY_RESULTS)))
+            self.local_settings.setCompression(bool(json_configs['server'].get('compression', DEFAULT_COMPRESSION)))
+            self.local_settings.setAdaptiveConcurrency(bool(json_configs['server'].get('adaptiveConcurrency',
+                                                                                      DEFAULT_ADAPTIVE_CONCURRENCY)))
+            self.local_settings.setServerFiltering(bool(json_configs['server'].get('filtering',
+                                                                                   DEFAULT_SERVER_FILTERING)))
 
             image_formats = json_configs['imageFormats']
 
@@ -357,7 +1290,39 @@ class AutopsyImageClassificationModuleWithUISettingsPanel(IngestModuleIngestJobS
 
             self.local_settings.setMinFileSize(json_configs['minFileSize'])
             self.local_settings.setMinProbability(json_configs['minProbability'])
+            self.local_settings.setMinImageSide(int(json_configs.get('minImageSide', DEFAULT_MIN_IMAGE_SIDE)))
+            self.local_settings.setDownscaleMaxSide(int(json_configs.get('downscaleMaxSide',
+                                                                         DEFAULT_DOWNSCALE_MAX_SIDE)))
             self.local_settings.setClassesOfInterest(json_configs['classesOfInterest'])
+            self.local_settings.setBatchSize(int(json_configs.get('batchSize', DEFAULT_BATCH_SIZE)))
+            self.local_settings.setBatchMaxAge(float(json_configs.get('batchMaxAge', DEFAULT_BATCH_MAX_AGE)))
+            self.local_settings.setAsyncWorkers(int(json_configs.get('asyncWorkers', DEFAULT_ASYNC_WORKERS)))
+            self.local_settings.setRequestsInFlight(int(json_configs.get('requestsInFlight',
+                                                                         DEFAULT_REQUESTS_IN_FLIGHT)))
+            self.local_settings.setCacheEnabled(bool(json_configs.get('cacheEnabled', DEFAULT_CACHE_ENABLED)))
+            self.local_settings.setCacheMaxEntries(int(json_configs.get('cacheMaxEntries',
+                                                                        DEFAULT_CACHE_MAX_ENTRIES)))
+            self.local_settings.setJournalEnabled(bool(json_configs.get('journalEnabled', DEFAULT_JOURNAL_ENABLED)))
+            self.local_settings.setSendBufferSize(int(json_configs.get('sendBufferSize', DEFAULT_SEND_BUFFER_SIZE)))
+            self.local_settings.setMetricsInterval(int(json_configs.get('metricsInterval', DEFAULT_METRICS_INTERVAL)))
+            self.local_settings.setImageLogsPerSecond(float(json_configs.get('imageLogsPerSecond',
+                                                                             DEFAULT_IMAGE_LOGS_PER_SECOND)))
+            self.local_settings.setArtifactFlushSize(int(json_configs.get('artifactFlushSize',
+                                                                          DEFAULT_ARTIFACT_FLUSH_SIZE)))
+            self.local_settings.setPriorityScheduling(bool(json_configs.get('priorityScheduling',
+                                                                            DEFAULT_PRIORITY_SCHEDULING)))
+            self.local_settings.setHighValuePaths(json_configs.get('highValuePaths',
+                                                                   priority.DEFAULT_HIGH_VALUE_PATHS))
+            self.local_settings.setLowValuePaths(json_configs.get('lowValuePaths', priority.DEFAULT_LOW_VALUE_PATHS))
+            self.local_settings.setMaxPendingImages(int(json_configs.get('maxPendingImages',
+                                                                         DEFAULT_MAX_PENDING_IMAGES)))
+            self.local_settings.setNearDuplicates(bool(json_configs.get('nearDuplicates', DEFAULT_NEAR_DUPLICATES)))
+            self.local_settings.setNearDuplicateMaxDistance(int(json_configs.get('nearDuplicateMaxDistance',
+                                                                                 DEFAULT_NEAR_DUPLICATE_MAX_DISTANCE)))
+            self.local_settings.setModelVersion(json_configs.get('modelVersion', DEFAULT_MODEL_VERSION))
+            self.local_settings.setSharedStorePath(json_configs.get('sharedStorePath', DEFAULT_SHARED_STORE_PATH))
+            self.local_settings.setKnownFilesPath(json_configs.get('knownFilesPath', DEFAULT_KNOWN_FILES_PATH))
+            self.local_settings.setSkipKnownFiles(bool(json_configs.get('skipKnownFiles', DEFAULT_SKIP_KNOWN_FILES)))
             return self.local_settings
 
     def check_server_connection(self, e):
@@ -366,23 +1331,42 @@ class AutopsyImageClassificationModuleWithUISettingsPanel(IngestModuleIngestJobS
         self.message.setText(message_string)
         self.error_message.setText("")
 
-        new_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        new_socket.settimeout(1)
-        try:
-            new_socket.connect((self.host_TF.getText(), int(self.port_TF.getText())))
+        # The ingest can run as long as one of the servers is up
+        endpoints = [(self.host_TF.getText(), self.port_TF.getText())]
+        endpoints += [(endpoint['host'], endpoint['port']) for endpoint in self.local_settings.getServerEndpoints()]
+        nr_of_servers_up = 0
+        capabilities = None
+        for host, port in endpoints:
+            try:
+                server_capabilities = fetch_capabilities(host, int(port), 1)
+                nr_of_servers_up += 1
+            except (socket.timeout, socket.error, ValueError) as e:
+                self.log(Level.INFO, "Server %s:%s is down", host, port)
+                continue
+            if capabilities is None:
+                capabilities = server_capabilities
+
+        # The classes of interest to choose from are the ones the model detects
+        if capabilities is not None:
+            self.local_settings.setClassesOfInterest(
+                merge_classes_of_interest(self.local_settings.getClassesOfInterest(), capabilities.class_names))
+
+        if nr_of_servers_up > 0:
             self.local_settings.setIsServerOnline(True)
             message_string = "Server is up!"
+            if len(endpoints) > 1:
+                message_string = str(nr_of_servers_up) + " of " + str(len(endpoints)) + " servers are up"
+            if capabilities is not None and capabilities.model:
+                message_string += " (" + capabilities.model + ", " + str(len(capabilities.class_names)) + \
+                    " classes)"
             self.log(Level.INFO, message_string)
             self.message.setText(message_string)
-
-        except (socket.timeout, socket.error) as e:
+        else:
             self.local_settings.setIsServerOnline(False)
             err_string = "Server is down"
             self.error_message.setText(err_string)
             self.message.setText("")
             self.log(Level.INFO, err_string)
-        finally:
-            new_socket.close()
 
     def save_settings(self, e):
         self.message.setText("")
@@ -431,12 +1415,47 @@ class AutopsyImageClassificationModuleWithUISettingsPanel(IngestModuleIngestJobS
         configs = {
             'server': {
                 'host': host,
-                'port': port
+                'port': port,
+                'poolSize': self.local_settings.getServerPoolSize(),
+                'endpoints': self.local_settings.getServerEndpoints(),
+                'probeInterval': self.local_settings.getServerProbeInterval(),
+                'connectTimeout': self.local_settings.getServerConnectTimeout(),
+                'readTimeout': self.local_settings.getServerReadTimeout(),
+                'maxRetries': self.local_settings.getServerMaxRetries(),
+                'failureThreshold': self.local_settings.getServerFailureThreshold(),
+                'resetTimeout': self.local_settings.getServerResetTimeout(),
+                'binaryResults': self.local_settings.isBinaryResults(),
+                'compression': self.local_settings.isCompression(),
+                'adaptiveConcurrency': self.local_settings.isAdaptiveConcurrency(),
+                'filtering': self.local_settings.isServerFiltering()
             },
             'imageFormats': image_formats_array,
             'minProbability': min_probability,
             'minFileSize': min_file_size,
-            'classesOfInterest': self.local_settings.getClassesOfInterest()
+            'minImageSide': self.local_settings.getMinImageSide(),
+            'downscaleMaxSide': self.local_settings.getDownscaleMaxSide(),
+            'classesOfInterest': self.local_settings.getClassesOfInterest(),
+            'batchSize': self.local_settings.getBatchSize(),
+            'batchMaxAge': self.local_settings.getBatchMaxAge(),
+            'asyncWorkers': self.local_settings.getAsyncWorkers(),
+            'requestsInFlight': self.local_settings.getRequestsInFlight(),
+            'cacheEnabled': self.local_settings.isCacheEnabled(),
+            'cacheMaxEntries': self.local_settings.getCacheMaxEntries(),
+            'journalEnabled': self.local_settings.isJournalEnabled(),
+            'sendBufferSize': self.local_settings.getSendBufferSize(),
+            'metricsInterval': self.local_settings.getMetricsInterval(),
+            'imageLogsPerSecond': self.local_settings.getImageLogsPerSecond(),
+            'artifactFlushSize': self.local_settings.getArtifactFlushSize(),
+            'priorityScheduling': self.local_settings.isPriorityScheduling(),
+            'highValuePaths': self.local_settings.getHighValuePaths(),
+            'lowValuePaths': self.local_settings.getLowValuePaths(),
+            'maxPendingImages': self.local_settings.getMaxPendingImages(),
+            'nearDuplicates': self.local_settings.isNearDuplicates(),
+            'nearDuplicateMaxDistance': self.local_settings.getNearDuplicateMaxDistance(),
+            'modelVersion': self.local_settings.getModelVersion(),
+            'sharedStorePath': self.local_settings.getSharedStorePath(),
+            'knownFilesPath': self.local_settings.getKnownFilesPath(),
+            'skipKnownFiles': self.local_settings.isSkipKnownFiles()
         }
 
         with io.open(self.config_location, 'w', encoding='utf-8') as f:
@@ -0,0 +1,92 @@
+# Classifies images with several threads against local stand-in servers of
+# different speeds, one of them flaky, and takes the fastest one down in the
+# middle of the run to show the ejection and the recovery by the prober.
+#
+# Usage: python benchmarks/bench_balancer.py [nr of images] [nr of threads]
+import logging
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from image_classification import ConnectionPool, LoadBalancer, IngestMetrics, MemoryImage
+from stand_in_server import StandInServer
+
+
+def classify(pool, image, nr_of_images, nr_of_threads):
+    errors = []
+    remaining = [nr_of_images]
+    lock = threading.Lock()
+
+    def work():
+        while True:
+            with lock:
+                if remaining[0] == 0:
+                    return
+                remaining[0] -= 1
+            try:
+                pool.get_detections(image)
+            except Exception as e:
+                with lock:
+                    errors.append(e)
+
+    threads = [threading.Thread(target=work) for i in range(nr_of_threads)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.time() - start, len(errors)
+
+
+def main():
+    nr_of_images = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    nr_of_threads = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    logging.basicConfig(format="  %(message)s")
+    image = MemoryImage("image.jpg", ".jpg", os.urandom(64 * 1024))
+
+    print("%d images, %d threads" % (nr_of_images, nr_of_threads))
+
+    server = StandInServer(latency=0.005).start()
+    elapsed, nr_of_errors = classify(ConnectionPool(server.host, server.port, 4), image,
+                                     nr_of_images, nr_of_threads)
+    server.stop()
+    print("%-28s %7.1f images/s  %d errors" % ("single server", nr_of_images / elapsed, nr_of_errors))
+
+    servers = {
+        'fast': StandInServer(latency=0.005).start(),
+        'slow': StandInServer(latency=0.02).start(),
+        'flaky': StandInServer(latency=0.005, failure_rate=0.05).start(),
+    }
+    metrics = IngestMetrics()
+    balancer = LoadBalancer([(server.host, server.port, 1) for server in servers.values()], 4,
+                            metrics=metrics, probe_interval=0.5)
+
+    # The fastest server goes down after a while and comes back on the same port
+    def restart_fast_server():
+        time.sleep(0.5)
+        fast = servers['fast']
+        fast.stop()
+        time.sleep(1.0)
+        servers['fast restarted'] = StandInServer(fast.host, fast.port, latency=0.005).start()
+
+    restarter = threading.Thread(target=restart_fast_server)
+    restarter.start()
+    elapsed, nr_of_errors = classify(balancer, image, nr_of_images, nr_of_threads)
+    restarter.join()
+    balancer.close()
+
+    counters = metrics.snapshot()['counters']
+    print("%-28s %7.1f images/s  %d errors, %d ejections, %d failovers" % (
+        "load balanced, 3 servers", nr_of_images / elapsed, nr_of_errors,
+        counters.get('ejections', 0), counters.get('failovers', 0)))
+    for name in sorted(servers):
+        server = servers[name]
+        print("  %-26s %5d images  %d failures" % (name, server.nr_of_images, server.nr_of_failures))
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+# Sends uncompressed BMP-like images and already compressed JPEG-like images
+# to a local stand-in server over a throttled link, with and without
+# compression.
+#
+# Usage: python benchmarks/bench_compression.py [link MB/s] [nr of images of each type] [image size in MB]
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from image_classification import Compressor, IngestMetrics, LocalImage, ServerConnection
+from stand_in_server import StandInServer
+
+
+# Pixels of a smooth picture with some noise, as a photo stored in a BMP
+def make_bmp_pixels(size):
+    width = 1024
+    row = bytearray(width * 3)
+    rows = []
+    for y in range(size // len(row) + 1):
+        for x in range(width):
+            value = (x // 4 + y // 4 + random.randint(0, 6)) % 256
+            row[3 * x] = value
+            row[3 * x + 1] = (value + 40) % 256
+            row[3 * x + 2] = (value + 80) % 256
+        rows.append(bytes(row))
+    return b''.join(rows)[:size]
+
+
+def write_images(directory, nr_of_images, image_size):
+    images = []
+    bmp_pixels = make_bmp_pixels(image_size)
+    for i in range(nr_of_images):
+        for extension, data in [('.bmp', bmp_pixels), ('.jpg', os.urandom(image_size))]:
+            path = os.path.join(directory, "image%d%s" % (i, extension))
+            with open(path, 'wb') as f:
+                f.write(data)
+            images.append(LocalImage(path))
+    return images
+
+
+def run(server, images, compressor, metrics):
+    connection = ServerConnection(server.host, server.port, metrics=metrics, compressor=compressor)
+    start = time.time()
+    for image in images:
+        connection.get_batch_detections([image])
+    elapsed = time.time() - start
+    connection.close()
+    return elapsed
+
+
+def main():
+    bandwidth = float(sys.argv[1]) * 1024 * 1024 if len(sys.argv) > 1 else 20 * 1024 * 1024
+    nr_of_images = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    image_size = int(float(sys.argv[3]) * 1024 * 1024) if len(sys.argv) > 3 else 3 * 1024 * 1024
+
+    directory = tempfile.mkdtemp()
+    try:
+        images = write_images(directory, nr_of_images, image_size)
+        total_size = sum(image.size for image in images) / (1024.0 * 1024)
+        print("%d BMP and %d JPEG images of %.1f MB" % (nr_of_images, nr_of_images, image_size / (1024.0 * 1024)))
+        for link_name, link_bandwidth in [("%g MB/s link" % (bandwidth / (1024 * 1024)), bandwidth),
+                                          ("loopback", None)]:
+            server = StandInServer(bandwidth=link_bandwidth).start()
+            for name, compressed in [("raw", False), ("compressed", True)]:
+                metrics = IngestMetrics()
+                compressor = Compressor(metrics=metrics) if compressed else None
+                elapsed = run(server, images, compressor, metrics)
+                counters = metrics.snapshot()['counters']
+                print("%-14s %-11s %7.1f MB/s  %6.1f MB sent  compression ratio %s" % (
+                    link_name, name, total_size / elapsed, counters.get('bytesSent', 0) / (1024.0 * 1024),
+                    metrics.snapshot()['compressionRatio']))
+            server.stop()
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
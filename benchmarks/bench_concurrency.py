@@ -0,0 +1,79 @@
+# Classifies images with many more threads than a stand-in server with a
+# fixed service rate has GPUs, with and without the adaptive concurrency
+# limiter, and reports the throughput, the latency of the requests, the
+# requests that timed out and how the limit moved.
+# With every thread sending its request right away the requests queue on the
+# server, and those that wait longer than the read timeout fail while the
+# server still spends its GPUs on them.
+#
+# Usage: python benchmarks/bench_concurrency.py [nr of threads] [nr of images] [read timeout]
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from image_classification import ConnectionPool, IngestMetrics, MemoryImage
+from stand_in_server import StandInServer
+
+LATENCY = 0.01
+NR_OF_GPUS = 4
+
+
+def run(server, nr_of_threads, nr_of_images, timeout, max_concurrency):
+    metrics = IngestMetrics()
+    pool = ConnectionPool(server.host, server.port, nr_of_threads, timeout=timeout, metrics=metrics,
+                          max_concurrency=max_concurrency)
+    image = MemoryImage("image.jpg", ".jpg", os.urandom(32 * 1024))
+    remaining = [nr_of_images]
+    lock = threading.Lock()
+
+    def work():
+        while True:
+            with lock:
+                if remaining[0] == 0:
+                    return
+                remaining[0] -= 1
+            request_start = time.time()
+            try:
+                pool.get_detections(image)
+            except Exception:
+                metrics.increment('errors')
+            metrics.record('request', time.time() - request_start)
+
+    start = time.time()
+    threads = [threading.Thread(target=work) for i in range(nr_of_threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start
+    pool.close()
+    return nr_of_images / elapsed, metrics.snapshot()
+
+
+def main():
+    nr_of_threads = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    nr_of_images = int(sys.argv[2]) if len(sys.argv) > 2 else 4000
+    timeout = float(sys.argv[3]) if len(sys.argv) > 3 else 0.05
+    print("stand-in server: %.1f ms per image, %d GPUs, at most %.0f images/s; %d threads, %.0f ms timeout" % (
+        LATENCY * 1000, NR_OF_GPUS, NR_OF_GPUS / LATENCY, nr_of_threads, timeout * 1000))
+    for name, max_concurrency in (("fixed", 0), ("adaptive", nr_of_threads)):
+        # A server of its own, as the one of a run is still busy with the
+        # requests that timed out
+        server = StandInServer(latency=LATENCY, nr_of_gpus=NR_OF_GPUS).start()
+        try:
+            images_per_second, snapshot = run(server, nr_of_threads, nr_of_images, timeout, max_concurrency)
+        finally:
+            server.stop()
+        request = snapshot['stages']['request']
+        print("%-8s %8.1f images/s  request p50 %6.1f ms  p99 %6.1f ms  %d errors" % (
+            name, images_per_second, request['p50Seconds'] * 1000, request['p99Seconds'] * 1000,
+            snapshot['counters'].get('errors', 0)))
+        for gauge, values in sorted(snapshot['gauges'].items()):
+            print("         %s %d, last changes: %s" % (gauge, values['value'], " ".join(
+                "%d@%.1fs" % (value, seconds) for seconds, value in values['history'][-12:])))
+
+if __name__ == '__main__':
+    main()
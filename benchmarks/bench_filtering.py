@@ -0,0 +1,63 @@
+# Classifies crowded images, with many detections each, against the stand-in
+# server with and without the server filtering the detections, and reports
+# the bytes received and the time spent parsing the responses per image, and
+# how many detections the result filter still drops on the client, none once
+# the server filters them.
+# The stand-in filters in the interpreter of the benchmark, so the images per
+# second include the work of the server.
+#
+# Usage: python benchmarks/bench_filtering.py [nr of images] [min probability]
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from image_classification import BinaryResults, ConnectionPool, IngestMetrics, MemoryImage, ResultFilter
+from stand_in_server import DEFAULT_CLASS_NAMES, StandInServer
+
+BATCH_SIZE = 16
+# Half of the classes are of interest
+CLASSES_OF_INTEREST = [{'name': name, 'enabled': i % 2 == 0} for i, name in enumerate(DEFAULT_CLASS_NAMES)]
+
+
+def run(server, images, result_filter, binary_results, server_filter):
+    metrics = IngestMetrics()
+    pool = ConnectionPool(server.host, server.port, 1, timeout=60, metrics=metrics, binary_results=binary_results,
+                          server_filter=server_filter)
+    nr_of_dropped_detections = 0
+    start = time.time()
+    for i in range(0, len(images), BATCH_SIZE):
+        for detections in pool.get_batch_detections(images[i:i + BATCH_SIZE]):
+            nr_of_dropped_detections += len(detections) - len(result_filter.filter(detections))
+    elapsed = time.time() - start
+    pool.close()
+    snapshot = metrics.snapshot()
+    return (len(images) / elapsed, float(snapshot['counters']['bytesReceived']) / len(images),
+            snapshot['stages']['parse']['totalSeconds'] / len(images), nr_of_dropped_detections)
+
+
+def main():
+    nr_of_images = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    min_probability = float(sys.argv[2]) if len(sys.argv) > 2 else 50
+    # Made up detections of random probabilities, 10 to 40 per image
+    server = StandInServer(nr_of_detections=(10, 40)).start()
+    images = [MemoryImage("image%d.jpg" % i, ".jpg", os.urandom(1024)) for i in range(nr_of_images)]
+    result_filter = ResultFilter(min_probability, CLASSES_OF_INTEREST)
+    print("%d images, up to 40 detections each, %d of %d classes of interest, min probability %g" % (
+        nr_of_images, len(result_filter.enabled_classes), len(DEFAULT_CLASS_NAMES), min_probability))
+    print("%-8s %-12s %10s %12s %15s %15s" % ("results", "filtered by", "images/s", "bytes/image", "parse us/image",
+                                               "client dropped"))
+    try:
+        for encoding, binary_results in (("json", None), ("binary", BinaryResults(DEFAULT_CLASS_NAMES))):
+            for name, server_filter in (("client", None), ("server", result_filter.server_filter(DEFAULT_CLASS_NAMES))):
+                images_per_second, bytes_per_image, parse_seconds, nr_of_dropped_detections = run(
+                    server, images, result_filter, binary_results, server_filter)
+                print("%-8s %-12s %10.1f %12.1f %15.1f %15d" % (encoding, name, images_per_second, bytes_per_image,
+                                                                parse_seconds * 1e6, nr_of_dropped_detections))
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
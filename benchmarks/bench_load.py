@@ -0,0 +1,162 @@
+# Load test of the client: classifies images of different size distributions
+# at different concurrencies against a stand-in server with a fixed service
+# rate, and reports the throughput and the latency of every run. Runs can be
+# saved as JSON Lines, to compare the client before and after a change.
+#
+# Usage: python benchmarks/bench_load.py --help
+#
+# Unless --server is given, the stand-in server runs in this process and
+# shares the interpreter lock with the client; run it on its own with
+# benchmarks/stand_in_server.py for the most accurate numbers.
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from image_classification import AsyncClassifier, BinaryResults, ConnectionPool, IngestMetrics, MemoryImage
+from stand_in_server import DEFAULT_CLASS_NAMES, StandInServer, parse_range
+
+# Sizes, in bytes, of the images of every distribution
+SIZE_DISTRIBUTIONS = {
+    # Browser cache and thumbnail store images
+    'thumbnails': lambda: random.randint(4 * 1024, 64 * 1024),
+    # Camera photos, around 2.5 MB
+    'photos': lambda: min(12 * 1024 * 1024, max(256 * 1024, int(random.lognormvariate(14.7, 0.5)))),
+    # What a disk image mostly holds: many thumbnails, some photos
+    'mixed': lambda: SIZE_DISTRIBUTIONS['photos']() if random.random() < 0.1 else SIZE_DISTRIBUTIONS['thumbnails'](),
+}
+# Different images cycled through by every run
+NR_OF_DISTINCT_IMAGES = 64
+
+
+def make_images(distribution):
+    sizes = [SIZE_DISTRIBUTIONS[distribution]() for i in range(NR_OF_DISTINCT_IMAGES)]
+    data = os.urandom(max(sizes))
+    return [MemoryImage("image%d.jpg" % i, ".jpg", data[:size]) for i, size in enumerate(sizes)]
+
+
+# Percentile of sorted values, by the nearest rank
+def percentile(values, percentile):
+    if not values:
+        return 0.0
+    return values[max(0, int(math.ceil(percentile / 100.0 * len(values))) - 1)]
+
+
+# Classifies 'nr_of_images' images with 'concurrency' connections and
+# returns the throughput and latencies of the run
+def run(host, port, images, nr_of_images, concurrency, batch_size, binary_results):
+    metrics = IngestMetrics()
+    pool = ConnectionPool(host, port, concurrency, timeout=60, metrics=metrics, binary_results=binary_results)
+    latencies = []
+    nr_of_errors = [0]
+    lock = threading.Lock()
+
+    def record(start, detections):
+        latency = time.time() - start
+        with lock:
+            latencies.append(latency)
+            if not isinstance(detections, list):
+                nr_of_errors[0] += 1
+
+    start = time.time()
+    if batch_size > 1:
+        async_classifier = AsyncClassifier(pool, concurrency, 2, batch_size)
+        for i in range(nr_of_images):
+            submit_time = time.time()
+            async_classifier.submit(images[i % len(images)],
+                                    lambda detections, submit_time=submit_time: record(submit_time, detections))
+        async_classifier.close()
+    else:
+        remaining = [nr_of_images]
+
+        def work():
+            while True:
+                with lock:
+                    if remaining[0] == 0:
+                        return
+                    remaining[0] -= 1
+                    image = images[remaining[0] % len(images)]
+                request_start = time.time()
+                try:
+                    detections = pool.get_detections(image)
+                except Exception as e:
+                    detections = {'errorCode': 'CONNECTION_ERROR', 'errorMessage': str(e)}
+                record(request_start, detections)
+
+        threads = [threading.Thread(target=work) for i in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    elapsed = time.time() - start
+    pool.close()
+
+    latencies.sort()
+    return {
+        'imagesPerSecond': round(nr_of_images / elapsed, 1),
+        'megabytesPerSecond': round(metrics.counter('bytesSent') / (1024.0 * 1024) / elapsed, 2),
+        'p50Milliseconds': round(percentile(latencies, 50) * 1000, 2),
+        'p99Milliseconds': round(percentile(latencies, 99) * 1000, 2),
+        'errors': nr_of_errors[0],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test of the image classification client")
+    parser.add_argument('--images', type=int, default=1000, help="images per run")
+    parser.add_argument('--concurrency', default="1,2,4,8,16", help="comma separated numbers of connections")
+    parser.add_argument('--sizes', default="thumbnails,mixed,photos",
+                        help="comma separated size distributions: " + ", ".join(sorted(SIZE_DISTRIBUTIONS)))
+    parser.add_argument('--batch-size', type=int, default=1, help="images per pipelined batch request")
+    parser.add_argument('--binary-results', action='store_true', help="ask for binary encoded results")
+    parser.add_argument('--server', help="HOST:PORT of a running server instead of an in-process stand-in")
+    parser.add_argument('--latency', type=float, default=0.005, help="stand-in seconds of inference per image")
+    parser.add_argument('--gpus', type=int, default=4, help="stand-in images processed at once")
+    parser.add_argument('--detections', type=parse_range, default=(0, 10), help="stand-in detections per image")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="stand-in probability of an error result")
+    parser.add_argument('--output', help="file to append the results to, as JSON Lines")
+    arguments = parser.parse_args()
+
+    server = None
+    if arguments.server:
+        host, port = arguments.server.rsplit(':', 1)
+        port = int(port)
+    else:
+        server = StandInServer(latency=arguments.latency, nr_of_gpus=arguments.gpus,
+                               nr_of_detections=arguments.detections, error_rate=arguments.error_rate).start()
+        host, port = server.host, server.port
+        print("stand-in server: %.1f ms per image, %d GPUs, %s detections per image" % (
+            arguments.latency * 1000, arguments.gpus, arguments.detections))
+    binary_results = BinaryResults(DEFAULT_CLASS_NAMES) if arguments.binary_results else None
+
+    print("%-11s %11s %10s %8s %9s %9s %7s" % ("sizes", "concurrency", "images/s", "MB/s", "p50 ms", "p99 ms",
+                                               "errors"))
+    output = open(arguments.output, 'a') if arguments.output else None
+    try:
+        for distribution in arguments.sizes.split(','):
+            images = make_images(distribution)
+            for concurrency in [int(value) for value in arguments.concurrency.split(',')]:
+                result = run(host, port, images, arguments.images, concurrency, arguments.batch_size, binary_results)
+                print("%-11s %11d %10.1f %8.2f %9.2f %9.2f %7d" % (
+                    distribution, concurrency, result['imagesPerSecond'], result['megabytesPerSecond'],
+                    result['p50Milliseconds'], result['p99Milliseconds'], result['errors']))
+                if output is not None:
+                    result.update({'sizes': distribution, 'concurrency': concurrency,
+                                   'batchSize': arguments.batch_size, 'images': arguments.images,
+                                   'time': time.strftime("%Y-%m-%dT%H:%M:%S")})
+                    output.write(json.dumps(result, sort_keys=True) + "\n")
+    finally:
+        if output is not None:
+            output.close()
+        if server is not None:
+            server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+# Measures the per file cost of the log calls made while processing an image,
+# with the previous inspect.stack() based logging and with the current one.
+#
+# Usage: python benchmarks/bench_logging.py [nr of files] [stack depth]
+import inspect
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from image_classification import RateLimiter
+
+INFO = 800
+DETECTIONS = [{"className": "person", "probability": 91}, {"className": "dog", "probability": 77}]
+
+
+# Stands in for java.util.logging.Logger, with INFO enabled as in Autopsy
+class StandInLogger(object):
+
+    def __init__(self):
+        self.nr_of_records = 0
+
+    def isLoggable(self, level):
+        return level >= INFO
+
+    def logp(self, level, source_class, source_method, msg):
+        self.nr_of_records += 1
+
+
+class PreviousLogging(object):
+
+    def __init__(self):
+        self._logger = StandInLogger()
+
+    def log(self, level, msg):
+        self._logger.logp(level, self.__class__.__name__, inspect.stack()[1][3], msg)
+
+    def process(self, name):
+        self.log(INFO, 'Processing ' + name)
+        self.log(INFO, "Received from image: " + name + " the response: " + json.dumps(DETECTIONS))
+        self.log(INFO, 'Finish...')
+
+
+class CurrentLogging(object):
+
+    def __init__(self, image_logs_per_second):
+        self._logger = StandInLogger()
+        self.image_log_limiter = RateLimiter(image_logs_per_second)
+
+    def log_image(self, level, msg, *args):
+        if not self._logger.isLoggable(level) or not self.image_log_limiter.allow():
+            return
+        suppressed = self.image_log_limiter.take_suppressed()
+        if suppressed:
+            msg += " (%d similar messages suppressed)"
+            args += (suppressed,)
+        self._logger.logp(level, self.__class__.__name__, sys._getframe(1).f_code.co_name, msg % args)
+
+    def process(self, name):
+        self.log_image(INFO, 'Processing %s', name)
+        self.log_image(INFO, "Received from image: %s the response: %s", name, DETECTIONS)
+        self.log_image(INFO, 'Finish...')
+
+
+# Runs the files from a deep stack, as the ingest threads of Autopsy do
+def run_nested(depth, module, nr_of_files):
+    if depth > 0:
+        return run_nested(depth - 1, module, nr_of_files)
+    start = time.time()
+    for i in range(nr_of_files):
+        module.process("/img_%d/DCIM/%d.jpg" % (i % 10, i))
+    return time.time() - start
+
+
+def main():
+    nr_of_files = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    depth = int(sys.argv[2]) if len(sys.argv) > 2 else 40
+
+    print("%d files, stack depth %d" % (nr_of_files, depth))
+    for name, module in [("inspect.stack()", PreviousLogging()),
+                         ("_getframe, unlimited", CurrentLogging(0)),
+                         ("_getframe, 10 images/s", CurrentLogging(10))]:
+        elapsed = run_nested(depth, module, nr_of_files)
+        print("%-24s %9.2f us/file  %8d records" % (name, elapsed / nr_of_files * 1e6,
+                                                   module._logger.nr_of_records))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+# Compares the per file and per detection lookups done before and after the
+# lookup structures were precomputed once per ingest job, and the prefilter
+# of every file of a data source with the one of the files that pass the
+# cheap name and type check first, as AutopsyImageClassificationModule.process does.
+#
+# Usage: python benchmarks/bench_lookups.py [nr of file names] [nr of detections] [nr of files]
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from image_classification import LocalImage, Prefilter, ResultFilter
+
+CONFIG_LOCATION = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'configs.json')
+EXTENSIONS = ['jpg', 'png', 'jpeg', 'gif', 'txt', 'dll', 'exe', 'html', 'js', 'dat', 'db', 'xml']
+JPEG_HEADER = b'\xff\xd8\xff\xe0\x00\x10JFIF\x00'
+
+
+# Previous AutopsyImageClassificationModule.is_image
+def is_image_loop(image_formats, file_name):
+    valid = False
+    for image_format in image_formats:
+        if file_name.endswith("." + image_format):
+            valid = True
+    return valid
+
+
+# Previous filtering of the detections in AutopsyImageClassificationModule.process
+def filter_loop(min_probability, classes_of_interest, detections):
+    selected = []
+    for detection in detections:
+        if detection["probability"] >= min_probability:
+            for classes in classes_of_interest:
+                if detection['className'] == classes['name'] and classes['enabled']:
+                    selected.append(detection)
+                    break
+    return selected
+
+
+# Writes 'nr_of_files' files with the extensions picked at random, the ones
+# named as images holding a JPEG signature. Returns their paths.
+def write_files(directory, nr_of_files):
+    paths = []
+    for i in range(nr_of_files):
+        extension = random.choice(EXTENSIONS)
+        path = os.path.join(directory, "file%d.%s" % (i, extension))
+        with open(path, 'wb') as f:
+            if extension in ('jpg', 'jpeg', 'png'):
+                f.write(JPEG_HEADER + os.urandom(4096))
+            else:
+                f.write(os.urandom(4096))
+        paths.append(path)
+    return paths
+
+
+# What process() did before the name and type check: every file is read
+def check_every_file(prefilter, paths):
+    return [prefilter.check(LocalImage(path)) is None for path in paths]
+
+
+# What process() does: only the files that pass the name and type check are read
+def check_candidates(prefilter, paths):
+    return [prefilter.is_candidate(os.path.basename(path)) and prefilter.check(LocalImage(path)) is None
+            for path in paths]
+
+
+def timed(function):
+    start = time.time()
+    result = function()
+    return time.time() - start, result
+
+
+def main():
+    nr_of_file_names = int(sys.argv[1]) if len(sys.argv) > 1 else 2000000
+    nr_of_detections = int(sys.argv[2]) if len(sys.argv) > 2 else 2000000
+    nr_of_files = int(sys.argv[3]) if len(sys.argv) > 3 else 20000
+
+    with open(CONFIG_LOCATION) as f:
+        configs = json.load(f)
+    image_formats = configs['imageFormats']
+    classes_of_interest = configs['classesOfInterest']
+    for class_of_interest in classes_of_interest[::3]:
+        class_of_interest['enabled'] = False
+    class_names = [class_of_interest['name'] for class_of_interest in classes_of_interest]
+
+    random.seed(1)
+    file_names = ["file%d.%s" % (i, random.choice(EXTENSIONS)) for i in range(nr_of_file_names)]
+    detections = [{"className": random.choice(class_names), "probability": random.randint(0, 100)}
+                  for i in range(nr_of_detections)]
+
+    prefilter = Prefilter(image_formats)
+    loop_time, loop_result = timed(lambda: [is_image_loop(image_formats, name) for name in file_names])
+    set_time, set_result = timed(lambda: [prefilter.has_image_extension(name) for name in file_names])
+    assert loop_result == set_result
+    print("%d file names" % nr_of_file_names)
+    print("  endswith loop   %6.2f s" % loop_time)
+    print("  frozenset       %6.2f s" % set_time)
+
+    result_filter = ResultFilter(configs['minProbability'], classes_of_interest)
+    loop_time, loop_result = timed(lambda: filter_loop(configs['minProbability'], classes_of_interest, detections))
+    set_time, set_result = timed(lambda: result_filter.filter(detections))
+    assert loop_result == set_result
+    print("%d detections" % nr_of_detections)
+    print("  nested loops    %6.2f s" % loop_time)
+    print("  ResultFilter    %6.2f s" % set_time)
+
+    directory = tempfile.mkdtemp()
+    try:
+        paths = write_files(directory, nr_of_files)
+        prefilter = Prefilter(image_formats)
+        every_time, every_result = timed(lambda: check_every_file(prefilter, paths))
+        candidates_time, candidates_result = timed(lambda: check_candidates(prefilter, paths))
+    finally:
+        shutil.rmtree(directory)
+    assert every_result == candidates_result
+    nr_of_candidates = sum(1 for path in paths if prefilter.is_candidate(os.path.basename(path)))
+    print("%d files, %d named as images" % (nr_of_files, nr_of_candidates))
+    print("  check all       %6.2f s" % every_time)
+    print("  name and type   %6.2f s" % candidates_time)
+
+
+if __name__ == '__main__':
+    main()
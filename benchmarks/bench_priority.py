@@ -0,0 +1,74 @@
+# Submits the images of a disk where the photos of the user come after
+# thousands of browser cache images, as Autopsy would hand them over, and
+# measures when the last of the photos is classified, with and without
+# priority scheduling.
+#
+# Usage: python benchmarks/bench_priority.py [nr of cache images] [nr of photos] [max pending images]
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from image_classification import AsyncClassifier, ConnectionPool, MemoryImage, Prioritizer
+from stand_in_server import StandInServer
+
+# A JPEG with an EXIF segment, as written by cameras
+PHOTO_HEADER = b'\xff\xd8\xff\xe1\x00\x10Exif\x00\x00'
+
+
+def make_images(nr_of_cache_images, nr_of_photos):
+    images = []
+    for i in range(nr_of_cache_images):
+        images.append(("/img/Users/john/AppData/Local/Google/Chrome/User Data/Default/Cache/f_%06d.jpg" % i,
+                       MemoryImage("f_%06d.jpg" % i, ".jpg", b'\xff\xd8\xff\xe0' + b'x' * 8 * 1024), False))
+    for i in range(nr_of_photos):
+        images.append(("/img/Users/john/Pictures/DCIM/IMG_%04d.jpg" % i,
+                       MemoryImage("IMG_%04d.jpg" % i, ".jpg", PHOTO_HEADER + b'x' * 512 * 1024), True))
+    return images
+
+
+# Returns the seconds until the last photo was classified and until all the images were
+def run(server, images, prioritizer, max_pending_images):
+    pool = ConnectionPool(server.host, server.port, 4)
+    async_classifier = AsyncClassifier(pool, 4, 2, 8, max_pending_images)
+    remaining_photos = [sum(1 for path, image, is_photo in images if is_photo)]
+    photos_done = threading.Event()
+    lock = threading.Lock()
+
+    def on_photo(detections):
+        with lock:
+            remaining_photos[0] -= 1
+            if remaining_photos[0] == 0:
+                photos_done.set()
+
+    start = time.time()
+    for path, image, is_photo in images:
+        priority = prioritizer.priority(image, path) if prioritizer is not None else 0
+        async_classifier.submit(image, on_photo if is_photo else lambda detections: None, priority)
+    photos_done.wait()
+    photos_time = time.time() - start
+    async_classifier.close()
+    total_time = time.time() - start
+    pool.close()
+    return photos_time, total_time
+
+
+def main():
+    nr_of_cache_images = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    nr_of_photos = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    max_pending_images = int(sys.argv[3]) if len(sys.argv) > 3 else 1000
+    images = make_images(nr_of_cache_images, nr_of_photos)
+    server = StandInServer(latency=0.001, nr_of_gpus=2).start()
+
+    print("%d cache images then %d photos, up to %d pending images" % (nr_of_cache_images, nr_of_photos,
+                                                                       max_pending_images))
+    for name, prioritizer in [("file order", None), ("priority scheduling", Prioritizer())]:
+        photos_time, total_time = run(server, images, prioritizer, max_pending_images)
+        print("%-20s photos classified after %6.2f s, all images after %6.2f s" % (name, photos_time, total_time))
+    server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+# Compares receiving and decoding the results of batch requests as JSON and
+# in the compact binary encoding, on their own and through a local stand-in
+# server.
+#
+# Usage: python benchmarks/bench_results.py [nr of batches] [images per batch] [detections per image]
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from image_classification import BinaryResults, MemoryImage, ServerConnection
+from stand_in_server import StandInServer
+
+CLASS_NAMES = ["person", "bicycle", "car", "motorbike", "dog", "cat"]
+
+
+def make_detections(nr_of_detections):
+    return [{'className': CLASS_NAMES[i % len(CLASS_NAMES)], 'probability': 50 + i % 50,
+             'box': {'x': 10 * i, 'y': 20 * i, 'width': 100 + i, 'height': 200 + i}}
+            for i in range(nr_of_detections)]
+
+
+def time_decoding(nr_of_batches, results):
+    binary_results = BinaryResults(CLASS_NAMES)
+    json_response = json.dumps(results).encode('utf-8')
+    binary_response = binary_results.encode(results)
+
+    start = time.time()
+    for i in range(nr_of_batches):
+        json.loads(json_response.decode('utf-8'))
+    json_time = time.time() - start
+
+    start = time.time()
+    for i in range(nr_of_batches):
+        binary_results.decode(binary_response, len(binary_response), len(results))
+    binary_time = time.time() - start
+    return len(json_response), json_time, len(binary_response), binary_time
+
+
+def time_requests(server, nr_of_batches, nr_of_images, binary_results):
+    connection = ServerConnection(server.host, server.port, binary_results=binary_results)
+    images = [MemoryImage("image.jpg", ".jpg", b"x" * 1024)] * nr_of_images
+    start = time.time()
+    for i in range(nr_of_batches):
+        connection.get_batch_detections(images)
+    elapsed = time.time() - start
+    connection.close()
+    return elapsed
+
+
+def main():
+    nr_of_batches = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    nr_of_images = int(sys.argv[2]) if len(sys.argv) > 2 else 32
+    nr_of_detections = int(sys.argv[3]) if len(sys.argv) > 3 else 5
+    detections = make_detections(nr_of_detections)
+    nr_of_results = nr_of_batches * nr_of_images
+
+    print("%d batches of %d images, %d detections per image" % (nr_of_batches, nr_of_images, nr_of_detections))
+    json_size, json_time, binary_size, binary_time = time_decoding(nr_of_batches, [detections] * nr_of_images)
+    print("decoding  JSON    %6d bytes/batch  %6.2f us/image" % (json_size, json_time / nr_of_results * 1e6))
+    print("decoding  binary  %6d bytes/batch  %6.2f us/image" % (binary_size, binary_time / nr_of_results * 1e6))
+
+    server = StandInServer(detections=detections, class_names=CLASS_NAMES).start()
+    for name, binary_results in [("JSON", None), ("binary", BinaryResults(CLASS_NAMES))]:
+        elapsed = time_requests(server, nr_of_batches, nr_of_images, binary_results)
+        print("requests  %-7s %25.2f us/image" % (name, elapsed / nr_of_results * 1e6))
+    server.stop()
+
+
+if __name__ == '__main__':
+    main()
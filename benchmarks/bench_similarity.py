@@ -0,0 +1,48 @@
+# Looks up near duplicates among the perceptual hashes of many images, with
+# the multi-index hashing of image_classification.similarity and by
+# comparing the hash with all of them.
+#
+# Usage: python benchmarks/bench_similarity.py [nr of hashes] [max distance]
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from image_classification.similarity import HammingIndex, hamming_distance
+
+
+def main():
+    nr_of_hashes = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    max_distance = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    hashes = [random.getrandbits(64) for i in range(nr_of_hashes)]
+    # Half of the lookups are near duplicates of an indexed hash
+    lookups = []
+    for i in range(1000):
+        image_hash = random.choice(hashes) if i % 2 == 0 else random.getrandbits(64)
+        for bit in random.sample(range(64), max_distance):
+            image_hash ^= 1 << bit
+        lookups.append(image_hash)
+
+    start = time.time()
+    index = HammingIndex(max_distance)
+    for i, image_hash in enumerate(hashes):
+        index.add(image_hash, i)
+    print("%d hashes indexed in %.2f s" % (nr_of_hashes, time.time() - start))
+
+    start = time.time()
+    nr_of_matches = sum(len(index.find(image_hash)) for image_hash in lookups)
+    elapsed = time.time() - start
+    print("multi-index hashing  %10.1f us/lookup  %d matches" % (elapsed / len(lookups) * 1e6, nr_of_matches))
+
+    start = time.time()
+    nr_of_matches = 0
+    for image_hash in lookups[:50]:
+        nr_of_matches += sum(1 for other in hashes if hamming_distance(image_hash, other) <= max_distance)
+    elapsed = time.time() - start
+    print("linear scan          %10.1f us/lookup" % (elapsed / 50 * 1e6))
+
+
+if __name__ == '__main__':
+    main()
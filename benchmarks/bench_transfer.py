@@ -0,0 +1,62 @@
+# Measures how fast images are uploaded to a local stand-in server with the
+# previous 1 KB send loop, the reusable large buffer and sendfile.
+#
+# Usage: python benchmarks/bench_transfer.py [image size in MB] [nr of images]
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from image_classification import LocalImage, ServerConnection
+from stand_in_server import StandInServer
+
+
+# Hides the path of the image, as for images read from an Autopsy data source
+class StreamedImage(object):
+
+    def __init__(self, image):
+        self.name = image.name
+        self.extension = image.extension
+        self.size = image.size
+        self.open = image.open
+
+
+def run(server, image, nr_of_images, send_buffer_size, use_sendfile):
+    connection = ServerConnection(server.host, server.port, send_buffer_size=send_buffer_size,
+                                  use_sendfile=use_sendfile)
+    start = time.time()
+    for i in range(nr_of_images):
+        connection.get_detections(image)
+    elapsed = time.time() - start
+    connection.close()
+    return image.size * nr_of_images / elapsed / (1024 * 1024)
+
+
+def main():
+    image_size = int(float(sys.argv[1]) * 1024 * 1024) if len(sys.argv) > 1 else 6 * 1024 * 1024
+    nr_of_images = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+
+    server = StandInServer().start()
+    fd, path = tempfile.mkstemp(suffix='.jpg')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(os.urandom(image_size))
+        image = LocalImage(path)
+
+        print("%d images of %.1f MB" % (nr_of_images, image_size / (1024.0 * 1024)))
+        for name, send_image, send_buffer_size, use_sendfile in [
+                ("1 KB loop (previous)", StreamedImage(image), 1024, False),
+                ("256 KB reused buffer", StreamedImage(image), 256 * 1024, False),
+                ("1 MB reused buffer", StreamedImage(image), 1024 * 1024, False),
+                ("sendfile", image, 256 * 1024, True)]:
+            print("%-22s %8.1f MB/s" % (name, run(server, send_image, nr_of_images, send_buffer_size,
+                                                  use_sendfile)))
+    finally:
+        os.remove(path)
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,387 @@
+# Local stand-in for the image-classification-server, used by the benchmarks.
+# It speaks the same protocol as image_classification.protocol but does no
+# inference: the latency, the errors and the size of the responses are
+# simulated.
+#
+# It can also be run on its own, to point the Autopsy module or the command
+# line at it:
+#   python benchmarks/stand_in_server.py --port 1337 --latency 0.02 --gpus 2
+import argparse
+import json
+import os
+import random
+import socket
+import struct
+import sys
+import threading
+import time
+import zlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from image_classification import BinaryResults
+from image_classification.protocol import HANDSHAKE_MAGIC
+from image_classification.results import BINARY_BATCH_MAGIC
+
+BATCH_MAGIC = b'ICB1'
+COMPRESSED_BATCH_MAGIC = b'ICB3'
+DEFAULT_DETECTIONS = [{"className": "person", "probability": 90}]
+DEFAULT_CLASS_NAMES = ["person", "bicycle", "car", "motorbike", "bus", "truck", "dog", "cat", "cell phone", "laptop"]
+ERROR_RESULT = {"errorCode": "INFERENCE_ERROR", "errorMessage": "Simulated inference error"}
+ACK_OK = 0
+ACK_RESEND = -1
+# The client gives up on an image asked for more than this many times again
+MAX_RESENDS = 3
+
+
+class _Reader(object):
+
+    # 'bandwidth' is the number of bytes per second received, None for no limit
+    def __init__(self, connection, bandwidth=None):
+        self.connection = connection
+        self.bandwidth = bandwidth
+        self.data = b''
+
+    # Returns whatever is available, as the real server does for the
+    # messages that are not length prefixed
+    def recv_some(self):
+        if self.data:
+            data, self.data = self.data, b''
+            return data
+        return self._recv()
+
+    def recv_exactly(self, size):
+        while len(self.data) < size:
+            self.data += self._recv()
+        data, self.data = self.data[:size], self.data[size:]
+        return data
+
+    def recv_int(self):
+        return struct.unpack("!i", self.recv_exactly(4))[0]
+
+    def _recv(self):
+        data = self.connection.recv(64 * 1024 if self.bandwidth else 1024 * 1024)
+        if not data:
+            raise EOFError()
+        if self.bandwidth:
+            time.sleep(float(len(data)) / self.bandwidth)
+        return data
+
+
+class StandInServer(object):
+
+    # Every image is answered after 'latency' seconds, plus up to
+    # 'latency_jitter' seconds picked at random. With 'nr_of_gpus' set, only
+    # that many images are processed at once, the others wait for their turn,
+    # so the server has a fixed service rate as a real one does.
+    #
+    # Errors, each with its own probability:
+    #   'failure_rate'  the request fails by closing its connection
+    #   'error_rate'    an image gets an error object instead of detections
+    #   'resend_rate'   a single image request is asked to be sent again
+    #
+    # Every image gets 'detections', or, with 'nr_of_detections' set to a
+    # number or to a (minimum, maximum) range, that many made up detections
+    # of 'class_names'. 'class_names' also gives the class ids of the binary
+    # encoded results.
+    # 'bandwidth' throttles each connection to that many bytes per second in
+    # each direction, as a slow network link would.
+    # With 'handshake' the server answers the capabilities handshake with
+    # 'model_version', 'class_names' and 'max_batch_size' as the biggest batch,
+    # otherwise it behaves as a server from before the handshake.
+    # With 'close_after_response' every connection is closed once a request
+    # has been answered, as servers that do not keep connections alive do.
+    def __init__(self, host='127.0.0.1', port=0, detections=None, latency=0.0, failure_rate=0.0,
+                 class_names=None, bandwidth=None, latency_jitter=0.0, nr_of_gpus=None, error_rate=0.0,
+                 resend_rate=0.0, nr_of_detections=None, handshake=True, max_batch_size=None,
+                 model_version="1", close_after_response=False):
+        if nr_of_detections is not None:
+            if class_names is None:
+                class_names = DEFAULT_CLASS_NAMES
+            if not isinstance(nr_of_detections, tuple):
+                nr_of_detections = (nr_of_detections, nr_of_detections)
+            results = [make_detections(count, class_names)
+                       for count in range(nr_of_detections[0], nr_of_detections[1] + 1)]
+        else:
+            if detections is None:
+                detections = DEFAULT_DETECTIONS
+            if class_names is None:
+                class_names = sorted(set(detection['className'] for detection in detections))
+            results = [detections]
+        self.binary_results = BinaryResults(class_names)
+        self.handshake = handshake
+        self.close_after_response = close_after_response
+        capabilities = json.dumps({'modelId': "stand-in", 'modelVersion': model_version, 'classNames': class_names,
+                                   'maxBatchSize': max_batch_size, 'encodings': ["json", "binary"],
+                                   'compression': ["zlib"], 'filtering': True}).encode('utf-8')
+        self._capabilities = HANDSHAKE_MAGIC + struct.pack("!i", len(capabilities)) + capabilities
+        # Responses are encoded once, picking one for every image costs nothing
+        self._results = [(result, json.dumps(result).encode('utf-8'), self.binary_results.encode([result]))
+                         for result in results]
+        self._error = (ERROR_RESULT, json.dumps(ERROR_RESULT).encode('utf-8'),
+                       self.binary_results.encode([ERROR_RESULT]))
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.failure_rate = failure_rate
+        self.error_rate = error_rate
+        self.resend_rate = resend_rate
+        self.bandwidth = bandwidth
+        self._gpus = threading.Semaphore(nr_of_gpus) if nr_of_gpus else None
+        self.nr_of_images = 0
+        self.nr_of_failures = 0
+        self.nr_of_errors = 0
+        self.nr_of_resends = 0
+        self.nr_of_bytes_received = 0
+        self.nr_of_bytes_sent = 0
+        self._lock = threading.Lock()
+        self._connections = set()
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind((host, port))
+        self._socket.listen(128)
+        self.host, self.port = self._socket.getsockname()
+
+    def start(self):
+        thread = threading.Thread(target=self._accept)
+        thread.daemon = True
+        thread.start()
+        return self
+
+    # Also drops the open connections, as a server that goes down would
+    def stop(self):
+        # Closing the listening socket alone does not wake up the thread
+        # blocked in accept(), which then keeps accepting connections on Linux
+        try:
+            self._socket.shutdown(socket.SHUT_RDWR)
+        except (socket.error, OSError):
+            pass
+        self._socket.close()
+        self.drop_connections()
+
+    # Closes the open connections, as a server does with idle ones
+    def drop_connections(self):
+        with self._lock:
+            connections = list(self._connections)
+        for connection in connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except (socket.error, OSError):
+                pass
+
+    def _accept(self):
+        while True:
+            try:
+                connection, address = self._socket.accept()
+            except (socket.error, OSError):
+                return
+            thread = threading.Thread(target=self._serve, args=(connection,))
+            thread.daemon = True
+            thread.start()
+
+    def _serve(self, connection):
+        with self._lock:
+            self._connections.add(connection)
+        connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        reader = _Reader(connection, self.bandwidth)
+        try:
+            while True:
+                first_message = reader.recv_some()
+                if self.handshake and first_message.startswith(HANDSHAKE_MAGIC):
+                    reader.data = first_message[len(HANDSHAKE_MAGIC):] + reader.data
+                    self._send(connection, self._capabilities)
+                elif first_message.startswith(BATCH_MAGIC) or first_message.startswith(BINARY_BATCH_MAGIC):
+                    reader.data = first_message[len(BATCH_MAGIC):] + reader.data
+                    self._serve_batch(connection, reader, first_message.startswith(BINARY_BATCH_MAGIC))
+                elif first_message.startswith(COMPRESSED_BATCH_MAGIC):
+                    reader.data = first_message[len(COMPRESSED_BATCH_MAGIC):] + reader.data
+                    self._serve_compressed_batch(connection, reader)
+                else:
+                    self._serve_single(connection, reader)
+                if self.close_after_response:
+                    break
+        except (EOFError, socket.error, OSError):
+            pass
+        finally:
+            with self._lock:
+                self._connections.discard(connection)
+            connection.close()
+
+    # The lockstep exchange of image_classification.protocol: extension, ack,
+    # size, ack, image, ack (-1 to have it sent again), ready, number of
+    # bytes of the response, ready, response
+    def _serve_single(self, connection, reader):
+        connection.sendall(struct.pack("!i", ACK_OK))
+        size = int(reader.recv_some())
+        connection.sendall(struct.pack("!i", ACK_OK))
+        reader.recv_exactly(size)
+        nr_of_resends = 0
+        while nr_of_resends < MAX_RESENDS and self.resend_rate and random.random() < self.resend_rate:
+            nr_of_resends += 1
+            with self._lock:
+                self.nr_of_resends += 1
+            connection.sendall(struct.pack("!i", ACK_RESEND))
+            reader.recv_exactly(size)
+        self._count(1, size)
+        result = self._process(1)[0]
+        connection.sendall(struct.pack("!i", ACK_OK))
+        reader.recv_exactly(1)
+        connection.sendall(struct.pack("!i", len(result[1])))
+        reader.recv_exactly(1)
+        self._send(connection, result[1])
+
+    def _serve_batch(self, connection, reader, binary_results):
+        nr_of_images = reader.recv_int()
+        for i in range(nr_of_images):
+            reader.recv_exactly(reader.recv_int())
+            size = reader.recv_int()
+            reader.recv_exactly(size)
+            self._count(1, size)
+        response = self._encode(self._process(nr_of_images), binary_results)
+        self._send(connection, struct.pack("!i", len(response)) + response)
+
+    def _serve_compressed_batch(self, connection, reader):
+        flags = struct.unpack("!B", reader.recv_exactly(1))[0]
+        server_filter = None
+        if flags & 4:
+            min_probability = struct.unpack("!H", reader.recv_exactly(2))[0]
+            server_filter = (min_probability, bytearray(reader.recv_exactly(reader.recv_int())))
+        nr_of_images = reader.recv_int()
+        for i in range(nr_of_images):
+            reader.recv_exactly(reader.recv_int())
+            encoding = struct.unpack("!B", reader.recv_exactly(1))[0]
+            size = reader.recv_int()
+            data = reader.recv_exactly(reader.recv_int())
+            if encoding == 1 and len(zlib.decompress(data)) != size:
+                raise EOFError()
+            self._count(1, size)
+        results = self._process(nr_of_images)
+        if server_filter is not None:
+            results = [self._filter(result, *server_filter) for result in results]
+        response = self._encode(results, flags & 1)
+        if flags & 2:
+            response = zlib.compress(response)
+        self._send(connection, struct.pack("!i", len(response)) + response)
+
+    # The result with only the detections of the enabled classes, with at
+    # least 'min_probability' hundredths of a percent
+    def _filter(self, result, min_probability, bitmap):
+        detections = result[0]
+        if not isinstance(detections, list):
+            return result
+        class_ids = self.binary_results.class_ids
+        kept = []
+        for detection in detections:
+            class_id = class_ids.get(detection['className'])
+            if class_id is None or class_id // 8 >= len(bitmap) or not bitmap[class_id // 8] & (1 << class_id % 8):
+                continue
+            if int(round(detection['probability'] * 100)) >= min_probability:
+                kept.append(detection)
+        if len(kept) == len(detections):
+            return result
+        return kept, json.dumps(kept).encode('utf-8'), self.binary_results.encode([kept])
+
+    # Batch response made of the encodings of the results
+    def _encode(self, results, binary_results):
+        if binary_results:
+            return b''.join(result[2] for result in results)
+        return b'[' + b','.join(result[1] for result in results) + b']'
+
+    def _send(self, connection, data):
+        if self.bandwidth:
+            time.sleep(float(len(data)) / self.bandwidth)
+        connection.sendall(data)
+        with self._lock:
+            self.nr_of_bytes_sent += len(data)
+
+    # Waits for the simulated inference and returns the results of the images
+    def _process(self, nr_of_images):
+        latency = self.latency * nr_of_images
+        if self.latency_jitter:
+            latency += random.uniform(0, self.latency_jitter) * nr_of_images
+        if latency:
+            if self._gpus is not None:
+                with self._gpus:
+                    time.sleep(latency)
+            else:
+                time.sleep(latency)
+        if self.failure_rate and random.random() < self.failure_rate:
+            with self._lock:
+                self.nr_of_failures += 1
+            raise EOFError()
+        results = []
+        for i in range(nr_of_images):
+            if self.error_rate and random.random() < self.error_rate:
+                results.append(self._error)
+            else:
+                results.append(random.choice(self._results))
+        nr_of_errors = sum(1 for result in results if result is self._error)
+        if nr_of_errors:
+            with self._lock:
+                self.nr_of_errors += nr_of_errors
+        return results
+
+    def _count(self, nr_of_images, nr_of_bytes):
+        with self._lock:
+            self.nr_of_images += nr_of_images
+            self.nr_of_bytes_received += nr_of_bytes
+
+
+# 'nr_of_detections' detections of different classes, spread over a 640x480 image
+def make_detections(nr_of_detections, class_names):
+    detections = []
+    for i in range(nr_of_detections):
+        detections.append({'className': class_names[i % len(class_names)],
+                           'probability': 30 + (i * 37) % 70,
+                           'box': {'x': (i * 53) % 600, 'y': (i * 31) % 440, 'width': 40 + i % 200,
+                                   'height': 40 + (i * 7) % 200}})
+    return detections
+
+
+# "5" or "0:20" to 5 or (0, 20)
+def parse_range(value):
+    if ':' in value:
+        minimum, maximum = value.split(':', 1)
+        return int(minimum), int(maximum)
+    return int(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stand-in for the image-classification-server")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=1337)
+    parser.add_argument('--latency', type=float, default=0.02, help="seconds of inference per image")
+    parser.add_argument('--latency-jitter', type=float, default=0.0, help="random seconds added per image")
+    parser.add_argument('--gpus', type=int, help="images processed at once, unlimited by default")
+    parser.add_argument('--detections', type=parse_range, default=(0, 5), help="detections per image, N or MIN:MAX")
+    parser.add_argument('--failure-rate', type=float, default=0.0, help="probability of dropping a request")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="probability of an error result")
+    parser.add_argument('--resend-rate', type=float, default=0.0, help="probability of asking for an image again")
+    parser.add_argument('--bandwidth', type=float, help="MB/s per connection and direction")
+    parser.add_argument('--max-batch-size', type=int, help="biggest batch told in the handshake")
+    parser.add_argument('--no-handshake', action='store_true', help="behave as a server without the handshake")
+    parser.add_argument('--close-after-response', action='store_true',
+                        help="close every connection once a request is answered")
+    arguments = parser.parse_args()
+
+    server = StandInServer(arguments.host, arguments.port, latency=arguments.latency,
+                           latency_jitter=arguments.latency_jitter, nr_of_gpus=arguments.gpus,
+                           nr_of_detections=arguments.detections, failure_rate=arguments.failure_rate,
+                           error_rate=arguments.error_rate, resend_rate=arguments.resend_rate,
+                           bandwidth=arguments.bandwidth * 1024 * 1024 if arguments.bandwidth else None,
+                           handshake=not arguments.no_handshake, max_batch_size=arguments.max_batch_size,
+                           close_after_response=arguments.close_after_response)
+    server.start()
+    print("Listening on %s:%d, Ctrl-C to stop" % (server.host, server.port))
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    server.stop()
+    print("%d images, %.1f MB received, %.1f MB sent, %d failures, %d errors, %d resends" % (
+        server.nr_of_images, server.nr_of_bytes_received / (1024.0 * 1024), server.nr_of_bytes_sent / (1024.0 * 1024),
+        server.nr_of_failures, server.nr_of_errors, server.nr_of_resends))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,23 @@
+# Plain Python client for the image-classification-server.
+# Nothing in this package depends on Autopsy or Java, so it runs both in
+# Autopsy's Jython interpreter and in a regular CPython interpreter.
+from .images import LocalImage, MemoryImage, restore_detections
+from .results import BinaryResults
+from .compression import Compressor
+from .protocol import ServerConnection, ConnectionClosed, ImageReadError, connection_error
+from .breaker import CircuitBreaker, CircuitOpen
+from .pool import ConnectionPool
+from .balancer import LoadBalancer, NoHealthyServer
+from .batching import BatchBuffer
+from .dispatcher import AsyncClassifier
+from .cache import ResultCache, md5_of_image
+from .store import SharedDetectionStore, KnownFiles, model_key
+from .journal import IngestJournal
+from .prefilter import Prefilter
+from .filtering import ResultFilter, ServerFilter
+from .metrics import IngestMetrics, NullMetrics, NO_METRICS
+from .ratelimit import RateLimiter
+from .limiter import ConcurrencyLimiter
+from .priority import Prioritizer
+from .similarity import NearDuplicateIndex, difference_hash
+from .capabilities import ServerCapabilities, fetch_capabilities, merge_classes_of_interest
@@ -0,0 +1,6 @@
+# Usage: python -m image_classification --help
+import sys
+
+from .cli import main
+
+sys.exit(main())
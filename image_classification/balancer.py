@@ -0,0 +1,223 @@
+# Spreads the requests over several classification servers.
+# It has the same interface as a ConnectionPool, so it can be used wherever
+# a pool of connections to a single server is.
+import logging
+import socket
+import threading
+import time
+
+from .metrics import NO_METRICS
+from .pool import ConnectionPool
+from .protocol import SEND_BUFFER_SIZE
+
+_logger = logging.getLogger(__name__)
+
+# Weight of the last request in the moving average of the latency
+LATENCY_SMOOTHING = 0.2
+
+
+class NoHealthyServer(socket.error):
+    pass
+
+
+class Endpoint(object):
+
+    def __init__(self, host, port, weight=1.0):
+        self.host = host
+        self.port = int(port)
+        self.weight = float(weight)
+        self.pool = None
+        self.healthy = True
+        self.in_flight = 0
+        # Moving average of the seconds taken per image, None until measured
+        self.latency = None
+        self.failures = 0
+
+    @property
+    def name(self):
+        return "%s:%d" % (self.host, self.port)
+
+    # Lower is better: the time the endpoint needs to go through its current
+    # requests and a new one, given the speed measured so far
+    def load(self):
+        return (self.in_flight + 1) * (self.latency or 0.0) / self.weight
+
+    def state(self):
+        return {'endpoint': self.name, 'healthy': self.healthy, 'inFlight': self.in_flight,
+                'latency': self.latency, 'weight': self.weight}
+
+
+class LoadBalancer(object):
+
+    # 'endpoints' is a list of (host, port, weight) tuples, every endpoint has
+    # its own pool of up to 'pool_size' connections.
+    # An endpoint is ejected after 'max_failures' failed requests in a row, or
+    # as soon as a connection to it can not be opened, and then probed every
+    # 'probe_interval' seconds until it accepts connections again.
+    # The timeouts, retries, circuit breaker, result encoding, compression,
+    # concurrency and server filter options apply to the pool of each endpoint (see ConnectionPool),
+    # so the requests in flight are adapted to the latency of every server.
+    def __init__(self, endpoints, pool_size, timeout=None, send_buffer_size=SEND_BUFFER_SIZE,
+                 metrics=NO_METRICS, probe_interval=5.0, max_failures=3, connect_timeout=None,
+                 max_retries=0, failure_threshold=0, reset_timeout=30.0, binary_results=None,
+                 compressor=None, max_concurrency=0, server_filter=None):
+        if not endpoints:
+            raise ValueError("At least one endpoint is needed")
+        self.endpoints = []
+        for host, port, weight in endpoints:
+            endpoint = Endpoint(host, port, weight)
+            endpoint.pool = ConnectionPool(host, port, pool_size, timeout, send_buffer_size, metrics,
+                                           connect_timeout, max_retries, failure_threshold, reset_timeout,
+                                           binary_results, compressor, max_concurrency, server_filter)
+            self.endpoints.append(endpoint)
+        self.size = pool_size * len(self.endpoints)
+        self.metrics = metrics
+        self.probe_interval = probe_interval
+        self.max_failures = max_failures
+        self._owners = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._prober = threading.Thread(target=self._probe, name="image-classification-prober")
+        self._prober.daemon = True
+        self._prober.start()
+
+    # Takes a connection to the least loaded healthy endpoint
+    def acquire(self):
+        tried = set()
+        error = None
+        while True:
+            endpoint = self._choose(tried, error)
+            tried.add(endpoint)
+            try:
+                connection = endpoint.pool.acquire()
+            except socket.error as e:
+                self._done(endpoint)
+                self._eject(endpoint, e)
+                error = e
+                continue
+            with self._lock:
+                self._owners[connection] = endpoint
+            return connection
+
+    def release(self, connection):
+        with self._lock:
+            endpoint = self._owners.pop(connection)
+        # A connection the server dropped while idle, or an image that could
+        # not be read, does not count against it
+        if connection.server_failed:
+            self._failed(endpoint, socket.error("Connection to " + endpoint.name + " broken"))
+        self._done(endpoint)
+        endpoint.pool.release(connection)
+
+    # Runs operation(connection) on the least loaded healthy endpoint.
+    # If it fails the operation is run on the next endpoint, until every
+    # healthy endpoint has been tried. Other errors, e.g. a response that can
+    # not be decoded, are raised right away.
+    def run(self, operation, nr_of_images=1):
+        tried = set()
+        error = None
+        while True:
+            endpoint = self._choose(tried, error)
+            tried.add(endpoint)
+            start_time = time.time()
+            try:
+                result = endpoint.pool.run(operation)
+            except socket.error as e:
+                self._done(endpoint)
+                self._failed(endpoint, e)
+                error = e
+                continue
+            except Exception:
+                self._done(endpoint)
+                raise
+            if error is not None:
+                self.metrics.increment('failovers')
+            self._done(endpoint, (time.time() - start_time) / max(1, nr_of_images))
+            return result
+
+    # Takes the latency of the last response of a connection held outside of
+    # run(), e.g. by an asynchronous worker, into the load of its endpoint
+    def record_latency(self, connection):
+        with self._lock:
+            endpoint = self._owners.get(connection)
+            if endpoint is not None and connection.latency is not None:
+                self._measured(endpoint, connection.latency)
+
+    def get_detections(self, image):
+        return self.run(lambda connection: connection.get_detections(image))
+
+    def get_batch_detections(self, images):
+        return self.run(lambda connection: connection.get_batch_detections(images), len(images))
+
+    def state(self):
+        with self._lock:
+            return [endpoint.state() for endpoint in self.endpoints]
+
+    def close(self):
+        self._stopped.set()
+        for endpoint in self.endpoints:
+            endpoint.pool.close()
+
+    # Picks the healthy endpoint with the lowest load among the ones with a
+    # free connection, or among all of them when every pool is busy.
+    # When every endpoint was tried the error of the last one is raised.
+    def _choose(self, tried, error):
+        with self._lock:
+            candidates = [endpoint for endpoint in self.endpoints
+                          if endpoint.healthy and endpoint not in tried]
+            if not candidates:
+                if error is not None:
+                    raise error
+                raise NoHealthyServer("No classification server is available")
+            free = [endpoint for endpoint in candidates if endpoint.in_flight < endpoint.pool.size]
+            endpoint = min(free or candidates, key=lambda endpoint: (endpoint.load(), endpoint.in_flight))
+            endpoint.in_flight += 1
+            return endpoint
+
+    def _done(self, endpoint, latency=None):
+        with self._lock:
+            endpoint.in_flight -= 1
+            if latency is not None:
+                self._measured(endpoint, latency)
+
+    # Called with the lock held
+    def _measured(self, endpoint, latency):
+        endpoint.failures = 0
+        if endpoint.latency is None:
+            endpoint.latency = latency
+        else:
+            endpoint.latency += LATENCY_SMOOTHING * (latency - endpoint.latency)
+
+    def _failed(self, endpoint, error):
+        with self._lock:
+            endpoint.failures += 1
+            if endpoint.failures < self.max_failures:
+                return
+        self._eject(endpoint, error)
+
+    def _eject(self, endpoint, error):
+        with self._lock:
+            if not endpoint.healthy:
+                return
+            endpoint.healthy = False
+        self.metrics.increment('ejections')
+        _logger.warning("Ejecting classification server %s: %s", endpoint.name, error)
+
+    # Brings back the ejected endpoints that accept connections again
+    def _probe(self):
+        while not self._stopped.wait(self.probe_interval):
+            for endpoint in self.endpoints:
+                if endpoint.healthy:
+                    continue
+                try:
+                    probe_socket = socket.create_connection((endpoint.host, endpoint.port),
+                                                            min(self.probe_interval, 1.0))
+                except socket.error:
+                    continue
+                probe_socket.close()
+                with self._lock:
+                    endpoint.healthy = True
+                    endpoint.failures = 0
+                    # Measured again, as the server may have been replaced
+                    endpoint.latency = None
+                _logger.info("Classification server %s is back", endpoint.name)
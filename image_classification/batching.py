@@ -0,0 +1,57 @@
+# Groups items so they can be sent to the server in a single request.
+import threading
+
+
+class BatchBuffer(object):
+
+    # 'flush_callback' is called with the list of buffered items once the
+    # buffer holds 'max_size' items or its oldest item is 'max_age' seconds old.
+    # It is called from the thread that adds the last item or, for the age
+    # limit, from a timer thread.
+    def __init__(self, flush_callback, max_size, max_age):
+        if max_size < 1:
+            raise ValueError("The batch size must be at least 1")
+        self.flush_callback = flush_callback
+        self.max_size = max_size
+        self.max_age = max_age
+        self._items = []
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def add(self, item):
+        with self._lock:
+            self._items.append(item)
+            if len(self._items) == 1:
+                self._start_timer()
+            if len(self._items) < self.max_size:
+                return
+            items = self._take_items()
+        self.flush_callback(items)
+
+    # Flushes the buffered items regardless of the limits
+    def flush(self):
+        with self._lock:
+            items = self._take_items()
+        if items:
+            self.flush_callback(items)
+
+    def _take_items(self):
+        items = self._items
+        self._items = []
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        return items
+
+    def _start_timer(self):
+        self._timer = threading.Timer(self.max_age, self._on_timer)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _on_timer(self):
+        with self._lock:
+            # A timer that was cancelled too late belongs to an already flushed batch
+            if threading.current_thread() is not self._timer:
+                return
+            items = self._take_items()
+        self.flush_callback(items)
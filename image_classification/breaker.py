@@ -0,0 +1,82 @@
+# Circuit breaker that stops sending requests to a server that keeps failing,
+# so the ingest threads fail fast instead of each waiting for a timeout.
+import random
+import socket
+import threading
+import time
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half open'
+
+
+class CircuitOpen(socket.error):
+    pass
+
+
+# Seconds to wait before the given retry (1 for the first one): a random time
+# up to an exponentially growing limit, so the clients that failed together
+# do not all retry at the same moment
+def backoff_delay(retry, base=0.1, cap=5.0):
+    return random.uniform(0, min(cap, base * 2 ** (retry - 1)))
+
+
+class CircuitBreaker(object):
+
+    # The circuit opens after 'failure_threshold' failures in a row. While it
+    # is open requests are refused, and 'reset_timeout' seconds later a single
+    # request is let through to test the server: the circuit closes again if
+    # it succeeds and stays open for another 'reset_timeout' if it fails.
+    # A threshold of 0 or less never opens the circuit.
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self._failures = 0
+        self._opened_time = 0
+        self._lock = threading.Lock()
+
+    # Whether a request can be sent now
+    def allow(self):
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.time() - self._opened_time >= self.reset_timeout:
+                self.state = HALF_OPEN
+                return True
+            return False
+
+    # Raises CircuitOpen if no request can be sent now
+    def check(self):
+        if not self.allow():
+            raise CircuitOpen("Server failing, requests are refused for up to %g seconds" % self.reset_timeout)
+
+    def success(self):
+        with self._lock:
+            self._failures = 0
+            self.state = CLOSED
+
+    def failure(self):
+        if self.failure_threshold <= 0:
+            return
+        with self._lock:
+            self._failures += 1
+            if self.state == HALF_OPEN or self._failures >= self.failure_threshold:
+                self.state = OPEN
+                self._opened_time = time.time()
+
+
+# Breaker that never opens, used when none is given
+class NullCircuitBreaker(CircuitBreaker):
+
+    def __init__(self):
+        CircuitBreaker.__init__(self, 0)
+
+    def allow(self):
+        return True
+
+    def success(self):
+        pass
+
+
+NO_BREAKER = NullCircuitBreaker()
@@ -0,0 +1,165 @@
+# Persistent cache of the server responses, keyed by the hash of the image
+# content, so byte identical images are only classified once.
+import hashlib
+import json
+import threading
+
+try:
+    import sqlite3
+except ImportError:
+    # Jython has no sqlite3 module, use the SQLite JDBC driver shipped with Autopsy
+    sqlite3 = None
+
+try:
+    integer_types = (int, long)
+except NameError:
+    integer_types = (int,)
+
+HASH_READ_SIZE = 1024 * 1024
+
+
+def md5_of_image(image):
+    md5 = hashlib.md5()
+    f = image.open()
+    try:
+        data = f.read(HASH_READ_SIZE)
+        while data:
+            md5.update(data)
+            data = f.read(HASH_READ_SIZE)
+    finally:
+        f.close()
+    return md5.hexdigest()
+
+
+class _Sqlite3Database(object):
+
+    def __init__(self, path):
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+
+    def execute(self, sql, parameters=()):
+        return self._connection.execute(sql, parameters).fetchall()
+
+    def close(self):
+        self._connection.close()
+
+
+class _JdbcDatabase(object):
+
+    def __init__(self, path):
+        from java.lang import Class
+        from java.sql import DriverManager
+        Class.forName("org.sqlite.JDBC").newInstance()
+        self._connection = DriverManager.getConnection("jdbc:sqlite:" + path)
+
+    def execute(self, sql, parameters=()):
+        statement = self._connection.prepareStatement(sql)
+        try:
+            for index, parameter in enumerate(parameters):
+                if isinstance(parameter, integer_types):
+                    statement.setLong(index + 1, parameter)
+                else:
+                    statement.setString(index + 1, parameter)
+            if not statement.execute():
+                return []
+            rows = []
+            result_set = statement.getResultSet()
+            nr_of_columns = result_set.getMetaData().getColumnCount()
+            while result_set.next():
+                rows.append(tuple(result_set.getObject(i + 1) for i in range(nr_of_columns)))
+            result_set.close()
+            return rows
+        finally:
+            statement.close()
+
+    def close(self):
+        self._connection.close()
+
+
+def open_database(path):
+    if sqlite3 is not None:
+        return _Sqlite3Database(path)
+    return _JdbcDatabase(path)
+
+
+class ResultCache(object):
+
+    # Holds at most 'max_entries' responses, the least recently used ones are
+    # evicted first.
+    # 'model_key' identifies the model the responses come from: the cache is
+    # emptied when it is opened with another one.
+    def __init__(self, path, max_entries, model_key=None):
+        if max_entries < 1:
+            raise ValueError("The cache must hold at least one entry")
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._database = open_database(path)
+        self._database.execute("PRAGMA journal_mode=WAL")
+        self._database.execute("PRAGMA synchronous=NORMAL")
+        self._database.execute("CREATE TABLE IF NOT EXISTS detections ("
+                               "hash TEXT PRIMARY KEY, "
+                               "response TEXT NOT NULL, "
+                               "last_used INTEGER NOT NULL)")
+        self._database.execute("CREATE INDEX IF NOT EXISTS detections_last_used ON detections (last_used)")
+        if model_key is not None:
+            self._check_model(model_key)
+        self._nr_of_entries, last_used = self._database.execute(
+            "SELECT COUNT(*), COALESCE(MAX(last_used), 0) FROM detections")[0]
+        self._nr_of_entries = int(self._nr_of_entries)
+        # Increasing counter used as the LRU clock
+        self._clock = int(last_used)
+
+    def _check_model(self, model_key):
+        self._database.execute("CREATE TABLE IF NOT EXISTS settings (name TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        rows = self._database.execute("SELECT value FROM settings WHERE name = 'model'")
+        if rows and rows[0][0] == model_key:
+            return
+        # Responses cached before the model was recorded are dropped as well
+        self._database.execute("DELETE FROM detections")
+        self._database.execute("INSERT OR REPLACE INTO settings (name, value) VALUES ('model', ?)", (model_key,))
+
+    # Returns the cached detections of the image or None
+    def get(self, content_hash):
+        with self._lock:
+            rows = self._database.execute("SELECT response FROM detections WHERE hash = ?", (content_hash,))
+            if not rows:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._clock += 1
+            self._database.execute("UPDATE detections SET last_used = ? WHERE hash = ?",
+                                   (self._clock, content_hash))
+        return json.loads(rows[0][0])
+
+    def put(self, content_hash, detections):
+        response = json.dumps(detections)
+        with self._lock:
+            self._clock += 1
+            updated = self._database.execute("SELECT 1 FROM detections WHERE hash = ?", (content_hash,))
+            self._database.execute("INSERT OR REPLACE INTO detections (hash, response, last_used) VALUES (?, ?, ?)",
+                                   (content_hash, response, self._clock))
+            if not updated:
+                self._nr_of_entries += 1
+            if self._nr_of_entries > self.max_entries:
+                self._evict()
+
+    # Evicts a tenth of the entries at once, so eviction does not run on every put
+    def _evict(self):
+        nr_of_entries_to_evict = self._nr_of_entries - self.max_entries + max(1, self.max_entries // 10)
+        nr_of_entries_to_evict = min(nr_of_entries_to_evict, self._nr_of_entries)
+        self._database.execute("DELETE FROM detections WHERE hash IN "
+                               "(SELECT hash FROM detections ORDER BY last_used LIMIT ?)",
+                               (nr_of_entries_to_evict,))
+        self._nr_of_entries -= nr_of_entries_to_evict
+
+    def hit_ratio(self):
+        lookups = self.hits + self.misses
+        if lookups == 0:
+            return 0.0
+        return float(self.hits) / lookups
+
+    def close(self):
+        with self._lock:
+            self._database.close()
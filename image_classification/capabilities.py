@@ -0,0 +1,87 @@
+# What a classification server runs and supports, asked once per ingest job
+# with the handshake of the protocol (see protocol.py), so requests are only
+# made in the ways the server understands and the stored responses are kept
+# under the model that gave them.
+from .protocol import ServerConnection
+
+ENCODING_BINARY = 'binary'
+COMPRESSION_ZLIB = 'zlib'
+
+
+class ServerCapabilities(object):
+
+    # 'class_names' are the classes the model detects, in the order of their
+    # ids. A 'max_batch_size' of None puts no limit on the batch requests.
+    # 'filtering' tells whether the server filters the detections it sends.
+    def __init__(self, model_id, model_version, class_names, max_batch_size=None, encodings=('json',),
+                 compression=(), filtering=False):
+        self.model_id = model_id
+        self.model_version = model_version
+        self.class_names = list(class_names)
+        self.max_batch_size = max_batch_size
+        self.encodings = list(encodings)
+        self.compression = list(compression)
+        self.filtering = filtering
+
+    # From the JSON object of the handshake, where only the class list is required
+    @classmethod
+    def from_dict(cls, capabilities):
+        class_names = capabilities.get('classNames')
+        if not isinstance(class_names, list):
+            raise ValueError("Capabilities of the server have no class list")
+        return cls(capabilities.get('modelId') or "", capabilities.get('modelVersion') or "", class_names,
+                   int(capabilities.get('maxBatchSize') or 0) or None, capabilities.get('encodings', ['json']),
+                   capabilities.get('compression', []), bool(capabilities.get('filtering', False)))
+
+    # Name and version of the model, which the cached responses are kept under
+    @property
+    def model(self):
+        return ("%s %s" % (self.model_id, self.model_version)).strip()
+
+    def supports_binary_results(self):
+        return ENCODING_BINARY in self.encodings
+
+    def supports_compression(self):
+        return COMPRESSION_ZLIB in self.compression
+
+    def supports_filtering(self):
+        return self.filtering
+
+    # Batch size to use instead of the one asked for
+    def batch_size(self, batch_size):
+        if self.max_batch_size is None:
+            return batch_size
+        return max(1, min(batch_size, self.max_batch_size))
+
+    # The names of 'class_names' the model does not detect
+    def unknown_classes(self, class_names):
+        known_classes = frozenset(self.class_names)
+        return [name for name in class_names if name not in known_classes]
+
+    def to_dict(self):
+        return {'modelId': self.model_id, 'modelVersion': self.model_version, 'classNames': self.class_names,
+                'maxBatchSize': self.max_batch_size, 'encodings': self.encodings, 'compression': self.compression,
+                'filtering': self.filtering}
+
+
+# Asks the server for its capabilities on a connection of its own.
+# Returns None for a server that does not know the handshake and raises
+# socket.error if the server can not be reached.
+def fetch_capabilities(host, port, timeout=None):
+    connection = ServerConnection(host, port, timeout)
+    try:
+        capabilities = connection.get_capabilities()
+    finally:
+        connection.close()
+    if capabilities is None:
+        return None
+    return ServerCapabilities.from_dict(capabilities)
+
+
+# Classes of interest for the classes of the model, in the same order:
+# the classes already in 'classes_of_interest' keep whether they are enabled,
+# the new ones are enabled and the ones the model does not detect are dropped
+def merge_classes_of_interest(classes_of_interest, class_names):
+    enabled = dict((class_of_interest['name'], class_of_interest['enabled'])
+                   for class_of_interest in classes_of_interest)
+    return [{'name': name, 'enabled': enabled.get(name, True)} for name in class_names]
@@ -0,0 +1,475 @@
+# Classifies the images of a directory tree, or of a list of files, from the
+# command line, with the same client as the Autopsy module:
+#
+#   python -m image_classification [options] PATH...
+#
+# It reads the configs.json of the module and writes one JSON object per
+# file to the output (JSON Lines):
+#   {"path": ..., "detections": [...]}       classified, or found in the cache
+#                                            or the shared detection store
+#                                            with "cached": true, or reused
+#                                            from a near duplicate with
+#                                            "nearDuplicateOf": <path>
+#   {"path": ..., "error": {...}}            could not be classified
+#   {"path": ..., "skipped": "<reason>"}     rejected by the prefilter
+# Only the files with one of the configured image extensions are considered.
+# The throughput is reported on the standard error.
+import argparse
+import io
+import json
+import os
+import sys
+import threading
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+from .balancer import LoadBalancer
+from .cache import ResultCache, md5_of_image
+from .capabilities import fetch_capabilities
+from .compression import Compressor
+from .dispatcher import AsyncClassifier
+from .filtering import ResultFilter
+from .images import LocalImage, MemoryImage, restore_detections
+from .metrics import IngestMetrics
+from .pool import ConnectionPool
+from .prefilter import Prefilter
+from .priority import Prioritizer
+from .protocol import SEND_BUFFER_SIZE, connection_error
+from .results import BinaryResults
+from .store import KnownFiles, SharedDetectionStore, model_key
+from .similarity import NearDuplicateIndex, THUMBNAIL_SIDE, difference_hash
+
+# Optional, only used to downscale the images before sending them and to find
+# their near duplicates
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+DEFAULT_CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'configs.json')
+# The same cache file as the Autopsy module, so what is classified here is
+# not classified again by the module
+CACHE_FILE_NAME = 'detections_cache.db'
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 1337
+DEFAULT_POOL_SIZE = 4
+DEFAULT_REQUESTS_IN_FLIGHT = 2
+DEFAULT_IMAGES_FORMAT = ["jpg", "png", "jpeg"]
+DEFAULT_MIN_FILE_SIZE = 5
+DEFAULT_MIN_PROBABILITY = 50
+DEFAULT_MIN_IMAGE_SIDE = 32
+DEFAULT_CACHE_MAX_ENTRIES = 1000000
+DEFAULT_PROGRESS_INTERVAL = 10
+DEFAULT_MAX_PENDING_IMAGES = 1000
+DEFAULT_NEAR_DUPLICATE_MAX_DISTANCE = 4
+
+_STOP = object()
+
+
+def load_config(path):
+    if not os.path.isfile(path):
+        return {}
+    with io.open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+# (host, port, weight) of every configured server
+def server_endpoints(config):
+    server = config.get('server', {})
+    endpoints = [(server.get('host', DEFAULT_HOST), int(server.get('port', DEFAULT_PORT)), 1.0)]
+    for endpoint in server.get('endpoints', []):
+        if (endpoint['host'], int(endpoint['port'])) != endpoints[0][:2]:
+            endpoints.append((endpoint['host'], int(endpoint['port']), float(endpoint.get('weight', 1.0))))
+    return endpoints
+
+
+# Capabilities of the first configured server that answers the handshake,
+# or None if none does
+def get_capabilities(config):
+    timeout = config.get('server', {}).get('connectTimeout')
+    for host, port, weight in server_endpoints(config):
+        try:
+            capabilities = fetch_capabilities(host, port, timeout)
+        except (IOError, ValueError) as e:
+            sys.stderr.write("Capabilities of server %s:%d not received: %s\n" % (host, port, e))
+            continue
+        if capabilities is not None:
+            return capabilities
+    return None
+
+
+# Connection pool, or load balancer when several servers are configured,
+# with the server options of the configuration. With adaptive concurrency
+# the requests in flight to every server go up to 'max_concurrency'.
+# The binary results and the compression are only asked for from a server
+# whose 'capabilities' include them. 'server_filter' is sent with every request.
+def create_pool(config, pool_size, metrics, max_concurrency=0, capabilities=None, server_filter=None):
+    server = config.get('server', {})
+    endpoints = server_endpoints(config)
+
+    binary_results = None
+    if server.get('binaryResults', False):
+        if capabilities is None:
+            binary_results = BinaryResults([class_of_interest['name']
+                                            for class_of_interest in config.get('classesOfInterest', [])])
+        elif capabilities.supports_binary_results():
+            binary_results = BinaryResults(capabilities.class_names)
+    compressor = None
+    if server.get('compression', False) and (capabilities is None or capabilities.supports_compression()):
+        compressor = Compressor(metrics=metrics)
+    options = {
+        'connect_timeout': server.get('connectTimeout'),
+        'max_retries': int(server.get('maxRetries', 0)),
+        'failure_threshold': int(server.get('failureThreshold', 0)),
+        'reset_timeout': float(server.get('resetTimeout', 30.0)),
+        'binary_results': binary_results,
+        'compressor': compressor,
+        'send_buffer_size': int(config.get('sendBufferSize', SEND_BUFFER_SIZE)),
+        'max_concurrency': max_concurrency if server.get('adaptiveConcurrency', True) else 0,
+        'server_filter': server_filter,
+    }
+    timeout = server.get('readTimeout')
+    if len(endpoints) > 1:
+        return LoadBalancer(endpoints, pool_size, timeout, metrics=metrics,
+                            probe_interval=float(server.get('probeInterval', 5.0)), **options)
+    host, port, weight = endpoints[0]
+    return ConnectionPool(host, port, pool_size, timeout, metrics=metrics, **options)
+
+
+# Yields the files of the given files and directories, then of the list file
+def iter_paths(paths, file_list=None):
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+        for directory, directory_names, file_names in os.walk(path):
+            directory_names.sort()
+            for file_name in sorted(file_names):
+                yield os.path.join(directory, file_name)
+    if file_list is not None:
+        f = sys.stdin if file_list == '-' else io.open(file_list, 'r', encoding='utf-8')
+        try:
+            for line in f:
+                line = line.rstrip('\r\n')
+                if line:
+                    yield line
+        finally:
+            if f is not sys.stdin:
+                f.close()
+
+
+# Returns a smaller JPEG copy of the image if its longest side is over
+# 'max_side' pixels, or the image itself
+def downscale(image, max_side):
+    try:
+        picture = Image.open(image.path)
+        width, height = picture.size
+        if max(width, height) <= max_side:
+            return image
+        # Lets the JPEG decoder skip most of the pixels
+        picture.draft('RGB', (max_side, max_side))
+        picture = picture.convert('RGB')
+        picture.thumbnail((max_side, max_side), Image.BILINEAR)
+        output = io.BytesIO()
+        picture.save(output, 'JPEG')
+    except (IOError, OSError, ValueError):
+        return image
+    return MemoryImage(image.name, '.jpg', output.getvalue(), float(picture.size[0]) / width)
+
+
+# Returns the (perceptual hash, width, height) of the image, or None if it
+# can not be decoded
+def perceptual_hash(image):
+    try:
+        picture = Image.open(image.path)
+        width, height = picture.size
+        picture.draft('L', (2 * THUMBNAIL_SIDE, 2 * THUMBNAIL_SIDE))
+        thumbnail = picture.convert('L').resize((THUMBNAIL_SIDE, THUMBNAIL_SIDE), Image.BILINEAR)
+    except (IOError, OSError, ValueError):
+        return None
+    return difference_hash(list(thumbnail.getdata()), THUMBNAIL_SIDE, THUMBNAIL_SIDE), width, height
+
+
+class BulkClassifier(object):
+
+    # 'nr_of_workers' threads read, prefilter and hash the files and send them
+    # to the server. With a 'batch_size' over 1 the images are sent in
+    # pipelined batch requests instead, the most valuable images first.
+    def __init__(self, config, output, nr_of_workers, batch_size=1, requests_in_flight=DEFAULT_REQUESTS_IN_FLIGHT,
+                 use_cache=True, unfiltered=False, progress_interval=DEFAULT_PROGRESS_INTERVAL,
+                 cache_location=None):
+        self.output = output
+        self.nr_of_workers = nr_of_workers
+        self.unfiltered = unfiltered
+        self.progress_interval = progress_interval
+        self.metrics = IngestMetrics()
+        self.prefilter = Prefilter(config.get('imageFormats', DEFAULT_IMAGES_FORMAT),
+                                   config.get('minFileSize', DEFAULT_MIN_FILE_SIZE) * 1024,
+                                   config.get('minImageSide', DEFAULT_MIN_IMAGE_SIDE))
+        self.result_filter = ResultFilter(config.get('minProbability', DEFAULT_MIN_PROBABILITY),
+                                          config.get('classesOfInterest', []))
+        self.downscale_max_side = config.get('downscaleMaxSide', 0)
+        if self.downscale_max_side > 0 and Image is None:
+            sys.stderr.write("PIL is not installed, the images are sent without being downscaled\n")
+            self.downscale_max_side = 0
+        self.near_duplicates = None
+        if config.get('nearDuplicates', False):
+            if Image is None:
+                sys.stderr.write("PIL is not installed, near duplicates are classified again\n")
+            else:
+                self.near_duplicates = NearDuplicateIndex(config.get('nearDuplicateMaxDistance',
+                                                                     DEFAULT_NEAR_DUPLICATE_MAX_DISTANCE))
+        # Servers from before the handshake are taken to run the configured
+        # model version, and to detect the classes of interest in their order
+        self.capabilities = get_capabilities(config)
+        model_version = config.get('modelVersion', "")
+        class_names = [class_of_interest['name'] for class_of_interest in config.get('classesOfInterest', [])]
+        if self.capabilities is not None:
+            model_version = self.capabilities.model
+            class_names = self.capabilities.class_names
+            batch_size = self.capabilities.batch_size(batch_size)
+        self.cache = None
+        self.shared_store = None
+        if use_cache and config.get('cacheEnabled', True):
+            if cache_location is None:
+                cache_location = os.path.join(os.path.dirname(DEFAULT_CONFIG_PATH), CACHE_FILE_NAME)
+            self.cache = ResultCache(cache_location, config.get('cacheMaxEntries', DEFAULT_CACHE_MAX_ENTRIES),
+                                     model_key(model_version, class_names))
+        if use_cache and config.get('sharedStorePath'):
+            self.shared_store = SharedDetectionStore(config['sharedStorePath'], model_version, class_names)
+        # The detections the result filter would drop are not even sent by a
+        # server that can filter them, unless all of them are written out or
+        # kept in the cache or the shared store, which serve other filters too
+        self.server_filter = None
+        if not unfiltered and self.cache is None and self.shared_store is None and \
+                config.get('server', {}).get('filtering', True) and \
+                self.capabilities is not None and self.capabilities.supports_filtering():
+            self.server_filter = self.result_filter.server_filter(class_names)
+        self.known_files = None
+        if config.get('knownFilesPath'):
+            self.known_files = KnownFiles(config['knownFilesPath'])
+        self.pool = create_pool(config, nr_of_workers, self.metrics,
+                                nr_of_workers * (requests_in_flight if batch_size > 1 else 1), self.capabilities,
+                                self.server_filter)
+        self.async_classifier = None
+        self.prioritizer = None
+        if batch_size > 1:
+            max_pending_images = None
+            if config.get('priorityScheduling', True):
+                self.prioritizer = Prioritizer(config.get('highValuePaths'), config.get('lowValuePaths'))
+                max_pending_images = int(config.get('maxPendingImages', DEFAULT_MAX_PENDING_IMAGES))
+            self.async_classifier = AsyncClassifier(self.pool, nr_of_workers, requests_in_flight, batch_size,
+                                                    max_pending_images)
+        self._output_lock = threading.Lock()
+
+    def classify(self, paths):
+        work_queue = queue.Queue(self.nr_of_workers * 16)
+        workers = []
+        for i in range(self.nr_of_workers):
+            worker = threading.Thread(target=self._work, args=(work_queue,))
+            worker.daemon = True
+            worker.start()
+            workers.append(worker)
+        for path in paths:
+            if self.prefilter.has_image_extension(path):
+                work_queue.put(path)
+        for worker in workers:
+            work_queue.put(_STOP)
+        for worker in workers:
+            worker.join()
+        if self.async_classifier is not None:
+            self.async_classifier.close()
+
+    def close(self):
+        self.pool.close()
+        if self.cache is not None:
+            self.cache.close()
+        self.output.flush()
+
+    def _work(self, work_queue):
+        while True:
+            path = work_queue.get()
+            if path is _STOP:
+                return
+            try:
+                self._process(path)
+            except Exception as e:
+                self.metrics.increment('errors')
+                self._emit({'path': path, 'error': connection_error(e)})
+            if self.progress_interval > 0 and self.metrics.is_snapshot_due(self.progress_interval):
+                sys.stderr.write(format_summary(self.metrics.snapshot()) + "\n")
+
+    def _process(self, path):
+        self.metrics.increment('files')
+        try:
+            image = LocalImage(path)
+            with self.metrics.timer('prefilter'):
+                skip_reason = self.prefilter.check(image)
+        except (IOError, OSError) as e:
+            self.metrics.increment('readErrors')
+            self._emit({'path': path, 'error': {'errorCode': 'READ_ERROR', 'errorMessage': str(e)}})
+            return
+        if skip_reason is not None:
+            self.metrics.skipped(skip_reason)
+            self._emit({'path': path, 'skipped': skip_reason})
+            return
+
+        file_hash = None
+        if self.cache is not None or self.shared_store is not None or self.known_files is not None:
+            with self.metrics.timer('hash'):
+                file_hash = md5_of_image(image)
+            if self.known_files is not None and file_hash in self.known_files:
+                self.metrics.skipped('known file')
+                self._emit({'path': path, 'skipped': 'known file'})
+                return
+            detections = self._get_stored_detections(file_hash)
+            if detections is not None:
+                self._emit_detections(path, detections, cached=True)
+                return
+
+        image_hash = None
+        if self.near_duplicates is not None:
+            with self.metrics.timer('perceptualHash'):
+                image_hash = perceptual_hash(image)
+            if image_hash is not None:
+                near_duplicate = self.near_duplicates.find(*image_hash)
+                if near_duplicate is not None:
+                    self.metrics.increment('nearDuplicates')
+                    self._emit_detections(path, near_duplicate[2], near_duplicate_of=near_duplicate[0])
+                    return
+
+        image_priority = 0
+        if self.prioritizer is not None:
+            with self.metrics.timer('priority'):
+                image_priority = self.prioritizer.priority(image, path)
+
+        if self.downscale_max_side > 0:
+            with self.metrics.timer('downscale'):
+                image = downscale(image, self.downscale_max_side)
+
+        if self.async_classifier is not None:
+            self.async_classifier.submit(
+                image, lambda detections: self._handle(path, image, file_hash, image_hash, detections),
+                image_priority)
+            return
+        with self.metrics.timer('request'):
+            try:
+                detections = self.pool.get_detections(image)
+            except Exception as e:
+                detections = connection_error(e)
+        self._handle(path, image, file_hash, image_hash, detections)
+
+    # Looks the image up in the local cache, then in the shared store
+    def _get_stored_detections(self, file_hash):
+        if self.cache is not None:
+            with self.metrics.timer('cache'):
+                detections = self.cache.get(file_hash)
+            if detections is not None:
+                self.metrics.increment('cacheHits')
+                return detections
+        if self.shared_store is not None:
+            with self.metrics.timer('sharedStore'):
+                detections = self.shared_store.get(file_hash)
+            if detections is not None:
+                self.metrics.increment('sharedStoreHits')
+                if self.cache is not None:
+                    self.cache.put(file_hash, detections)
+                return detections
+        return None
+
+    def _handle(self, path, image, file_hash, image_hash, detections):
+        detections = restore_detections(detections, getattr(image, 'scale', 1.0))
+        if not isinstance(detections, list):
+            self.metrics.increment('errors')
+            self._emit({'path': path, 'error': detections})
+            return
+        self.metrics.increment('imagesClassified')
+        if file_hash is not None:
+            if self.cache is not None:
+                self.cache.put(file_hash, detections)
+            # The image is classified all the same, only the other cases miss its detections
+            if self.shared_store is not None:
+                try:
+                    self.shared_store.put(file_hash, detections)
+                except (IOError, OSError) as e:
+                    self.metrics.increment('sharedStoreErrors')
+                    sys.stderr.write("Error writing to the shared detection store: %s\n" % e)
+        if image_hash is not None:
+            self.near_duplicates.add(image_hash[0], path, image_hash[1], image_hash[2], detections)
+        self._emit_detections(path, detections)
+
+    def _emit_detections(self, path, detections, cached=False, near_duplicate_of=None):
+        if not self.unfiltered:
+            detections = self.result_filter.filter(detections)
+        record = {'path': path, 'detections': detections}
+        if cached:
+            record['cached'] = True
+        if near_duplicate_of is not None:
+            record['nearDuplicateOf'] = near_duplicate_of
+        self._emit(record)
+
+    def _emit(self, record):
+        line = json.dumps(record)
+        with self._output_lock:
+            self.output.write(line + "\n")
+
+
+def format_summary(snapshot):
+    counters = snapshot['counters']
+    elapsed = snapshot['elapsedSeconds']
+    megabytes_per_second = counters.get('bytesSent', 0) / (1024.0 * 1024) / elapsed if elapsed > 0 else 0.0
+    return "%d files, %d images classified (%.1f images/s, %.1f MB/s sent), %d from cache, " \
+           "%d near duplicates, %d skipped, %d errors in %.1f s" % (
+               counters.get('files', 0), counters.get('imagesClassified', 0), snapshot['imagesPerSecond'],
+               megabytes_per_second, counters.get('cacheHits', 0) + counters.get('sharedStoreHits', 0),
+               counters.get('nearDuplicates', 0),
+               sum(snapshot['skipped'].values()), counters.get('errors', 0) + counters.get('readErrors', 0), elapsed)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m image_classification",
+                                     description="Classifies image files with the image-classification-server")
+    parser.add_argument('paths', nargs='*', metavar='PATH', help="image file or directory to walk")
+    parser.add_argument('-l', '--file-list', help="file with one path per line, - for the standard input")
+    parser.add_argument('-c', '--config', default=DEFAULT_CONFIG_PATH, help="configs.json of the module")
+    parser.add_argument('-o', '--output', help="JSON Lines output file, the standard output by default")
+    parser.add_argument('-w', '--workers', type=int, help="number of concurrent requests (server poolSize)")
+    parser.add_argument('-b', '--batch-size', type=int, help="images per pipelined batch request (batchSize)")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="do not use the detections cache nor the shared detection store")
+    parser.add_argument('--cache', help="detections cache file, the one of the module by default")
+    parser.add_argument('--unfiltered', action='store_true',
+                        help="output all the detections, not only the enabled classes above minProbability")
+    parser.add_argument('--metrics', help="file to write the metrics to, as JSON")
+    parser.add_argument('--progress', type=float, default=DEFAULT_PROGRESS_INTERVAL,
+                        help="seconds between progress reports, 0 for none")
+    arguments = parser.parse_args(argv)
+    if not arguments.paths and arguments.file_list is None:
+        parser.error("no PATH nor --file-list given")
+
+    config = load_config(arguments.config)
+    nr_of_workers = arguments.workers or int(config.get('server', {}).get('poolSize', DEFAULT_POOL_SIZE))
+    batch_size = arguments.batch_size or int(config.get('batchSize', 1))
+    # The JSON is ASCII only, so the file is written the same in Python 2 and 3
+    output = sys.stdout if arguments.output is None else open(arguments.output, 'w')
+
+    classifier = BulkClassifier(config, output, nr_of_workers, batch_size,
+                                int(config.get('requestsInFlight', DEFAULT_REQUESTS_IN_FLIGHT)),
+                                not arguments.no_cache, arguments.unfiltered, arguments.progress, arguments.cache)
+    try:
+        classifier.classify(iter_paths(arguments.paths, arguments.file_list))
+    finally:
+        classifier.close()
+        if output is not sys.stdout:
+            output.close()
+
+    snapshot = classifier.metrics.snapshot()
+    sys.stderr.write(format_summary(snapshot) + "\n")
+    if arguments.metrics:
+        with open(arguments.metrics, 'w') as f:
+            f.write(json.dumps(snapshot, indent=2, sort_keys=True))
+    return 0
@@ -0,0 +1,69 @@
+# Compression of the images sent to the server, for the formats that store
+# their pixels uncompressed (BMP, most TIFFs, ...).
+import threading
+import zlib
+
+from .metrics import NO_METRICS
+
+RAW = 0
+ZLIB = 1
+
+# Extensions of the formats whose data is already compressed
+COMPRESSED_EXTENSIONS = frozenset(['.jpg', '.jpeg', '.jpe', '.jfif', '.png', '.gif', '.webp',
+                                   '.heic', '.heif', '.avif', '.jp2', '.jxl'])
+# Images are compressed in memory, bigger ones are always sent as they are
+MAX_COMPRESSED_IMAGE_SIZE = 64 * 1024 * 1024
+MIN_COMPRESSED_IMAGE_SIZE = 4 * 1024
+# An extension stops being compressed once this many of its images compressed
+# to more than MAX_RATIO of their size on average
+NR_OF_SAMPLES = 16
+MAX_RATIO = 0.9
+
+
+class Compressor(object):
+
+    # 'level' is the zlib level, the fastest one compresses uncompressed
+    # pixels nearly as well as the others
+    def __init__(self, level=1, metrics=NO_METRICS):
+        self.level = level
+        self.metrics = metrics
+        # [number of images, bytes before, bytes after] of every extension
+        self._extension_ratios = {}
+        self._lock = threading.Lock()
+
+    def should_compress(self, image):
+        extension = image.extension.lower()
+        if extension in COMPRESSED_EXTENSIONS:
+            return False
+        if not MIN_COMPRESSED_IMAGE_SIZE <= image.size <= MAX_COMPRESSED_IMAGE_SIZE:
+            return False
+        with self._lock:
+            nr_of_images, size, compressed_size = self._extension_ratios.get(extension, (0, 0, 0))
+        return nr_of_images < NR_OF_SAMPLES or compressed_size <= MAX_RATIO * size
+
+    # Returns the encoding and the bytes to send, or (RAW, None) when the
+    # image is to be sent as it is
+    def compress(self, image):
+        if not self.should_compress(image):
+            return RAW, None
+        f = image.open()
+        try:
+            data = f.read(image.size)
+        finally:
+            f.close()
+        if len(data) != image.size:
+            raise IOError("Image " + image.name + " is shorter than its size")
+        with self.metrics.timer('compress'):
+            compressed_data = zlib.compress(data, self.level)
+        self._record(image.extension.lower(), image.size, len(compressed_data))
+        if len(compressed_data) > MAX_RATIO * image.size:
+            return RAW, data
+        self.metrics.increment('uncompressedBytes', image.size)
+        self.metrics.increment('compressedBytes', len(compressed_data))
+        return ZLIB, compressed_data
+
+    def _record(self, extension, size, compressed_size):
+        with self._lock:
+            nr_of_images, total_size, total_compressed_size = self._extension_ratios.get(extension, (0, 0, 0))
+            self._extension_ratios[extension] = (nr_of_images + 1, total_size + size,
+                                                 total_compressed_size + compressed_size)
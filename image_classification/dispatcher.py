@@ -0,0 +1,160 @@
+# Classifies images in background worker threads, so the threads that submit
+# them never wait for the server.
+import collections
+import itertools
+import logging
+import threading
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+from .protocol import connection_error
+
+_logger = logging.getLogger(__name__)
+_STOP = object()
+# Priority of the stop requests, so they come after every image submitted before them
+_STOP_PRIORITY = float('inf')
+
+
+class AsyncClassifier(object):
+
+    # Each worker takes one connection of the pool and keeps up to
+    # 'requests_in_flight' batch requests, of at most 'batch_size' images each,
+    # sent on it while waiting for their responses. The connection is given
+    # back whenever none is left in flight, so with a LoadBalancer the server
+    # of the next requests is picked again, by the latencies of the responses.
+    # Pipelining relies on the self delimited batch frame, so the server must support it.
+    # Waiting images are sent highest priority first, then in the order they
+    # were submitted; up to 'max_pending' of them wait, which is how far an
+    # image can jump ahead of those submitted before it.
+    def __init__(self, pool, nr_of_workers, requests_in_flight=1, batch_size=1, max_pending=None):
+        if nr_of_workers < 1:
+            raise ValueError("At least one worker is needed")
+        self.pool = pool
+        self.requests_in_flight = max(1, requests_in_flight)
+        self.batch_size = max(1, batch_size)
+        # Bounded, so the submitters are slowed down when the server can not keep up
+        if max_pending is None:
+            max_pending = nr_of_workers * self.requests_in_flight * self.batch_size * 2
+        self._queue = queue.PriorityQueue(max_pending)
+        self._sequence = itertools.count()
+        self._sequence_lock = threading.Lock()
+        self._workers = []
+        for i in range(nr_of_workers):
+            worker = threading.Thread(target=self._work, name="image-classification-worker-%d" % i)
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+
+    # 'callback' is called from a worker thread with the result of the image,
+    # that is its list of detections or an error object.
+    def submit(self, image, callback, priority=0):
+        self._put(-priority, (image, callback))
+
+    # Waits for all the submitted images to be classified and stops the workers
+    def close(self):
+        for worker in self._workers:
+            self._put(_STOP_PRIORITY, _STOP)
+        for worker in self._workers:
+            worker.join()
+
+    # The sequence number keeps the order of the images of the same priority
+    # and keeps the items themselves from being compared
+    def _put(self, key, item):
+        with self._sequence_lock:
+            sequence = next(self._sequence)
+        self._queue.put((key, sequence, item))
+
+    def _work(self):
+        connection = None
+        in_flight = collections.deque()
+        batch = None
+        stopping = False
+        while True:
+            if batch is None and not stopping and len(in_flight) < self.requests_in_flight:
+                # Only wait for new images when there are no responses to read
+                batch, stopping = self._take_batch(block=not in_flight)
+                if not batch:
+                    batch = None
+            if batch is not None:
+                try:
+                    if connection is None:
+                        connection = self.pool.acquire()
+                    # The concurrency limiter is only waited for with no request in
+                    # flight, otherwise reading a response is what frees a place
+                    if connection.send_batch_request([image for image, callback in batch], block=not in_flight):
+                        in_flight.append(batch)
+                        batch = None
+                        continue
+                except Exception as e:
+                    in_flight.append(batch)
+                    batch = None
+                    connection = self._fail(connection, in_flight, e)
+                    continue
+
+            if not in_flight:
+                if stopping:
+                    break
+                continue
+
+            try:
+                results = connection.receive_batch_response(len(in_flight[0]))
+            except Exception as e:
+                connection = self._fail(connection, in_flight, e)
+                continue
+            self.pool.record_latency(connection)
+            if len(in_flight) == 1:
+                self.pool.release(connection)
+                connection = None
+            self._deliver(in_flight.popleft(), results)
+
+        if connection is not None:
+            self.pool.release(connection)
+
+    # Takes up to 'batch_size' images from the queue.
+    # Returns the images and whether the workers were asked to stop.
+    def _take_batch(self, block):
+        batch = []
+        try:
+            item = self._queue.get(block)[2]
+            while True:
+                if item is _STOP:
+                    return batch, True
+                batch.append(item)
+                if len(batch) == self.batch_size:
+                    break
+                item = self._queue.get_nowait()[2]
+        except queue.Empty:
+            pass
+        return batch, False
+
+    # Releases the broken connection and answers the batches that were in flight.
+    # If the server just dropped the connection while idle (it is stale, see
+    # ServerConnection) those batches are sent once more on a fresh connection.
+    def _fail(self, connection, in_flight, error):
+        retry = connection is not None and connection.stale
+        if connection is not None:
+            self.pool.release(connection)
+
+        while in_flight:
+            batch = in_flight.popleft()
+            results = None
+            if retry:
+                self.pool.metrics.increment('retries')
+                try:
+                    results = self.pool.get_batch_detections([image for image, callback in batch])
+                except Exception as e:
+                    error = e
+            if results is None:
+                results = [connection_error(error)] * len(batch)
+            self._deliver(batch, results)
+        return None
+
+    def _deliver(self, batch, results):
+        for (image, callback), detections in zip(batch, results):
+            try:
+                callback(detections)
+            except Exception:
+                _logger.exception("Error handling the result of %s", image.name)
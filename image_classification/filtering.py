@@ -0,0 +1,45 @@
+# Selection of the detections reported to the user.
+import math
+import struct
+
+
+class ResultFilter(object):
+
+    # 'classes_of_interest' is the list of {"name": ..., "enabled": ...} objects
+    # of the module configuration. 'min_probability' is a percentage.
+    def __init__(self, min_probability, classes_of_interest):
+        self.min_probability = min_probability
+        self.enabled_classes = frozenset(class_of_interest['name'] for class_of_interest in classes_of_interest
+                                         if class_of_interest['enabled'])
+
+    # Returns the detections of enabled classes with a high enough probability
+    def filter(self, detections):
+        min_probability = self.min_probability
+        enabled_classes = self.enabled_classes
+        return [detection for detection in detections
+                if detection['probability'] >= min_probability and detection['className'] in enabled_classes]
+
+    # The same selection, made by the server before it sends the detections.
+    # 'class_names' is the class list of the server, in the order of the ids.
+    def server_filter(self, class_names):
+        return ServerFilter(self.min_probability, class_names, self.enabled_classes)
+
+
+# Filter sent with the requests to a server that supports it, so the
+# detections the ResultFilter would drop are never serialized, sent nor parsed.
+# It is encoded as:
+#   unsigned short  minimum probability, in hundredths of a percent
+#   int             size of the class bitmap
+#   bitmap          bit i % 8 of byte i // 8 set if the class of id i is enabled
+class ServerFilter(object):
+
+    def __init__(self, min_probability, class_names, enabled_classes):
+        self.min_probability = min_probability
+        bitmap = bytearray((len(class_names) + 7) // 8)
+        for class_id, name in enumerate(class_names):
+            if name in enabled_classes:
+                bitmap[class_id // 8] |= 1 << (class_id % 8)
+        self.bitmap = bytes(bitmap)
+        min_probability = max(0, min(10000, int(math.ceil(min_probability * 100))))
+        # Sent as is with every request
+        self.encoded = struct.pack("!Hi", min_probability, len(self.bitmap)) + self.bitmap
@@ -0,0 +1,69 @@
+# Sources of the image bytes sent to the server.
+#
+# An image is any object with:
+#   name       name used to identify the image in logs and results
+#   extension  extension of the image, with the leading dot (e.g. ".jpg")
+#   size       size of the image in bytes
+#   open()     returns a new file like object positioned at the start of the
+#              image, with read(size) and close() methods
+#   read_header(size)
+#              returns the first 'size' bytes of the image (less if it is smaller)
+# and, when the image is a file on the local disk:
+#   path       path of the file, so it can be sent without copying it in Python
+# and, when the image was resized before being sent:
+#   scale      ratio between the size of the image sent and the original one
+import io
+import os
+
+# Keys of the detection boxes that hold coordinates or lengths in pixels
+BOX_KEYS = ('x', 'y', 'width', 'height', 'left', 'top', 'right', 'bottom')
+
+
+class LocalImage(object):
+
+    def __init__(self, file_path, file_size=None):
+        self.name = file_path
+        self.path = file_path
+        self.extension = os.path.splitext(file_path)[1]
+        if file_size is None:
+            file_size = os.path.getsize(file_path)
+        self.size = file_size
+
+    def open(self):
+        return open(self.path, 'rb')
+
+    def read_header(self, size):
+        with open(self.path, 'rb') as f:
+            return f.read(size)
+
+
+# Image already held in memory, e.g. after being resized and re-encoded
+class MemoryImage(object):
+
+    def __init__(self, name, extension, data, scale=1.0):
+        self.name = name
+        self.extension = extension
+        self.data = data
+        self.size = len(data)
+        self.scale = scale
+
+    def open(self):
+        return io.BytesIO(self.data)
+
+    def read_header(self, size):
+        return self.data[:size]
+
+
+# Maps the boxes of the detections of a resized image back to the
+# coordinates of the original image
+def restore_detections(detections, scale):
+    if not isinstance(detections, list) or scale == 1.0:
+        return detections
+    for detection in detections:
+        for box in (detection, detection.get('box'), detection.get('boundingBox')):
+            if not isinstance(box, dict):
+                continue
+            for key in BOX_KEYS:
+                if isinstance(box.get(key), (int, float)):
+                    box[key] = int(round(box[key] / scale))
+    return detections
@@ -0,0 +1,99 @@
+# Append only record of the files an ingest already went through, so an ingest
+# that was cancelled or crashed can be run again without classifying the same
+# files twice.
+#
+# The journal is a text file with one "<file id> <outcome>" line per file,
+# the last line of a file winning. Its first line holds a fingerprint of the
+# settings that change the results: a journal written with other settings is
+# discarded.
+import io
+import os
+import threading
+import time
+
+CLASSIFIED = 'c'
+ERROR = 'e'
+SKIPPED = 's'
+# Files that do not need to go through the ingest again
+DONE_OUTCOMES = frozenset([CLASSIFIED, SKIPPED])
+
+
+class IngestJournal(object):
+
+    # Writes are buffered and flushed at most every 'flush_interval' seconds,
+    # so a crash loses the outcomes of the last files, which are then simply
+    # processed again
+    def __init__(self, path, fingerprint, flush_interval=1.0):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._done, nr_of_lines = self._load()
+        # Rewritten when most of its lines are outdated
+        if nr_of_lines > 2 * len(self._done) + 1000:
+            self._compact()
+        elif nr_of_lines == 0:
+            with io.open(self.path, 'w', encoding='utf-8') as f:
+                f.write(u"# " + fingerprint + u"\n")
+        self._file = io.open(self.path, 'a', encoding='utf-8')
+        # Ends the line left incomplete by a crash, not to merge it with the next one
+        if not self._ends_with_newline():
+            self._file.write(u"\n")
+        self._last_flush_time = time.time()
+
+    # Ids of the files that were classified or skipped by a previous ingest.
+    # Only holds what was read when the journal was opened.
+    def is_done(self, file_id):
+        return file_id in self._done
+
+    def record(self, file_id, outcome):
+        with self._lock:
+            self._file.write(u"%d %s\n" % (file_id, outcome))
+            now = time.time()
+            if now - self._last_flush_time >= self.flush_interval:
+                self._file.flush()
+                self._last_flush_time = now
+
+    def close(self):
+        with self._lock:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+
+    def _ends_with_newline(self):
+        with open(self.path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    # Returns the ids of the files that are done and the number of lines read
+    def _load(self):
+        done = set()
+        if not os.path.isfile(self.path):
+            return done, 0
+        with io.open(self.path, 'r', encoding='utf-8') as f:
+            if f.readline().rstrip(u"\n") != u"# " + self.fingerprint:
+                return done, 0
+            nr_of_lines = 1
+            for line in f:
+                nr_of_lines += 1
+                fields = line.split()
+                # The last line may be incomplete after a crash
+                if len(fields) != 2 or not line.endswith(u"\n"):
+                    continue
+                file_id = int(fields[0])
+                if fields[1] in DONE_OUTCOMES:
+                    done.add(file_id)
+                else:
+                    done.discard(file_id)
+        return done, nr_of_lines
+
+    # Every file that is done is written as classified
+    def _compact(self):
+        temporary_path = self.path + ".tmp"
+        with io.open(temporary_path, 'w', encoding='utf-8') as f:
+            f.write(u"# " + self.fingerprint + u"\n")
+            for file_id in self._done:
+                f.write(u"%d %s\n" % (file_id, CLASSIFIED))
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        os.rename(temporary_path, self.path)
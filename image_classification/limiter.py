@@ -0,0 +1,139 @@
+# Adapts the number of requests in flight to a server to how fast it answers,
+# so its GPUs are kept busy without piling up requests until they time out.
+#
+# The limit follows the Vegas congestion control: the lowest latency seen is
+# taken as the time the server needs for an image when nothing waits, and the
+# ratio between it and the latency of each response tells how many requests
+# are queued on the server. The limit grows by about one per round trip while
+# few are queued and shrinks by a fraction when too many are (additive
+# increase, multiplicative decrease), and by half when a request fails.
+import threading
+import time
+
+from .metrics import NO_METRICS
+
+INITIAL_LIMIT = 4
+# Requests queued on the server under which the limit grows, and over which
+# it shrinks
+MIN_QUEUED = 2
+MAX_QUEUED = 4
+# Fraction of the limit kept when too many requests are queued
+BACKOFF = 0.9
+# The lowest latency is measured again every that many responses, in case
+# the server got slower (another model, a shared GPU)
+MIN_LATENCY_WINDOW = 1000
+
+
+class ConcurrencyLimiter(object):
+
+    # The limit stays between 'min_limit' and 'max_limit'. 'name' tells the
+    # servers apart in the metrics, where the limit is kept as the gauge
+    # 'concurrencyLimit' followed by the name.
+    def __init__(self, max_limit, initial_limit=INITIAL_LIMIT, min_limit=1, metrics=NO_METRICS, name=None):
+        if max_limit < 1:
+            raise ValueError("The maximum concurrency must be at least 1")
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max_limit
+        self.limit = float(max(self.min_limit, min(initial_limit, max_limit)))
+        self.in_flight = 0
+        self.waiting = 0
+        self.min_latency = None
+        self.metrics = metrics
+        self.gauge = 'concurrencyLimit' if name is None else 'concurrencyLimit ' + name
+        self._window_min_latency = None
+        self._nr_of_samples = 0
+        self._last_decrease_time = 0
+        self._round_trip = 0.0
+        self._condition = threading.Condition(threading.Lock())
+        self.metrics.gauge(self.gauge, int(self.limit))
+
+    # Takes a place for one more request in flight, waiting for one to be
+    # released while the limit is reached. With block=False returns False
+    # instead of waiting.
+    def acquire(self, block=True):
+        with self._condition:
+            if self.in_flight >= int(self.limit):
+                if not block:
+                    return False
+                self.waiting += 1
+                try:
+                    while self.in_flight >= int(self.limit):
+                        self._condition.wait()
+                finally:
+                    self.waiting -= 1
+            self.in_flight += 1
+            return True
+
+    # Gives back the place of a request, with the seconds its response was
+    # waited for and the number of images it carried, or with None if the
+    # request failed
+    def release(self, seconds, nr_of_images=1):
+        now = time.time()
+        with self._condition:
+            was_limited = self.in_flight >= int(self.limit)
+            self.in_flight -= 1
+            previous_limit = int(self.limit)
+            if seconds is None:
+                self._decrease(now, 0.5)
+            else:
+                self._round_trip = seconds
+                self._sample(now, seconds / max(1, nr_of_images), was_limited)
+            limit = int(self.limit)
+            self._condition.notify_all()
+        if limit != previous_limit:
+            self.metrics.gauge(self.gauge, limit)
+
+    # Gives back the place of a request that was not answered for a reason
+    # that tells nothing about the server, e.g. a connection it closed while idle
+    def cancel(self):
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def _sample(self, now, latency, was_limited):
+        if self.min_latency is None or latency < self.min_latency:
+            self.min_latency = latency
+        if self._window_min_latency is None or latency < self._window_min_latency:
+            self._window_min_latency = latency
+        self._nr_of_samples += 1
+        if self._nr_of_samples == MIN_LATENCY_WINDOW:
+            self.min_latency = self._window_min_latency
+            self._window_min_latency = None
+            self._nr_of_samples = 0
+
+        queued = self.limit * (1 - self.min_latency / latency) if latency > 0 else 0.0
+        if queued > MAX_QUEUED:
+            self._decrease(now, BACKOFF)
+        elif queued < MIN_QUEUED and was_limited:
+            # Only while the limit is what holds the requests back, it would
+            # otherwise grow without telling anything about the server
+            self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+
+    # The responses of the requests sent before a decrease still tell of the
+    # queue that caused it, so the limit decreases at most once per round trip
+    def _decrease(self, now, factor):
+        if now - self._last_decrease_time < self._round_trip:
+            return
+        self._last_decrease_time = now
+        self.limit = max(float(self.min_limit), self.limit * factor)
+
+    def state(self):
+        with self._condition:
+            return {'limit': int(self.limit), 'inFlight': self.in_flight, 'waiting': self.waiting,
+                    'minLatency': self.min_latency}
+
+
+# Limiter that never holds a request back, used when none is given
+class NullConcurrencyLimiter(object):
+
+    def acquire(self, block=True):
+        return True
+
+    def release(self, seconds, nr_of_images=1):
+        pass
+
+    def cancel(self):
+        pass
+
+
+NO_LIMITER = NullConcurrencyLimiter()
@@ -0,0 +1,169 @@
+# Counters and latency histograms of the classification of images.
+import bisect
+import collections
+import threading
+import time
+
+# Upper bounds, in seconds, of the buckets of the latency histograms
+LATENCY_BUCKETS = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0)
+# Last changes kept of every gauge
+GAUGE_HISTORY_SIZE = 100
+
+
+class LatencyHistogram(object):
+
+    def __init__(self):
+        self.bucket_counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        self.bucket_counts[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    # Upper bound of the bucket holding the given percentile
+    def percentile(self, percentile):
+        if self.count == 0:
+            return 0.0
+        rank = percentile / 100.0 * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.bucket_counts):
+            seen += bucket_count
+            if seen >= rank:
+                if index < len(LATENCY_BUCKETS):
+                    return min(LATENCY_BUCKETS[index], self.max)
+                break
+        return self.max
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'totalSeconds': round(self.total, 6),
+            'meanSeconds': round(self.total / self.count, 6) if self.count else 0.0,
+            'p50Seconds': round(self.percentile(50), 6),
+            'p90Seconds': round(self.percentile(90), 6),
+            'p99Seconds': round(self.percentile(99), 6),
+            'maxSeconds': round(self.max, 6),
+        }
+
+
+class _StageTimer(object):
+
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exception_type, exception, traceback):
+        self.metrics.record(self.stage, time.time() - self.start)
+        return False
+
+
+class IngestMetrics(object):
+
+    def __init__(self):
+        self.start_time = time.time()
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._skipped = {}
+        self._stages = {}
+        self._gauges = {}
+        self._last_snapshot_time = self.start_time
+
+    def increment(self, counter, value=1):
+        with self._lock:
+            self._counters[counter] = self._counters.get(counter, 0) + value
+
+    def skipped(self, reason):
+        with self._lock:
+            self._skipped[reason] = self._skipped.get(reason, 0) + 1
+
+    def record(self, stage, seconds):
+        with self._lock:
+            histogram = self._stages.get(stage)
+            if histogram is None:
+                histogram = self._stages[stage] = LatencyHistogram()
+            histogram.record(seconds)
+
+    # Sets the current value of a gauge, which keeps the time of its last changes
+    def gauge(self, gauge, value):
+        with self._lock:
+            history = self._gauges.get(gauge)
+            if history is None:
+                history = self._gauges[gauge] = collections.deque(maxlen=GAUGE_HISTORY_SIZE)
+            history.append((round(time.time() - self.start_time, 3), value))
+
+    # Usage: with metrics.timer('stage'): ...
+    def timer(self, stage):
+        return _StageTimer(self, stage)
+
+    def counter(self, counter):
+        with self._lock:
+            return self._counters.get(counter, 0)
+
+    # True once every 'interval' seconds, so a single caller takes each periodic snapshot
+    def is_snapshot_due(self, interval):
+        now = time.time()
+        with self._lock:
+            if now - self._last_snapshot_time < interval:
+                return False
+            self._last_snapshot_time = now
+            return True
+
+    def snapshot(self):
+        with self._lock:
+            elapsed = time.time() - self.start_time
+            images_classified = self._counters.get('imagesClassified', 0)
+            uncompressed_bytes = self._counters.get('uncompressedBytes', 0)
+            return {
+                'elapsedSeconds': round(elapsed, 3),
+                'imagesPerSecond': round(images_classified / elapsed, 3) if elapsed > 0 else 0.0,
+                # Size sent over size before compression, of the compressed images
+                'compressionRatio': round(float(self._counters.get('compressedBytes', 0)) / uncompressed_bytes, 3)
+                if uncompressed_bytes > 0 else None,
+                'counters': dict(self._counters),
+                'skipped': dict(self._skipped),
+                'stages': dict((stage, histogram.to_dict()) for stage, histogram in self._stages.items()),
+                # Every gauge with its current value and the elapsed seconds at its last changes
+                'gauges': dict((gauge, {'value': history[-1][1], 'history': [list(change) for change in history]})
+                               for gauge, history in self._gauges.items()),
+            }
+
+
+class _NullTimer(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception, traceback):
+        return False
+
+
+# Metrics that discard everything, used when no metrics are collected
+class NullMetrics(object):
+    _timer = _NullTimer()
+
+    def increment(self, counter, value=1):
+        pass
+
+    def skipped(self, reason):
+        pass
+
+    def record(self, stage, seconds):
+        pass
+
+    def gauge(self, gauge, value):
+        pass
+
+    def timer(self, stage):
+        return self._timer
+
+
+NO_METRICS = NullMetrics()
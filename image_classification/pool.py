@@ -0,0 +1,186 @@
+# Pool of long-lived connections to one classification server, shared by
+# several threads.
+import logging
+import socket
+import threading
+import time
+
+from .breaker import CircuitBreaker, CircuitOpen, backoff_delay
+from .limiter import ConcurrencyLimiter, NO_LIMITER
+from .metrics import NO_METRICS
+from .protocol import ServerConnection, SEND_BUFFER_SIZE
+
+_logger = logging.getLogger(__name__)
+
+# Connections dropped in a row right after their first response that tell
+# the server closes every connection once it answered
+CLOSING_SERVER_DROPS = 2
+
+
+class ConnectionPool(object):
+
+    # Failed requests are retried up to 'max_retries' times on new connections,
+    # after a random delay. The pool stops opening connections and fails fast
+    # after 'failure_threshold' failed requests in a row, for 'reset_timeout'
+    # seconds (see CircuitBreaker).
+    # 'binary_results', 'compressor' and 'server_filter' are given to the
+    # connections (see ServerConnection).
+    # With 'max_concurrency' above 0 the number of requests in flight to the
+    # server is adapted to its latency, up to that number (see ConcurrencyLimiter).
+    def __init__(self, host, port, size, timeout=None, send_buffer_size=SEND_BUFFER_SIZE, metrics=NO_METRICS,
+                 connect_timeout=None, max_retries=0, failure_threshold=0, reset_timeout=30.0,
+                 binary_results=None, compressor=None, max_concurrency=0, server_filter=None):
+        if size < 1:
+            raise ValueError("The pool size must be at least 1")
+        self.host = host
+        self.port = int(port)
+        self.size = size
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.send_buffer_size = send_buffer_size
+        self.metrics = metrics
+        self.max_retries = max_retries
+        self.binary_results = binary_results
+        self.compressor = compressor
+        self.server_filter = server_filter
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.limiter = NO_LIMITER
+        if max_concurrency > 0:
+            self.limiter = ConcurrencyLimiter(max_concurrency, metrics=metrics, name="%s:%d" % (host, self.port))
+        # Turned off for a server that closes every connection once it answered
+        self.reuse_connections = True
+        self._nr_of_single_use_drops = 0
+        self._idle = []
+        self._nr_of_connections = 0
+        self._closed = False
+        self._condition = threading.Condition(threading.Lock())
+
+    # Takes an idle connection, opening a new one if the pool is not full yet.
+    # Blocks while all the connections are in use.
+    # Raises CircuitOpen right away while the server is considered down.
+    def acquire(self):
+        try:
+            self.breaker.check()
+        except CircuitOpen:
+            self.metrics.increment('failedFast')
+            raise
+        with self._condition:
+            while True:
+                if self._closed:
+                    raise socket.error("Connection pool is closed")
+                if self._idle:
+                    return self._idle.pop()
+                if self._nr_of_connections < self.size:
+                    self._nr_of_connections += 1
+                    break
+                self._condition.wait()
+
+        try:
+            return ServerConnection(self.host, self.port, self.timeout, self.send_buffer_size,
+                                    metrics=self.metrics, connect_timeout=self.connect_timeout,
+                                    breaker=self.breaker, binary_results=self.binary_results,
+                                    compressor=self.compressor, limiter=self.limiter,
+                                    server_filter=self.server_filter)
+        except Exception:
+            self.breaker.failure()
+            self._discard()
+            raise
+
+    def release(self, connection):
+        self._check_reuse(connection)
+        if connection.broken or not self.reuse_connections:
+            connection.close()
+            self._discard()
+            return
+
+        with self._condition:
+            if self._closed:
+                connection.close()
+            else:
+                self._idle.append(connection)
+            self._condition.notify()
+
+    # Only a LoadBalancer has servers to choose between by their latency
+    def record_latency(self, connection):
+        pass
+
+    # A server that closes every connection once it answered drops each of
+    # them right after its first response, so that every reused connection
+    # fails before a new one is opened. Once it did so CLOSING_SERVER_DROPS
+    # times in a row, the connections are closed after their request
+    # instead. A connection that answers a second request shows that the
+    # server keeps them open.
+    def _check_reuse(self, connection):
+        with self._condition:
+            if not self.reuse_connections:
+                return
+            if connection.stale and connection.requests_sent == 1:
+                self._nr_of_single_use_drops += 1
+                if self._nr_of_single_use_drops < CLOSING_SERVER_DROPS:
+                    return
+                self.reuse_connections = False
+                # Dropped by the server as well
+                idle = self._idle
+                self._idle = []
+                self._nr_of_connections -= len(idle)
+                self._condition.notify_all()
+            else:
+                if not connection.broken and connection.requests_sent > 1:
+                    self._nr_of_single_use_drops = 0
+                return
+
+        for idle_connection in idle:
+            idle_connection.close()
+        self.metrics.increment('connectionReuseStopped')
+        _logger.info("Server %s:%d closes its connections after every response, they are not reused any more",
+                     self.host, self.port)
+
+    def _discard(self):
+        with self._condition:
+            self._nr_of_connections -= 1
+            self._condition.notify()
+
+    # Runs operation(connection) with one of the pooled connections.
+    # A reused connection may have been dropped by the server while idle (it
+    # is then stale, see ServerConnection), in that case it is replaced by a
+    # fresh one and the operation run again.
+    # Other failures are retried up to 'max_retries' times.
+    def run(self, operation):
+        nr_of_reused_failures = 0
+        nr_of_retries = 0
+        delay = 0
+        while True:
+            if delay:
+                time.sleep(delay)
+            connection = self.acquire()
+            try:
+                return operation(connection)
+            except socket.error:
+                if connection.stale and nr_of_reused_failures < self.size:
+                    nr_of_reused_failures += 1
+                    delay = 0
+                elif nr_of_retries < self.max_retries:
+                    nr_of_retries += 1
+                    delay = backoff_delay(nr_of_retries)
+                else:
+                    raise
+                self.metrics.increment('retries')
+            finally:
+                self.release(connection)
+
+    def get_detections(self, image):
+        return self.run(lambda connection: connection.get_detections(image))
+
+    def get_batch_detections(self, images):
+        return self.run(lambda connection: connection.get_batch_detections(images))
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            idle = self._idle
+            self._idle = []
+            self._nr_of_connections -= len(idle)
+            self._condition.notify_all()
+
+        for connection in idle:
+            connection.close()
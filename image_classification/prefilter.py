@@ -0,0 +1,188 @@
+# Cheap checks done before an image is uploaded, so files that are not images,
+# or images too small to hold anything of interest, never reach the server.
+import struct
+
+SKIP_FILE_TOO_SMALL = "file too small"
+SKIP_NOT_AN_IMAGE = "not an image"
+SKIP_FORMAT_NOT_ENABLED = "image format not enabled"
+SKIP_IMAGE_TOO_SMALL = "image resolution too small"
+
+# Enough bytes to recognise every format and to read the dimensions of all
+# of them but JPEG
+SNIFF_SIZE = 32
+# JPEG dimensions come after the EXIF segment, which holds up to 64 KB
+JPEG_HEADER_SIZE = 128 * 1024
+
+EXTENSION_FORMATS = {
+    'jpg': 'jpeg',
+    'jpeg': 'jpeg',
+    'jpe': 'jpeg',
+    'jfif': 'jpeg',
+    'png': 'png',
+    'gif': 'gif',
+    'bmp': 'bmp',
+    'dib': 'bmp',
+    'tif': 'tiff',
+    'tiff': 'tiff',
+    'webp': 'webp',
+}
+
+# Extension the images of each format are sent with when their name does not
+# tell their format, as the server may pick its decoder by the extension
+FORMAT_EXTENSIONS = {
+    'jpeg': '.jpg',
+    'png': '.png',
+    'gif': '.gif',
+    'bmp': '.bmp',
+    'tiff': '.tif',
+    'webp': '.webp',
+}
+
+MIME_TYPE_FORMATS = {
+    'image/jpeg': 'jpeg',
+    'image/pjpeg': 'jpeg',
+    'image/png': 'png',
+    'image/gif': 'gif',
+    'image/bmp': 'bmp',
+    'image/x-bmp': 'bmp',
+    'image/x-ms-bmp': 'bmp',
+    'image/tiff': 'tiff',
+    'image/webp': 'webp',
+}
+
+
+# Returns the format of the image given its first SNIFF_SIZE bytes, or None
+def sniff_image_format(header):
+    if header.startswith(b'\xff\xd8\xff'):
+        return 'jpeg'
+    if header.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'png'
+    if header.startswith(b'GIF87a') or header.startswith(b'GIF89a'):
+        return 'gif'
+    if header.startswith(b'BM') and len(header) >= 26:
+        return 'bmp'
+    if header.startswith(b'II*\x00') or header.startswith(b'MM\x00*'):
+        return 'tiff'
+    if header.startswith(b'RIFF') and header[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+
+# Returns the (width, height) of the image, or None if the header does not
+# tell it
+def image_dimensions(image_format, header):
+    try:
+        if image_format == 'png' and header[12:16] == b'IHDR':
+            return struct.unpack(">II", header[16:24])
+        if image_format == 'gif':
+            return struct.unpack("<HH", header[6:10])
+        if image_format == 'bmp':
+            if struct.unpack("<I", header[14:18])[0] == 12:
+                return struct.unpack("<HH", header[18:22])
+            width, height = struct.unpack("<ii", header[18:26])
+            return width, abs(height)
+        if image_format == 'webp':
+            return _webp_dimensions(header)
+        if image_format == 'jpeg':
+            return _jpeg_dimensions(header)
+    except struct.error:
+        pass
+    return None
+
+
+def _webp_dimensions(header):
+    chunk = header[12:16]
+    data = bytearray(header)
+    if chunk == b'VP8 ':
+        width, height = struct.unpack("<HH", header[26:30])
+        return width & 0x3fff, height & 0x3fff
+    if chunk == b'VP8L':
+        return (1 + (data[21] | (data[22] & 0x3f) << 8),
+                1 + (data[22] >> 6 | data[23] << 2 | (data[24] & 0x0f) << 10))
+    if chunk == b'VP8X':
+        return (1 + (data[24] | data[25] << 8 | data[26] << 16),
+                1 + (data[27] | data[28] << 8 | data[29] << 16))
+    return None
+
+
+def _jpeg_dimensions(header):
+    data = bytearray(header)
+    i = 2
+    while i + 9 < len(data):
+        if data[i] != 0xff:
+            return None
+        marker = data[i + 1]
+        # Start of frame markers, except DHT, JPG and DAC
+        if 0xc0 <= marker <= 0xcf and marker not in (0xc4, 0xc8, 0xcc):
+            height, width = struct.unpack(">HH", header[i + 5:i + 9])
+            return width, height
+        if marker == 0xff:
+            i += 1
+        elif marker == 0x01 or 0xd0 <= marker <= 0xd8:
+            i += 2
+        else:
+            i += 2 + struct.unpack(">H", header[i + 2:i + 4])[0]
+    return None
+
+
+class Prefilter(object):
+
+    # 'image_formats' are the extensions of the images to classify, as in the
+    # module configuration. Images whose format can not be recognised by their
+    # content (e.g. HEIC) are accepted on their extension alone.
+    # 'min_file_size' is in bytes, 'min_image_side' in pixels.
+    def __init__(self, image_formats, min_file_size=0, min_image_side=0):
+        self.extensions = frozenset(image_format.lower().lstrip('.') for image_format in image_formats)
+        self.formats = frozenset(EXTENSION_FORMATS[extension] for extension in self.extensions
+                                 if extension in EXTENSION_FORMATS)
+        self.extensions_without_signature = frozenset(extension for extension in self.extensions
+                                                      if extension not in EXTENSION_FORMATS)
+        self.min_file_size = min_file_size
+        self.min_image_side = min_image_side
+
+    def has_image_extension(self, file_name):
+        return file_name.rpartition('.')[2].lower() in self.extensions
+
+    # Whether the file is worth a check() at all: its name has one of the
+    # extensions, or the type already detected for it is an image type.
+    # Needs no read, so it can be asked of every file of a data source.
+    def is_candidate(self, file_name, mime_type=None):
+        if self.has_image_extension(file_name):
+            return True
+        return bool(mime_type) and mime_type.lower().startswith('image/')
+
+    # Returns the reason to skip the image, or None if it must be classified.
+    # 'mime_type' is the type already detected for the file, if any, otherwise
+    # the format is recognised from the first bytes of the image.
+    # An image whose extension is not the one of its format, e.g. a renamed
+    # JPEG, gets the extension of its format.
+    def check(self, image, mime_type=None):
+        if image.size < max(self.min_file_size, 1):
+            return SKIP_FILE_TOO_SMALL
+
+        extension = image.extension.lower().lstrip('.')
+        if extension in self.extensions_without_signature:
+            return None
+
+        header = None
+        if mime_type and mime_type != 'application/octet-stream':
+            image_format = MIME_TYPE_FORMATS.get(mime_type.lower())
+        else:
+            header = image.read_header(SNIFF_SIZE)
+            image_format = sniff_image_format(header)
+        if image_format is None:
+            return SKIP_NOT_AN_IMAGE
+        if image_format not in self.formats:
+            return SKIP_FORMAT_NOT_ENABLED
+        if EXTENSION_FORMATS.get(extension) != image_format:
+            image.extension = FORMAT_EXTENSIONS[image_format]
+
+        if self.min_image_side > 0:
+            if image_format == 'jpeg':
+                header = image.read_header(JPEG_HEADER_SIZE)
+            elif header is None:
+                header = image.read_header(SNIFF_SIZE)
+            dimensions = image_dimensions(image_format, header)
+            if dimensions is not None and min(dimensions) < self.min_image_side:
+                return SKIP_IMAGE_TOO_SMALL
+        return None
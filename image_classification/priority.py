@@ -0,0 +1,70 @@
+# Orders the images waiting for the server by how likely they are to matter
+# to an investigation, so photos taken or received by the user are
+# classified before the thousands of images of caches and applications.
+import re
+
+from .prefilter import SNIFF_SIZE
+
+# Parts of the path of the images kept by the user: camera rolls, picture
+# folders and chat attachments
+DEFAULT_HIGH_VALUE_PATHS = ["/users/", "/home/", "/dcim/", "/pictures/", "/photos/", "/desktop/", "/documents/",
+                            "/downloads/", "/whatsapp/", "/telegram", "/signal", "/attachments/",
+                            "/mobilesync/", "/camera/"]
+# Parts of the path of the images written by applications: browser caches,
+# thumbnail stores, temporary files and system files
+DEFAULT_LOW_VALUE_PATHS = ["cache", "/temp/", "/tmp/", "thumbnails", "thumbcache", "/windows/", "/program files",
+                           "/programdata/", "/system32/", "/usr/share/", "/applications/", "/icons/",
+                           "/emoji", "/stickers/", "/node_modules/"]
+
+# Images under this size are mostly icons and thumbnails, over the other one
+# mostly photos
+SMALL_IMAGE_SIZE = 16 * 1024
+LARGE_IMAGE_SIZE = 256 * 1024
+
+
+# True if the header, the first SNIFF_SIZE bytes of a JPEG, holds an EXIF
+# segment, as the photos taken by cameras and phones do. It comes first, or
+# right after the JFIF segment.
+def has_exif(header):
+    if not header.startswith(b'\xff\xd8'):
+        return False
+    return header[6:10] == b'Exif' or header[24:28] == b'Exif'
+
+
+class Prioritizer(object):
+
+    # The paths are matched, case insensitively, as parts of the path of the
+    # image with '/' as the separator; a low value path wins over a high value
+    # one, e.g. for the caches inside the user directories.
+    def __init__(self, high_value_paths=None, low_value_paths=None):
+        if high_value_paths is None:
+            high_value_paths = DEFAULT_HIGH_VALUE_PATHS
+        if low_value_paths is None:
+            low_value_paths = DEFAULT_LOW_VALUE_PATHS
+        self.high_value_pattern = self._compile(high_value_paths)
+        self.low_value_pattern = self._compile(low_value_paths)
+
+    # Returns the priority of the image, from -3 to 5: the higher, the sooner
+    # it is classified. 'path' is the path of the image in the data source.
+    def priority(self, image, path):
+        path = path.replace('\\', '/').lower()
+        if self.low_value_pattern is not None and self.low_value_pattern.search(path):
+            score = -2
+        elif self.high_value_pattern is not None and self.high_value_pattern.search(path):
+            score = 2
+        else:
+            score = 0
+        if image.size < SMALL_IMAGE_SIZE:
+            score -= 1
+        elif image.size >= LARGE_IMAGE_SIZE:
+            score += 1
+        if image.extension.lower() in ('.jpg', '.jpeg', '.jpe') and has_exif(image.read_header(SNIFF_SIZE)):
+            score += 2
+        return score
+
+    # A single regular expression, so a path is scanned once for all of them
+    @staticmethod
+    def _compile(paths):
+        if not paths:
+            return None
+        return re.compile("|".join(re.escape(path.replace('\\', '/').lower()) for path in paths))
@@ -0,0 +1,483 @@
+# Client side of the image-classification-server wire protocol.
+#
+# A request is made of the following lockstep messages:
+#   client -> extension of the image (e.g. ".jpg")    server -> int ack
+#   client -> size of the image in ASCII decimal      server -> int ack
+#   client -> image bytes                             server -> int ack (-1 asks to re-send)
+#   client -> "1"                                     server -> int with the size of the response
+#   client -> "1"                                     server -> JSON response (if size > 0)
+#
+# A batch request carries several images in a single round trip, every
+# field being length prefixed instead of acknowledged:
+#   client -> "ICB1", int with the number of images, then for each image:
+#             int size of the extension, extension, int size of the image, image bytes
+#   server -> int with the size of the response, JSON array with one entry per image
+#             (the list of detections or the error object of that image)
+#
+# The results of a batch can also be asked for in a compact binary encoding,
+# see results.py.
+#
+# A batch request that compresses its images, or has the server filter the
+# detections, starts with "ICB3" instead:
+#   client -> "ICB3", byte with the flags (1: binary results, 2: compressed
+#             response, 4: filtered detections), the filter when asked for
+#             (see filtering.ServerFilter), int with the number of images,
+#             then for each image: int size of the extension, extension, byte
+#             with the encoding of the image (0: raw, 1: zlib), int size of the
+#             image, int size of the bytes sent, bytes sent
+#   server -> int with the size of the response, response (zlib compressed
+#             when asked for)
+#
+# A connection can also ask the server what it runs and supports:
+#   client -> "ICH1"
+#   server -> "ICH1", int with the size of the response, JSON object with the
+#             "modelId", "modelVersion", "classNames" (in the order of their
+#             ids), "maxBatchSize", "encodings" ("json", "binary") and
+#             "compression" ("zlib") of the server, and "filtering" if it
+#             filters the detections
+# A server that does not know the handshake takes "ICH1" for the extension of
+# a lockstep request and answers with an int ack instead.
+#
+# Responses are length prefixed, so once one has been fully read the
+# connection is back at a request boundary and can carry the next request.
+#
+# A connection that times out, or fails in any other way, in the middle of an
+# exchange is no longer at a request boundary and is marked as broken.
+# A reused connection that fails before any byte of a response arrived was
+# most likely closed by the server while idle, and is marked as stale: that
+# failure tells nothing about the load or the health of the server, and
+# neither does an image that can not be read while it is being sent.
+import collections
+import json
+import socket
+import struct
+import sys
+import time
+import zlib
+
+from .breaker import CircuitOpen, NO_BREAKER
+from .compression import RAW
+from .limiter import NO_LIMITER
+from .metrics import NO_METRICS
+from .results import BINARY_BATCH_MAGIC
+
+READY_MESSAGE = b'1'
+BATCH_MAGIC = b'ICB1'
+COMPRESSED_BATCH_MAGIC = b'ICB3'
+HANDSHAKE_MAGIC = b'ICH1'
+FLAG_BINARY_RESULTS = 1
+FLAG_COMPRESSED_RESPONSE = 2
+FLAG_FILTER = 4
+ACK_RESEND = -1
+# Number of times an image is sent again when the server asks for it
+MAX_RESENDS = 3
+SEND_BUFFER_SIZE = 256 * 1024
+# Jython sockets convert whatever they are given with str(), so memoryviews
+# can only be sent on CPython, which is also where responses are received
+# into a reusable buffer
+MEMORYVIEW_SENDS = not sys.platform.startswith('java')
+
+
+class ConnectionClosed(socket.error):
+    pass
+
+
+# The image could not be read from where it is kept while it was being sent.
+# It is not a socket.error, which it would be as an IOError on Python 3, so
+# it is neither retried nor counted as a failure of the server.
+class ImageReadError(Exception):
+    pass
+
+
+# Result used for an image that could not be classified because of a
+# connection or protocol error, or because it could not be read.
+# Images refused by an open circuit breaker were never sent to the server.
+def connection_error(error):
+    if isinstance(error, CircuitOpen):
+        return {'errorCode': 'SERVER_UNAVAILABLE', 'errorMessage': str(error)}
+    if isinstance(error, ImageReadError):
+        return {'errorCode': 'READ_ERROR', 'errorMessage': str(error)}
+    return {'errorCode': 'CONNECTION_ERROR', 'errorMessage': str(error)}
+
+
+def read_error(image, error):
+    return ImageReadError("Error reading " + image.name + ": " + str(error))
+
+
+def to_bytes(value):
+    if isinstance(value, bytes):
+        return value
+    return value.encode('utf-8')
+
+
+class ServerConnection(object):
+
+    # 'send_buffer_size' is the size of the blocks the images are sent in.
+    # 'use_sendfile' lets the kernel copy local image files straight to the
+    # socket where socket.sendfile is available.
+    # 'metrics' collects the time spent in each stage of the requests.
+    # 'timeout' applies to every send and receive, 'connect_timeout' to
+    # opening the connection (the same as 'timeout' if not given).
+    # 'breaker' is told about the outcome of every request.
+    # 'binary_results' is the BinaryResults decoder to ask for binary encoded
+    # results with, which makes every request a batch request. With None the
+    # results come as JSON.
+    # 'compressor' is the Compressor that picks the images to compress, which
+    # also makes every request a batch request and has the response compressed.
+    # 'limiter' is the ConcurrencyLimiter that every request takes a place of
+    # and is told how long the server took to answer.
+    # 'server_filter' is the ServerFilter the server applies to the detections
+    # before sending them, which also makes every request a batch request.
+    def __init__(self, host, port, timeout=None, send_buffer_size=SEND_BUFFER_SIZE, use_sendfile=True,
+                 metrics=NO_METRICS, connect_timeout=None, breaker=NO_BREAKER, binary_results=None,
+                 compressor=None, limiter=NO_LIMITER, server_filter=None):
+        self.host = host
+        self.port = int(port)
+        self.send_buffer_size = send_buffer_size
+        self.metrics = metrics
+        self.breaker = breaker
+        self.binary_results = binary_results
+        self.compressor = compressor
+        self.server_filter = server_filter
+        self.limiter = limiter
+        # Times the requests waiting for their response were sent at
+        self._sent_times = collections.deque()
+        self._nr_of_places = 0
+        self._receive_buffer = None
+        self.use_sendfile = use_sendfile and hasattr(socket.socket, 'sendfile')
+        self.requests_sent = 0
+        # Seconds per image of the last response, from the time its request was sent
+        self.latency = None
+        self.broken = False
+        self.stale = False
+        # Whether the last failure counted against the server
+        self.server_failed = False
+        # Whether bytes of a response arrived since the connection was last idle
+        self._answered = False
+        self._send_buffer = None
+        self._socket = socket.create_connection((self.host, self.port),
+                                                timeout if connect_timeout is None else connect_timeout)
+        self._socket.settimeout(timeout)
+        # A batch request is written in several small sends with no reply in
+        # between, which Nagle's algorithm would hold back until the server's
+        # delayed ack
+        self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    # Classifies the image on the server, returning the list of detections or
+    # the error object sent by the server.
+    # Any error in the middle of an exchange leaves the connection marked as broken.
+    def get_detections(self, image):
+        if self.binary_results is not None or self.compressor is not None or self.server_filter is not None:
+            return self.get_batch_detections([image])[0]
+        self._take_place(True)
+        try:
+            detections = self._get_detections(image)
+        except Exception as e:
+            self._fail(e)
+            raise
+        self.breaker.success()
+        return detections
+
+    def _get_detections(self, image):
+        self._socket.sendall(to_bytes(image.extension))
+        self.receive_an_int_message()
+
+        self._socket.sendall(str(image.size).encode('ascii'))
+        self.receive_an_int_message()
+
+        self.send_image(image)
+        # The server may run the model before acknowledging the image or once
+        # asked for the response, so the limiter is told about both waits
+        sent_time = time.time()
+        ack_status = self.receive_an_int_message()
+
+        nr_of_resends = 0
+        while ack_status == ACK_RESEND:
+            if nr_of_resends == MAX_RESENDS:
+                raise ValueError("Server asked for " + image.name + " more than %d times" % (MAX_RESENDS + 1))
+            nr_of_resends += 1
+            self.metrics.increment('resends')
+            self.send_image(image)
+            sent_time = time.time()
+            ack_status = self.receive_an_int_message()
+
+        with self.metrics.timer('server'):
+            self._socket.sendall(READY_MESSAGE)
+            nr_of_bytes_to_receive = self.receive_an_int_message()
+        self.latency = time.time() - sent_time
+        self._give_place_back(self.latency, 1)
+        self._socket.sendall(READY_MESSAGE)
+
+        self.requests_sent += 1
+        # If there are no detections there is nothing else to read
+        if nr_of_bytes_to_receive <= 0:
+            return []
+        return self.receive_json(nr_of_bytes_to_receive)
+
+    # Returns the capabilities object sent by the server, or None if the server
+    # does not know the handshake, in which case the connection can not be
+    # used any more
+    def get_capabilities(self):
+        try:
+            self._socket.sendall(HANDSHAKE_MAGIC)
+            if self.recv_exactly(len(HANDSHAKE_MAGIC)) != HANDSHAKE_MAGIC:
+                # The ack of the extension of a lockstep request
+                self.close()
+                return None
+            capabilities = self.receive_json(self.receive_an_int_message())
+        except Exception:
+            self.broken = True
+            raise
+        if not isinstance(capabilities, dict):
+            self.broken = True
+            raise ValueError("Capabilities of the server are not an object")
+        return capabilities
+
+    # Classifies several images in a single round trip.
+    # Returns one entry per image, in the same order.
+    def get_batch_detections(self, images):
+        self.send_batch_request(images)
+        return self.receive_batch_response(len(images))
+
+    # Batch requests are self delimited, so several of them can be sent before
+    # reading their responses, which come back in the same order.
+    # Waits for the limiter to let the request in flight; with block=False
+    # returns False instead of waiting, and True once the request is sent.
+    def send_batch_request(self, images, block=True):
+        if not self._take_place(block):
+            return False
+        try:
+            if self.compressor is not None or self.server_filter is not None:
+                self._send_compressed_batch_request(images)
+            else:
+                self._send_batch_request(images)
+        except Exception as e:
+            self._fail(e)
+            raise
+        self._sent_times.append(time.time())
+        return True
+
+    def _send_batch_request(self, images):
+        magic = BATCH_MAGIC if self.binary_results is None else BINARY_BATCH_MAGIC
+        self._socket.sendall(magic + struct.pack("!i", len(images)))
+        for image in images:
+            file_extension = to_bytes(image.extension)
+            self._socket.sendall(struct.pack("!i", len(file_extension)) + file_extension +
+                                 struct.pack("!i", image.size))
+            self.send_image(image)
+
+    def _send_compressed_batch_request(self, images):
+        flags = 0
+        if self.binary_results is not None:
+            flags |= FLAG_BINARY_RESULTS
+        if self.compressor is not None:
+            flags |= FLAG_COMPRESSED_RESPONSE
+        server_filter = b''
+        if self.server_filter is not None:
+            flags |= FLAG_FILTER
+            server_filter = self.server_filter.encoded
+        self._socket.sendall(COMPRESSED_BATCH_MAGIC + struct.pack("!B", flags) + server_filter +
+                             struct.pack("!i", len(images)))
+        for image in images:
+            encoding, data = RAW, None
+            if self.compressor is not None:
+                try:
+                    encoding, data = self.compressor.compress(image)
+                except (IOError, OSError) as e:
+                    raise read_error(image, e)
+            file_extension = to_bytes(image.extension)
+            header = struct.pack("!i", len(file_extension)) + file_extension
+            if data is None:
+                self._socket.sendall(header + struct.pack("!Bii", encoding, image.size, image.size))
+                self.send_image(image)
+                continue
+            self._socket.sendall(header + struct.pack("!Bii", encoding, image.size, len(data)))
+            with self.metrics.timer('upload'):
+                self._socket.sendall(data)
+            self.metrics.increment('bytesSent', len(data))
+
+    def receive_batch_response(self, nr_of_images):
+        try:
+            with self.metrics.timer('server'):
+                nr_of_bytes_to_receive = self.receive_an_int_message()
+            # Includes the time the request waited behind the ones sent before it
+            seconds = time.time() - self._sent_times.popleft()
+            self.latency = seconds / max(1, nr_of_images)
+            self._give_place_back(seconds, nr_of_images)
+            if self.compressor is not None:
+                response = self.receive_compressed_response(nr_of_bytes_to_receive, nr_of_images)
+            elif self.binary_results is None:
+                response = self.receive_json(nr_of_bytes_to_receive)
+            else:
+                response = self.receive_binary_results(nr_of_bytes_to_receive, nr_of_images)
+        except Exception as e:
+            self._fail(e)
+            raise
+
+        self.requests_sent += 1
+        if not isinstance(response, list) or len(response) != nr_of_images:
+            error = ValueError("Batch response does not match the %d images sent" % nr_of_images)
+            self._fail(error)
+            raise error
+        self.breaker.success()
+        return response
+
+    # Only a timeout, or a failure once the server started answering, counts
+    # against the server in the circuit breaker and the concurrency limiter.
+    # An image that could not be read never does.
+    def _fail(self, error):
+        self.broken = True
+        self.stale = self.requests_sent > 0 and not self._answered and \
+            not isinstance(error, (socket.timeout, ImageReadError))
+        self.server_failed = not self.stale and not isinstance(error, ImageReadError)
+        # The requests in flight will never be answered
+        self._sent_times.clear()
+        if not self.server_failed:
+            while self._nr_of_places > 0:
+                self._nr_of_places -= 1
+                self.limiter.cancel()
+            return
+        self.breaker.failure()
+        while self._nr_of_places > 0:
+            self._give_place_back(None, 0)
+
+    def _take_place(self, block):
+        if not self.limiter.acquire(block):
+            return False
+        if self._nr_of_places == 0:
+            self._answered = False
+        self._nr_of_places += 1
+        return True
+
+    def _give_place_back(self, seconds, nr_of_images):
+        self._nr_of_places -= 1
+        self.limiter.release(seconds, nr_of_images)
+
+    def receive_json(self, nr_of_bytes_to_receive):
+        with self.metrics.timer('download'):
+            response = self.recv_exactly(nr_of_bytes_to_receive)
+        self.metrics.increment('bytesReceived', nr_of_bytes_to_receive)
+        with self.metrics.timer('parse'):
+            return json.loads(response.decode('utf-8'))
+
+    def receive_compressed_response(self, nr_of_bytes_to_receive, nr_of_images):
+        with self.metrics.timer('download'):
+            response = self.recv_exactly(nr_of_bytes_to_receive)
+        self.metrics.increment('bytesReceived', nr_of_bytes_to_receive)
+        with self.metrics.timer('parse'):
+            response = zlib.decompress(response)
+            if self.binary_results is None:
+                return json.loads(response.decode('utf-8'))
+            return self.binary_results.decode(response, len(response), nr_of_images)
+
+    def receive_binary_results(self, nr_of_bytes_to_receive, nr_of_images):
+        with self.metrics.timer('download'):
+            if MEMORYVIEW_SENDS:
+                response = self.recv_into_buffer(nr_of_bytes_to_receive)
+            else:
+                response = self.recv_exactly(nr_of_bytes_to_receive)
+        self.metrics.increment('bytesReceived', nr_of_bytes_to_receive)
+        with self.metrics.timer('parse'):
+            return self.binary_results.decode(response, nr_of_bytes_to_receive, nr_of_images)
+
+    # Receives the bytes into a buffer reused for every response of this
+    # connection, which only grows to fit the biggest one
+    def recv_into_buffer(self, nr_of_bytes):
+        if self._receive_buffer is None or len(self._receive_buffer) < nr_of_bytes:
+            self._receive_buffer = bytearray(max(nr_of_bytes, 64 * 1024))
+        view = memoryview(self._receive_buffer)
+        nr_of_bytes_received = 0
+        while nr_of_bytes_received < nr_of_bytes:
+            nr_of_bytes_read = self._socket.recv_into(view[nr_of_bytes_received:nr_of_bytes])
+            if not nr_of_bytes_read:
+                raise ConnectionClosed("Connection closed by the server, %d bytes missing" %
+                                       (nr_of_bytes - nr_of_bytes_received))
+            nr_of_bytes_received += nr_of_bytes_read
+        return self._receive_buffer
+
+    def receive_an_int_message(self):
+        return struct.unpack("!i", self.recv_exactly(4))[0]
+
+    # recv may return fewer bytes than asked, even for a 4 byte int
+    def recv_exactly(self, nr_of_bytes):
+        data = self._socket.recv(nr_of_bytes)
+        if data:
+            self._answered = True
+        if len(data) == nr_of_bytes:
+            return data
+        chunks = [data]
+        nr_of_bytes_left = nr_of_bytes - len(data)
+        while data and nr_of_bytes_left > 0:
+            data = self._socket.recv(nr_of_bytes_left)
+            chunks.append(data)
+            nr_of_bytes_left -= len(data)
+        if nr_of_bytes_left > 0:
+            raise ConnectionClosed("Connection closed by the server, %d bytes missing" % nr_of_bytes_left)
+        return b''.join(chunks)
+
+    def send_image(self, image):
+        start = time.time()
+        self._send_image(image)
+        self.metrics.record('upload', time.time() - start)
+        self.metrics.increment('bytesSent', image.size)
+
+    def _send_image(self, image):
+        if self.use_sendfile and getattr(image, 'path', None) is not None:
+            try:
+                f = open(image.path, 'rb')
+            except (IOError, OSError) as e:
+                raise read_error(image, e)
+            try:
+                nr_of_bytes_sent = self._socket.sendfile(f, 0, image.size)
+            finally:
+                f.close()
+            if nr_of_bytes_sent != image.size:
+                raise ImageReadError("Image " + image.name + " is shorter than its size")
+            return
+
+        try:
+            f = image.open()
+        except (IOError, OSError) as e:
+            raise read_error(image, e)
+        try:
+            if MEMORYVIEW_SENDS and hasattr(f, 'readinto'):
+                self._send_with_buffer(image, f)
+            else:
+                self._send_in_blocks(image, f)
+        finally:
+            f.close()
+
+    # Reads the image into a buffer that is reused for every image sent on
+    # this connection
+    def _send_with_buffer(self, image, f):
+        if self._send_buffer is None:
+            self._send_buffer = memoryview(bytearray(self.send_buffer_size))
+        file_readed_left = image.size
+        while file_readed_left > 0:
+            try:
+                nr_of_bytes_read = f.readinto(self._send_buffer[:min(file_readed_left, self.send_buffer_size)])
+            except (IOError, OSError) as e:
+                raise read_error(image, e)
+            if not nr_of_bytes_read:
+                raise ImageReadError("Image " + image.name + " is shorter than its size")
+            self._socket.sendall(self._send_buffer[:nr_of_bytes_read])
+            file_readed_left -= nr_of_bytes_read
+
+    def _send_in_blocks(self, image, f):
+        file_readed_left = image.size
+        while file_readed_left > 0:
+            try:
+                data = f.read(min(file_readed_left, self.send_buffer_size))
+            except (IOError, OSError) as e:
+                raise read_error(image, e)
+            if not data:
+                raise ImageReadError("Image " + image.name + " is shorter than its size")
+            self._socket.sendall(data)
+            file_readed_left -= len(data)
+
+    def close(self):
+        self.broken = True
+        try:
+            self._socket.close()
+        except socket.error:
+            pass
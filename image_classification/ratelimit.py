@@ -0,0 +1,37 @@
+# Token bucket used to limit how often something happens, e.g. per image log
+# messages.
+import threading
+import time
+
+
+class RateLimiter(object):
+
+    # Allows 'rate' events per second on average, in bursts of up to 'burst'
+    # events. A rate of 0 or less allows every event.
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(1.0, self.rate))
+        self._tokens = self.burst
+        self._last_time = time.time()
+        self._suppressed = 0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        if self.rate <= 0:
+            return True
+        with self._lock:
+            now = time.time()
+            self._tokens = min(self.burst, self._tokens + (now - self._last_time) * self.rate)
+            self._last_time = now
+            if self._tokens < 1.0:
+                self._suppressed += 1
+                return False
+            self._tokens -= 1.0
+            return True
+
+    # Returns how many events were refused since the last call
+    def take_suppressed(self):
+        with self._lock:
+            suppressed = self._suppressed
+            self._suppressed = 0
+            return suppressed
@@ -0,0 +1,84 @@
+# Compact binary encoding of the results of a batch request, cheaper to
+# receive and decode than the JSON response.
+#
+# It is asked for by starting the batch request with "ICB2" instead of
+# "ICB1". The response is still an int with its size followed by the
+# payload, which holds for every image:
+#   int n >= 0    the image has n detections, followed by n records of
+#                 unsigned short  class id, the position of the class in the
+#                                 classesOfInterest list
+#                 unsigned short  probability, in hundredths of a percent
+#                 int x 4         x, y, width and height of the box, in pixels
+#   int n < 0     the image could not be classified, followed by -n bytes of
+#                 the JSON error object
+import json
+import struct
+
+BINARY_BATCH_MAGIC = b'ICB2'
+
+_COUNT = struct.Struct("!i")
+_DETECTION = struct.Struct("!HHiiii")
+
+
+class BinaryResults(object):
+
+    # 'class_names' are the names of the classes in the order of their ids
+    def __init__(self, class_names):
+        self.class_names = list(class_names)
+        self.class_ids = dict((name, class_id) for class_id, name in enumerate(self.class_names))
+
+    def class_name(self, class_id):
+        if class_id < len(self.class_names):
+            return self.class_names[class_id]
+        return "class " + str(class_id)
+
+    # Decodes the first 'size' bytes of 'data' into one result per image,
+    # each being a list of detections or an error object
+    def decode(self, data, size, nr_of_images):
+        results = []
+        offset = 0
+        count_size = _COUNT.size
+        detection_size = _DETECTION.size
+        unpack_count = _COUNT.unpack_from
+        unpack_detection = _DETECTION.unpack_from
+        class_name = self.class_name
+        for i in range(nr_of_images):
+            if offset + count_size > size:
+                raise ValueError("Binary response too short for %d images" % nr_of_images)
+            count = unpack_count(data, offset)[0]
+            offset += count_size
+            if count < 0:
+                if offset - count > size:
+                    raise ValueError("Binary response too short for %d images" % nr_of_images)
+                results.append(json.loads(bytes(data[offset:offset - count]).decode('utf-8')))
+                offset -= count
+                continue
+            if offset + count * detection_size > size:
+                raise ValueError("Binary response too short for %d images" % nr_of_images)
+            detections = []
+            for j in range(count):
+                class_id, probability, x, y, width, height = unpack_detection(data, offset)
+                offset += detection_size
+                detections.append({'className': class_name(class_id), 'probability': probability / 100.0,
+                                   'box': {'x': x, 'y': y, 'width': width, 'height': height}})
+            results.append(detections)
+        if offset != size:
+            raise ValueError("Binary response longer than the results of %d images" % nr_of_images)
+        return results
+
+    # Encodes results as the server does, for the stand-in servers and tests
+    def encode(self, results):
+        chunks = []
+        for detections in results:
+            if not isinstance(detections, list):
+                error = json.dumps(detections).encode('utf-8')
+                chunks.append(_COUNT.pack(-len(error)) + error)
+                continue
+            chunks.append(_COUNT.pack(len(detections)))
+            for detection in detections:
+                box = detection.get('box') or {}
+                chunks.append(_DETECTION.pack(self.class_ids[detection['className']],
+                                              int(round(detection['probability'] * 100)),
+                                              box.get('x', 0), box.get('y', 0),
+                                              box.get('width', 0), box.get('height', 0)))
+        return b''.join(chunks)
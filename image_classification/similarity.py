@@ -0,0 +1,129 @@
+# Finds the images that were already classified in another size or quality,
+# like the thumbnails and the recompressed copies of a photo, so they reuse
+# its detections instead of being classified again.
+#
+# Images are compared by their difference hash: the 64 bits that tell, in a
+# 9x8 grayscale version of the image, whether each pixel is brighter than the
+# one on its right. Resizing and recompressing change few of those bits.
+import copy
+import threading
+
+from .images import restore_detections
+
+HASH_WIDTH = 9
+HASH_HEIGHT = 8
+# Side of the grayscale thumbnail callers decode the images to
+THUMBNAIL_SIDE = 32
+# Images whose width / height ratios differ more than this are never near
+# duplicates, so a crop does not reuse boxes that would not fit it
+MAX_ASPECT_RATIO_DIFFERENCE = 0.02
+# Gray levels a pixel must be brighter than the next one by, so the noise of
+# recompression does not flip the bits of the flat areas of an image
+MIN_BRIGHTNESS_DIFFERENCE = 1.0
+
+
+# Difference hash of a grayscale image given as its rows of pixel values,
+# one after the other. The image, at least 9x8 pixels, is averaged down to
+# 9x8 first, so callers only need to decode a small version of it.
+def difference_hash(pixels, width, height):
+    if width < HASH_WIDTH or height < HASH_HEIGHT:
+        raise ValueError("A %dx%d image is too small to hash" % (width, height))
+    cells = []
+    for row in range(HASH_HEIGHT):
+        top = row * height // HASH_HEIGHT
+        bottom = (row + 1) * height // HASH_HEIGHT
+        for column in range(HASH_WIDTH):
+            left = column * width // HASH_WIDTH
+            right = (column + 1) * width // HASH_WIDTH
+            total = 0
+            for y in range(top, bottom):
+                offset = y * width
+                total += sum(pixels[offset + left:offset + right])
+            cells.append(float(total) / ((bottom - top) * (right - left)))
+    image_hash = 0
+    for row in range(HASH_HEIGHT):
+        for column in range(HASH_WIDTH - 1):
+            index = row * HASH_WIDTH + column
+            image_hash = (image_hash << 1) | (1 if cells[index] - cells[index + 1] > MIN_BRIGHTNESS_DIFFERENCE else 0)
+    return image_hash
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count('1')
+
+
+# Index of hashes that finds the ones within a Hamming distance of a hash
+# without comparing it with all of them (multi-index hashing). The bits of
+# the hashes are split in max_distance + 1 chunks: two hashes at most
+# max_distance bits apart have at least one chunk in common, so only the
+# hashes sharing a chunk with the one looked for need to be compared.
+class HammingIndex(object):
+
+    def __init__(self, max_distance, nr_of_bits=64):
+        self.max_distance = max_distance
+        nr_of_chunks = max_distance + 1
+        # (shift, mask) of every chunk
+        self._chunks = []
+        for i in range(nr_of_chunks):
+            start = i * nr_of_bits // nr_of_chunks
+            end = (i + 1) * nr_of_bits // nr_of_chunks
+            self._chunks.append((start, (1 << (end - start)) - 1))
+        self._tables = [{} for chunk in self._chunks]
+        self._entries = []
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, key, value):
+        entry_id = len(self._entries)
+        self._entries.append((key, value))
+        for (shift, mask), table in zip(self._chunks, self._tables):
+            table.setdefault((key >> shift) & mask, []).append(entry_id)
+
+    # Returns the (distance, key, value) of every value whose key is at most
+    # max_distance away, closest first
+    def find(self, key):
+        candidates = set()
+        for (shift, mask), table in zip(self._chunks, self._tables):
+            candidates.update(table.get((key >> shift) & mask, ()))
+        found = []
+        for entry_id in candidates:
+            entry_key, value = self._entries[entry_id]
+            distance = hamming_distance(key, entry_key)
+            if distance <= self.max_distance:
+                found.append((distance, entry_key, value))
+        found.sort(key=lambda match: match[0])
+        return found
+
+
+class NearDuplicateIndex(object):
+
+    # Images whose hashes differ in at most 'max_distance' of their 64 bits
+    # are near duplicates
+    def __init__(self, max_distance):
+        self.max_distance = max_distance
+        self._index = HammingIndex(max_distance)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._index)
+
+    # Records the detections of a classified image of 'width' x 'height' pixels
+    def add(self, image_hash, name, width, height, detections):
+        with self._lock:
+            self._index.add(image_hash, (name, width, height, detections))
+
+    # Returns the name of the closest near duplicate of the image, the Hamming
+    # distance between them and its detections, with the boxes mapped to the
+    # size of the image. Returns None if there is no near duplicate.
+    def find(self, image_hash, width, height):
+        with self._lock:
+            matches = self._index.find(image_hash)
+        aspect_ratio = float(width) / height
+        for distance, key, (name, original_width, original_height, detections) in matches:
+            if abs(float(original_width) / original_height - aspect_ratio) > MAX_ASPECT_RATIO_DIFFERENCE * aspect_ratio:
+                continue
+            # Copied, as the boxes are scaled in place
+            detections = restore_detections(copy.deepcopy(detections), float(original_width) / width)
+            return name, distance, detections
+        return None
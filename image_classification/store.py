@@ -0,0 +1,112 @@
+# Detections shared by the cases and the workstations that point to the same
+# directory, e.g. on a network share, so the images found in most cases
+# (wallpapers, application assets, sample pictures) are classified once.
+#
+# Every response is a JSON file named after the hash of the image content,
+# under a directory named after the model that produced it:
+#   <directory>/<model key>/<first 2 digits of the hash>/<hash>.json
+# Files are written to a temporary name and renamed, and two writers of the
+# same file write the same content, so no locking is needed between them.
+import hashlib
+import io
+import json
+import os
+import re
+import threading
+import uuid
+
+MODEL_FILE_NAME = 'model.json'
+# MD5 hashes in a known files list, e.g. a column of an NSRL CSV file
+MD5_PATTERN = re.compile(r'\b[0-9a-fA-F]{32}\b')
+
+
+# Key of the responses of a model: any change of the model or of the class
+# list, which gives the names of the binary results, leads to other responses
+def model_key(model_version, class_names):
+    return hashlib.md5(json.dumps([model_version, list(class_names)]).encode('utf-8')).hexdigest()[:16]
+
+
+class SharedDetectionStore(object):
+
+    def __init__(self, directory, model_version, class_names):
+        self.model_version = model_version
+        self.key = model_key(model_version, class_names)
+        self.directory = os.path.join(directory, self.key)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if not os.path.isdir(self.directory):
+            try:
+                os.makedirs(self.directory)
+            except OSError:
+                # Created by another workstation in the meantime
+                if not os.path.isdir(self.directory):
+                    raise
+        # Tells which model the directory is for, to whoever cleans the store up
+        model_path = os.path.join(self.directory, MODEL_FILE_NAME)
+        if not os.path.exists(model_path):
+            self._write(model_path, json.dumps({'modelVersion': model_version, 'classNames': list(class_names)}))
+
+    # Returns the stored detections of the image or None
+    def get(self, content_hash):
+        try:
+            with io.open(self._path(content_hash), 'r', encoding='utf-8') as f:
+                detections = json.load(f)
+        except (IOError, OSError, ValueError):
+            # Not classified yet with this model
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return detections
+
+    def put(self, content_hash, detections):
+        path = self._path(content_hash)
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                if not os.path.isdir(directory):
+                    raise
+        self._write(path, json.dumps(detections))
+
+    def _path(self, content_hash):
+        content_hash = content_hash.lower()
+        return os.path.join(self.directory, content_hash[:2], content_hash + '.json')
+
+    @staticmethod
+    def _write(path, data):
+        temporary_path = path + '.' + uuid.uuid4().hex + '.tmp'
+        with io.open(temporary_path, 'w', encoding='utf-8') as f:
+            f.write(data if isinstance(data, type(u'')) else data.decode('utf-8'))
+        try:
+            os.rename(temporary_path, path)
+        except OSError:
+            # On Windows the file can not be replaced, it was written by
+            # another workstation with the same content
+            os.remove(temporary_path)
+
+
+# MD5 hashes of the files known not to be of interest, whose images are not
+# classified at all. The hashes are held in memory: for a list as big as the
+# full NSRL reference data set, Autopsy's hash lookup module does better.
+class KnownFiles(object):
+
+    # The file holds one hash per line, anything else on the line is ignored,
+    # so a plain list of hashes and an NSRL CSV file both work
+    def __init__(self, path):
+        self.path = path
+        self._hashes = set()
+        with io.open(path, 'r', encoding='utf-8', errors='replace') as f:
+            for line in f:
+                match = MD5_PATTERN.search(line)
+                if match is not None:
+                    self._hashes.add(match.group(0).lower())
+
+    def __len__(self):
+        return len(self._hashes)
+
+    def __contains__(self, content_hash):
+        return content_hash.lower() in self._hashes
@@ -0,0 +1,279 @@
+# Stand-ins for the Java and Autopsy classes ImageClassification.py imports,
+# so that the ingest module itself can run on CPython in the tests.
+#
+# The classes the ingest of files calls behave as they do in Autopsy, with
+# what they are given recorded for the tests. Every other name of the java,
+# javax and org packages is an empty class whose attributes are empty classes
+# too, e.g. the Swing widgets of the settings panel or the enum constants.
+# The ones named as exceptions are Python exceptions with a getMessage().
+import importlib.abc
+import importlib.machinery
+import os
+import re
+import sys
+import threading
+import types
+
+STUB_PACKAGES = ('java', 'javax', 'org')
+MODULE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ImageClassification.py')
+
+
+class _StubClass(type):
+
+    def __getattr__(cls, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        value = _stub_class(name)
+        setattr(cls, name, value)
+        return value
+
+
+def _stub_class(name):
+    if name.endswith('Exception'):
+        return _StubClass(name, (Exception,), {'getMessage': lambda self: self.args[0] if self.args else None})
+    return _StubClass(name, (object,), {'__init__': lambda self, *args: None})
+
+
+class _StubModule(types.ModuleType):
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        value = _stub_class(name)
+        setattr(self, name, value)
+        return value
+
+
+class _StubFinder(importlib.abc.MetaPathFinder, importlib.abc.Loader):
+
+    def find_spec(self, name, path, target=None):
+        if name.split('.')[0] not in STUB_PACKAGES:
+            return None
+        return importlib.machinery.ModuleSpec(name, self, is_package=True)
+
+    def create_module(self, spec):
+        return _StubModule(spec.name)
+
+    def exec_module(self, module):
+        module.__path__ = []
+        for name, value in FAKES.get(module.__name__, {}).items():
+            setattr(module, name, value)
+
+
+class Logger(object):
+    records = []
+
+    @classmethod
+    def getLogger(cls, name):
+        return cls()
+
+    def isLoggable(self, level):
+        return True
+
+    def logp(self, level, class_name, method_name, msg):
+        Logger.records.append((level, class_name, method_name, msg))
+
+
+class IngestModuleReferenceCounter(object):
+
+    def __init__(self):
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def incrementAndGet(self, job_id):
+        with self._lock:
+            self._counts[job_id] = self._counts.get(job_id, 0) + 1
+            return self._counts[job_id]
+
+    def decrementAndGet(self, job_id):
+        with self._lock:
+            self._counts[job_id] -= 1
+            return self._counts[job_id]
+
+
+class Blackboard(object):
+    BlackboardException = _stub_class('BlackboardException')
+
+    def __init__(self):
+        self.indexed = []
+
+    def indexArtifact(self, artifact):
+        self.indexed.append(artifact)
+
+
+class Case(object):
+    current = None
+
+    def __init__(self, module_directory):
+        self.module_directory = module_directory
+        self.blackboard = Blackboard()
+
+    @classmethod
+    def getCurrentCase(cls):
+        return cls.current
+
+    def getModuleDirectory(self):
+        return self.module_directory
+
+    def getServices(self):
+        return self
+
+    def getBlackboard(self):
+        return self.blackboard
+
+
+class IngestServices(object):
+    instance = None
+
+    def __init__(self):
+        self.events = []
+        self.messages = []
+
+    @classmethod
+    def getInstance(cls):
+        return cls.instance
+
+    def fireModuleDataEvent(self, event):
+        self.events.append(event)
+
+    def postMessage(self, message):
+        self.messages.append(message)
+
+
+class BlackboardAttribute(object):
+    ATTRIBUTE_TYPE = _stub_class('ATTRIBUTE_TYPE')
+
+    def __init__(self, type_id, module_name, value):
+        self.value = value
+
+
+class Artifact(object):
+
+    def __init__(self, file):
+        self.file = file
+        self.attributes = []
+
+    def addAttribute(self, attribute):
+        self.attributes.append(attribute)
+
+    def getDisplayName(self):
+        return "Interesting file"
+
+
+# Byte array of Jython, as made by jarray.zeros
+class JavaByteArray(bytearray):
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return JavaByteArray(bytearray.__getitem__(self, index))
+        return bytearray.__getitem__(self, index)
+
+    def tostring(self):
+        return bytes(self)
+
+
+def zeros(size, type_code):
+    return JavaByteArray(size)
+
+
+# AbstractFile of a data source
+class AbstractFile(object):
+
+    def __init__(self, file_id, name, content, mime_type=None):
+        self.file_id = file_id
+        self.name = name
+        self.content = content
+        self.mime_type = mime_type
+        self.artifacts = []
+
+    def getId(self):
+        return self.file_id
+
+    def getName(self):
+        return self.name
+
+    def getParentPath(self):
+        return "/images/"
+
+    def getNameExtension(self):
+        return self.name.rpartition('.')[2] if '.' in self.name else ""
+
+    def getSize(self):
+        return len(self.content)
+
+    def getMIMEType(self):
+        return self.mime_type
+
+    def getMd5Hash(self):
+        return None
+
+    def getKnown(self):
+        return None
+
+    def getType(self):
+        return None
+
+    def isFile(self):
+        return True
+
+    def read(self, buffer, offset, length):
+        data = self.content[offset:offset + length]
+        buffer[:len(data)] = data
+        return len(data)
+
+    def newArtifact(self, artifact_type):
+        artifact = Artifact(self)
+        self.artifacts.append(artifact)
+        return artifact
+
+    # Titles of the artifacts created for the file
+    def titles(self):
+        return [artifact.attributes[0].value for artifact in self.artifacts]
+
+
+class DataSource(object):
+
+    def getId(self):
+        return 1
+
+
+class IngestJobContext(object):
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+
+    def getJobId(self):
+        return self.job_id
+
+    def getDataSource(self):
+        return DataSource()
+
+
+FAKES = {
+    'org.sleuthkit.autopsy.coreutils': {'Logger': Logger},
+    'org.sleuthkit.autopsy.ingest': {'IngestModuleReferenceCounter': IngestModuleReferenceCounter,
+                                     'IngestServices': IngestServices},
+    'org.sleuthkit.autopsy.casemodule': {'Case': Case},
+    'org.sleuthkit.autopsy.casemodule.services': {'Blackboard': Blackboard},
+    'org.sleuthkit.datamodel': {'BlackboardAttribute': BlackboardAttribute},
+}
+
+
+# Imports ImageClassification.py with the stand-ins. It is Jython 2.7 code,
+# whose long literals are the only syntax CPython 3 does not take.
+def load_module():
+    if 'ImageClassification' in sys.modules:
+        return sys.modules['ImageClassification']
+    sys.meta_path.insert(0, _StubFinder())
+    jarray = types.ModuleType('jarray')
+    jarray.zeros = zeros
+    sys.modules['jarray'] = jarray
+    IngestServices.instance = IngestServices()
+
+    with open(MODULE_PATH) as f:
+        source = re.sub(r'\b(\d+)L\b', r'\1', f.read())
+    module = types.ModuleType('ImageClassification')
+    module.__file__ = MODULE_PATH
+    sys.modules['ImageClassification'] = module
+    exec(compile(source, MODULE_PATH, 'exec'), module.__dict__)
+    return module
@@ -0,0 +1,51 @@
+# The tests run the client package against the stand-in server of the
+# benchmarks, on CPython:
+#   python -m pytest -q
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from image_classification import MemoryImage
+from stand_in_server import StandInServer
+
+# JPEG signature followed by a start of frame of 64x64 pixels
+JPEG_DATA = b'\xff\xd8\xff\xc0\x00\x11\x08\x00\x40\x00\x40\x03' + b'\x00' * 4096
+DETECTIONS = [{"className": "person", "probability": 90.0, "box": {"x": 1, "y": 2, "width": 3, "height": 4}},
+              {"className": "dog", "probability": 40.0, "box": {"x": 5, "y": 6, "width": 7, "height": 8}}]
+CLASS_NAMES = ["person", "bicycle", "dog"]
+
+
+def make_image(name="image.jpg", data=JPEG_DATA):
+    return MemoryImage(name, os.path.splitext(name)[1], data)
+
+
+# Image whose content can not be read any more, e.g. on a failing disk
+class UnreadableImage(object):
+    name = "image.bmp"
+    extension = ".bmp"
+    size = len(JPEG_DATA)
+
+    def open(self):
+        raise IOError("Input/output error")
+
+
+# Starts stand-in servers with the given options, all stopped after the test
+@pytest.fixture
+def stand_in():
+    servers = []
+
+    def start(**options):
+        options.setdefault('detections', DETECTIONS)
+        options.setdefault('class_names', CLASS_NAMES)
+        server = StandInServer(**options).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.stop()
@@ -0,0 +1,136 @@
+import socket
+import time
+
+import pytest
+
+from conftest import DETECTIONS, UnreadableImage, make_image
+from image_classification import ImageReadError, IngestMetrics, LoadBalancer, NoHealthyServer
+
+
+def balance(*servers, **options):
+    options.setdefault('timeout', 5)
+    return LoadBalancer([(server.host, server.port, 1.0) for server in servers], 1, **options)
+
+
+def endpoint_state(balancer, server):
+    name = "%s:%d" % (server.host, server.port)
+    return [endpoint for endpoint in balancer.state() if endpoint['endpoint'] == name][0]
+
+
+# A server that is not listening any more, as one that went down
+def stopped_server(stand_in):
+    server = stand_in()
+    server.stop()
+    return server
+
+
+def test_requests_go_to_the_faster_server(stand_in):
+    fast = stand_in(latency=0.001)
+    slow = stand_in(latency=0.02)
+    balancer = balance(fast, slow)
+    for i in range(30):
+        assert balancer.get_detections(make_image()) == DETECTIONS
+    assert fast.nr_of_images > slow.nr_of_images
+    balancer.close()
+
+
+def test_weights_share_the_requests(stand_in):
+    heavy = stand_in(latency=0.005)
+    light = stand_in(latency=0.005)
+    balancer = LoadBalancer([(heavy.host, heavy.port, 4.0), (light.host, light.port, 1.0)], 1, timeout=5)
+    for i in range(30):
+        balancer.get_detections(make_image())
+    assert heavy.nr_of_images > light.nr_of_images
+    balancer.close()
+
+
+def test_failed_request_goes_to_the_next_server(stand_in):
+    server = stand_in()
+    metrics = IngestMetrics()
+    balancer = balance(stopped_server(stand_in), server, metrics=metrics)
+    for i in range(3):
+        assert balancer.get_detections(make_image()) == DETECTIONS
+    assert server.nr_of_images == 3
+    assert metrics.snapshot()['counters']['failovers'] >= 1
+    balancer.close()
+
+
+def test_server_that_can_not_be_reached_is_ejected(stand_in):
+    server = stand_in()
+    down = stopped_server(stand_in)
+    metrics = IngestMetrics()
+    balancer = balance(down, server, metrics=metrics, max_failures=1, probe_interval=60)
+    for i in range(5):
+        balancer.get_detections(make_image())
+    assert not endpoint_state(balancer, down)['healthy']
+    assert endpoint_state(balancer, server)['healthy']
+    assert metrics.snapshot()['counters']['ejections'] == 1
+    balancer.close()
+
+
+def test_ejected_server_is_brought_back_by_the_prober(stand_in):
+    down = stand_in()
+    balancer = balance(down, max_failures=1, probe_interval=0.05)
+    host, port = down.host, down.port
+    down.stop()
+    with pytest.raises(socket.error):
+        balancer.get_detections(make_image())
+    assert not balancer.state()[0]['healthy']
+    with pytest.raises(NoHealthyServer):
+        balancer.get_detections(make_image())
+
+    stand_in(host=host, port=port)
+    deadline = time.time() + 5
+    while not balancer.state()[0]['healthy'] and time.time() < deadline:
+        time.sleep(0.01)
+    assert balancer.get_detections(make_image()) == DETECTIONS
+    balancer.close()
+
+
+def test_error_of_the_last_server_is_raised(stand_in):
+    balancer = balance(stopped_server(stand_in), stopped_server(stand_in))
+    with pytest.raises(socket.error):
+        balancer.get_detections(make_image())
+    balancer.close()
+
+
+# Errors other than the ones of the connection, e.g. a response that can not be
+# decoded, still end the request on its endpoint
+def test_requests_that_raise_other_errors_are_done(stand_in):
+    balancer = balance(stand_in(), stand_in())
+
+    def fail(connection):
+        raise ValueError("Response can not be decoded")
+
+    for i in range(6):
+        with pytest.raises(ValueError):
+            balancer.run(fail)
+    assert [endpoint['inFlight'] for endpoint in balancer.state()] == [0, 0]
+    balancer.close()
+
+
+def test_connections_are_given_back_to_their_server(stand_in):
+    first = stand_in()
+    second = stand_in()
+    balancer = balance(first, second)
+    connections = [balancer.acquire(), balancer.acquire()]
+    assert sorted(connection.port for connection in connections) == sorted([first.port, second.port])
+    assert [endpoint['inFlight'] for endpoint in balancer.state()] == [1, 1]
+    for connection in connections:
+        balancer.release(connection)
+    assert [endpoint['inFlight'] for endpoint in balancer.state()] == [0, 0]
+    balancer.close()
+
+
+# Neither through run() nor on a connection held outside of it
+def test_unreadable_image_does_not_eject_the_server(stand_in):
+    balancer = balance(stand_in(), max_failures=1)
+    with pytest.raises(ImageReadError):
+        balancer.get_detections(UnreadableImage())
+    connection = balancer.acquire()
+    with pytest.raises(ImageReadError):
+        connection.get_batch_detections([UnreadableImage()])
+    balancer.release(connection)
+    assert balancer.state()[0]['healthy']
+    assert balancer.get_detections(make_image()) == DETECTIONS
+    balancer.close()
@@ -0,0 +1,45 @@
+import pytest
+
+from image_classification.breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpen, backoff_delay
+
+
+def test_breaker_opens_after_failures_and_closes_on_success():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0)
+    breaker.failure()
+    assert breaker.state == CLOSED
+    breaker.failure()
+    assert breaker.state == OPEN
+    assert breaker.allow()
+    breaker.success()
+    assert breaker.state == CLOSED
+
+
+# Only one request tests the server, and if it fails the circuit opens again
+def test_failed_test_request_opens_the_circuit_again():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=0)
+    for i in range(3):
+        breaker.failure()
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow()
+    breaker.failure()
+    assert breaker.state == OPEN
+
+
+def test_open_circuit_refuses_requests():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+    breaker.failure()
+    with pytest.raises(CircuitOpen):
+        breaker.check()
+
+
+def test_breaker_without_threshold_never_opens():
+    breaker = CircuitBreaker(failure_threshold=0)
+    for i in range(10):
+        breaker.failure()
+    assert breaker.allow()
+
+
+def test_backoff_delay_grows_up_to_the_cap():
+    assert all(0 <= backoff_delay(1, base=0.1) <= 0.1 for i in range(20))
+    assert all(0 <= backoff_delay(10, base=0.1, cap=1.0) <= 1.0 for i in range(20))
@@ -0,0 +1,49 @@
+from conftest import CLASS_NAMES, DETECTIONS
+from image_classification import ResultCache, model_key
+
+
+def test_cached_detections_survive_a_restart(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = ResultCache(path, 10, model_key("1", CLASS_NAMES))
+    cache.put("hash", DETECTIONS)
+    cache.close()
+
+    cache = ResultCache(path, 10, model_key("1", CLASS_NAMES))
+    assert cache.get("hash") == DETECTIONS
+    assert cache.get("other hash") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+    cache.close()
+
+
+def test_cache_is_emptied_for_another_model(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = ResultCache(path, 10, model_key("1", CLASS_NAMES))
+    cache.put("hash", DETECTIONS)
+    cache.close()
+
+    cache = ResultCache(path, 10, model_key("2", CLASS_NAMES))
+    assert cache.get("hash") is None
+    cache.close()
+
+
+def test_cache_is_emptied_for_another_class_list(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = ResultCache(path, 10, model_key("1", CLASS_NAMES))
+    cache.put("hash", DETECTIONS)
+    cache.close()
+
+    cache = ResultCache(path, 10, model_key("1", list(reversed(CLASS_NAMES))))
+    assert cache.get("hash") is None
+    cache.close()
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache.db"), 10, model_key("1", CLASS_NAMES))
+    for i in range(10):
+        cache.put("hash %d" % i, DETECTIONS)
+    assert cache.get("hash 0") == DETECTIONS
+    cache.put("hash 10", DETECTIONS)
+    assert cache.get("hash 0") == DETECTIONS
+    assert cache.get("hash 1") is None
+    assert cache.get("hash 10") == DETECTIONS
+    cache.close()
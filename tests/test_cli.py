@@ -0,0 +1,94 @@
+import io
+import json
+import os
+
+import pytest
+
+from conftest import JPEG_DATA
+from image_classification import SharedDetectionStore
+from image_classification.cli import BulkClassifier, main
+
+CLASSES_OF_INTEREST = [{'name': "person", 'enabled': True}, {'name': "dog", 'enabled': True}]
+
+
+def make_config(server, **options):
+    config = {'server': {'host': server.host, 'port': server.port, 'readTimeout': 5}, 'imageFormats': ["jpg"],
+              'minFileSize': 0, 'minProbability': 50, 'classesOfInterest': CLASSES_OF_INTEREST}
+    config.update(options)
+    return config
+
+
+# Directory with images, among them a renamed copy, and a file that is not an image
+@pytest.fixture
+def images(tmp_path):
+    directory = tmp_path / "images"
+    (directory / "photos").mkdir(parents=True)
+    for path in ("image1.jpg", "photos/image2.jpg", "photos/image3.JPG"):
+        (directory / path).write_bytes(JPEG_DATA)
+    (directory / "notes.txt").write_bytes(b"text")
+    (directory / "empty.jpg").write_bytes(b"")
+    return directory
+
+
+def read_records(path):
+    with io.open(path, 'r', encoding='utf-8') as f:
+        return dict((os.path.basename(record['path']), record) for record in map(json.loads, f))
+
+
+@pytest.mark.parametrize('batch_size', [1, 4])
+def test_directory_is_classified(stand_in, images, tmp_path, batch_size):
+    server = stand_in()
+    config_path = tmp_path / "configs.json"
+    config_path.write_text(json.dumps(make_config(server)))
+    output_path = str(tmp_path / "detections.jsonl")
+    main([str(images), '-c', str(config_path), '-o', output_path, '-b', str(batch_size), '--no-cache',
+          '--progress', '0'])
+
+    records = read_records(output_path)
+    assert sorted(records) == ["empty.jpg", "image1.jpg", "image2.jpg", "image3.JPG"]
+    for name in ("image1.jpg", "image2.jpg", "image3.JPG"):
+        assert [detection['className'] for detection in records[name]['detections']] == ["person"]
+    assert records["empty.jpg"]['skipped'] == "file too small"
+    assert server.nr_of_images == 3
+
+
+def test_unfiltered_detections_are_all_written(stand_in, images, tmp_path):
+    server = stand_in()
+    output = io.StringIO()
+    classifier = BulkClassifier(make_config(server), output, 2, use_cache=False, unfiltered=True,
+                                progress_interval=0)
+    classifier.classify([str(images / "image1.jpg")])
+    classifier.close()
+    record = json.loads(output.getvalue())
+    assert [detection['className'] for detection in record['detections']] == ["person", "dog"]
+
+
+def test_cached_detections_are_not_classified_again(stand_in, images, tmp_path):
+    server = stand_in()
+    cache_path = str(tmp_path / "cache.db")
+    for i in range(2):
+        output = io.StringIO()
+        classifier = BulkClassifier(make_config(server), output, 2, use_cache=True, progress_interval=0,
+                                    cache_location=cache_path)
+        classifier.classify([str(images / "image1.jpg")])
+        classifier.close()
+    assert json.loads(output.getvalue())['cached']
+    assert server.nr_of_images == 1
+
+
+# A store that can not be written to does not cost the image its detections
+@pytest.mark.parametrize('batch_size', [1, 4])
+def test_detections_are_written_when_the_store_fails(stand_in, images, tmp_path, monkeypatch, batch_size):
+    def put(self, content_hash, detections):
+        raise IOError("No space left on device")
+
+    monkeypatch.setattr(SharedDetectionStore, 'put', put)
+    server = stand_in()
+    output = io.StringIO()
+    classifier = BulkClassifier(make_config(server, sharedStorePath=str(tmp_path / "store"), cacheEnabled=False),
+                                output, 2, batch_size, progress_interval=0)
+    classifier.classify([str(images / "image1.jpg")])
+    classifier.close()
+    record = json.loads(output.getvalue())
+    assert [detection['className'] for detection in record['detections']] == ["person"]
+    assert classifier.metrics.snapshot()['counters']['sharedStoreErrors'] == 1
@@ -0,0 +1,88 @@
+import os
+import struct
+import zlib
+
+from conftest import CLASS_NAMES, DETECTIONS, make_image
+from image_classification import BinaryResults, Compressor, ServerConnection
+from image_classification.compression import MIN_COMPRESSED_IMAGE_SIZE, NR_OF_SAMPLES, RAW, ZLIB
+from image_classification.protocol import COMPRESSED_BATCH_MAGIC, FLAG_BINARY_RESULTS, FLAG_COMPRESSED_RESPONSE
+
+BITMAP_DATA = b'BM' + b'\x00\x01\x02\x03' * 4096
+
+
+# Socket that keeps a copy of everything sent on it
+class RecordingSocket(object):
+
+    def __init__(self, sock):
+        self._socket = sock
+        self.sent = bytearray()
+
+    def sendall(self, data):
+        self.sent += bytes(data)
+        self._socket.sendall(data)
+
+    def __getattr__(self, name):
+        return getattr(self._socket, name)
+
+
+# Splits an ICB3 request into its flags and its (extension, encoding, size, data) images
+def parse_compressed_batch(request):
+    assert request[:4] == COMPRESSED_BATCH_MAGIC
+    flags, nr_of_images = struct.unpack("!Bi", request[4:9])
+    offset = 9
+    images = []
+    for i in range(nr_of_images):
+        extension_size = struct.unpack("!i", request[offset:offset + 4])[0]
+        extension = request[offset + 4:offset + 4 + extension_size].decode('utf-8')
+        offset += 4 + extension_size
+        encoding, size, data_size = struct.unpack("!Bii", request[offset:offset + 9])
+        offset += 9
+        images.append((extension, encoding, size, request[offset:offset + data_size]))
+        offset += data_size
+    assert offset == len(request)
+    return flags, images
+
+
+def test_uncompressed_formats_round_trip():
+    compressor = Compressor()
+    encoding, data = compressor.compress(make_image("image.bmp", BITMAP_DATA))
+    assert encoding == ZLIB
+    assert len(data) < len(BITMAP_DATA) // 10
+    assert zlib.decompress(data) == BITMAP_DATA
+
+
+def test_compressed_formats_are_sent_as_they_are():
+    compressor = Compressor()
+    assert compressor.compress(make_image()) == (RAW, None)
+    assert compressor.compress(make_image("image.bmp", b'BM' * (MIN_COMPRESSED_IMAGE_SIZE // 4))) == (RAW, None)
+
+
+# Random looking pixels are sent as they are, and after enough of them the
+# extension is not compressed any more
+def test_extensions_that_do_not_compress_are_given_up():
+    compressor = Compressor()
+    data = os.urandom(16 * 1024)
+    for i in range(NR_OF_SAMPLES):
+        encoding, sent_data = compressor.compress(make_image("image.tif", data))
+        assert encoding == RAW
+        assert sent_data == data
+    assert compressor.compress(make_image("image.tif", data)) == (RAW, None)
+
+
+def test_compressed_batch_frame_round_trip(stand_in):
+    server = stand_in()
+    connection = ServerConnection(server.host, server.port, timeout=5, binary_results=BinaryResults(CLASS_NAMES),
+                                  compressor=Compressor())
+    connection._socket = RecordingSocket(connection._socket)
+    results = connection.get_batch_detections([make_image(), make_image("image.bmp", BITMAP_DATA)])
+    assert results == [DETECTIONS] * 2
+
+    flags, images = parse_compressed_batch(bytes(connection._socket.sent))
+    assert flags == FLAG_BINARY_RESULTS | FLAG_COMPRESSED_RESPONSE
+    extension, encoding, size, data = images[0]
+    assert (extension, encoding, size) == (".jpg", RAW, len(data))
+    assert data == make_image().data
+    extension, encoding, size, data = images[1]
+    assert (extension, encoding, size) == (".bmp", ZLIB, len(BITMAP_DATA))
+    assert zlib.decompress(data) == BITMAP_DATA
+    connection.close()
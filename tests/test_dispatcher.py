@@ -0,0 +1,58 @@
+import threading
+
+from conftest import CLASS_NAMES, DETECTIONS, make_image
+from image_classification import AsyncClassifier, BinaryResults, ConnectionPool, LoadBalancer
+
+
+def classify(classifier, nr_of_images):
+    results = []
+    lock = threading.Lock()
+
+    def callback(detections):
+        with lock:
+            results.append(detections)
+
+    for i in range(nr_of_images):
+        classifier.submit(make_image("image%d.jpg" % i), callback)
+    classifier.close()
+    return results
+
+
+def test_every_image_gets_its_result(stand_in):
+    server = stand_in(latency=0.001)
+    pool = ConnectionPool(server.host, server.port, 2, timeout=5, binary_results=BinaryResults(CLASS_NAMES))
+    results = classify(AsyncClassifier(pool, 2, requests_in_flight=2, batch_size=4), 50)
+    assert results == [DETECTIONS] * 50
+    assert server.nr_of_images == 50
+    pool.close()
+
+
+def test_batches_of_connections_dropped_while_idle_are_sent_again(stand_in):
+    server = stand_in(close_after_response=True)
+    pool = ConnectionPool(server.host, server.port, 2, timeout=5, failure_threshold=1, max_concurrency=4)
+    results = classify(AsyncClassifier(pool, 2, batch_size=4), 50)
+    assert results == [DETECTIONS] * 50
+    assert pool.breaker.state == 'closed'
+    pool.close()
+
+
+def test_failed_batches_get_an_error(stand_in):
+    server = stand_in(failure_rate=1.0)
+    pool = ConnectionPool(server.host, server.port, 1, timeout=5)
+    results = classify(AsyncClassifier(pool, 1, batch_size=4), 8)
+    assert len(results) == 8
+    assert all(result['errorCode'] == 'CONNECTION_ERROR' for result in results)
+    pool.close()
+
+
+# The workers take the latency of their responses to the balancer, so it
+# learns which server is faster
+def test_workers_tell_the_balancer_the_latency(stand_in):
+    fast = stand_in(latency=0.001)
+    slow = stand_in(latency=0.01)
+    balancer = LoadBalancer([(fast.host, fast.port, 1.0), (slow.host, slow.port, 1.0)], 2, timeout=5)
+    results = classify(AsyncClassifier(balancer, 2, batch_size=2), 40)
+    assert results == [DETECTIONS] * 40
+    latencies = [endpoint['latency'] for endpoint in balancer.state()]
+    assert None not in latencies
+    balancer.close()
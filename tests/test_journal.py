@@ -0,0 +1,73 @@
+import io
+
+from image_classification import IngestJournal
+from image_classification.journal import CLASSIFIED, ERROR, SKIPPED
+
+
+def test_ingest_resumes_from_the_journal(tmp_path):
+    path = str(tmp_path / "journal.txt")
+    journal = IngestJournal(path, "settings")
+    journal.record(1, CLASSIFIED)
+    journal.record(2, SKIPPED)
+    journal.record(3, ERROR)
+    journal.close()
+
+    journal = IngestJournal(path, "settings")
+    assert journal.is_done(1)
+    assert journal.is_done(2)
+    # Files that had errors are processed again
+    assert not journal.is_done(3)
+    assert not journal.is_done(4)
+    journal.close()
+
+
+def test_last_outcome_of_a_file_wins(tmp_path):
+    path = str(tmp_path / "journal.txt")
+    journal = IngestJournal(path, "settings")
+    journal.record(1, ERROR)
+    journal.record(1, CLASSIFIED)
+    journal.record(2, CLASSIFIED)
+    journal.record(2, ERROR)
+    journal.close()
+
+    journal = IngestJournal(path, "settings")
+    assert journal.is_done(1)
+    assert not journal.is_done(2)
+    journal.close()
+
+
+def test_journal_of_other_settings_is_discarded(tmp_path):
+    path = str(tmp_path / "journal.txt")
+    journal = IngestJournal(path, "settings")
+    journal.record(1, CLASSIFIED)
+    journal.close()
+
+    journal = IngestJournal(path, "other settings")
+    assert not journal.is_done(1)
+    journal.record(2, CLASSIFIED)
+    journal.close()
+
+    journal = IngestJournal(path, "other settings")
+    assert not journal.is_done(1)
+    assert journal.is_done(2)
+    journal.close()
+
+
+# A crash can leave the last line incomplete
+def test_incomplete_last_line_is_ignored(tmp_path):
+    path = str(tmp_path / "journal.txt")
+    journal = IngestJournal(path, "settings")
+    journal.record(1, CLASSIFIED)
+    journal.close()
+    with io.open(path, 'a', encoding='utf-8') as f:
+        f.write(u"2")
+
+    journal = IngestJournal(path, "settings")
+    assert journal.is_done(1)
+    assert not journal.is_done(2)
+    journal.record(3, CLASSIFIED)
+    journal.close()
+
+    journal = IngestJournal(path, "settings")
+    assert journal.is_done(3)
+    journal.close()
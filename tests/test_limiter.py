@@ -0,0 +1,87 @@
+import socket
+
+import pytest
+
+from conftest import CLASS_NAMES, DETECTIONS, make_image
+from image_classification import BinaryResults, ConcurrencyLimiter, ConnectionPool
+from image_classification.breaker import CLOSED, OPEN
+
+
+def test_limiter_holds_requests_back_at_the_limit():
+    limiter = ConcurrencyLimiter(8, initial_limit=2)
+    assert limiter.acquire()
+    assert limiter.acquire()
+    assert not limiter.acquire(block=False)
+    limiter.release(0.01)
+    assert limiter.acquire(block=False)
+
+
+def test_failed_request_halves_the_limit():
+    limiter = ConcurrencyLimiter(8, initial_limit=8)
+    limiter.acquire()
+    limiter.release(None)
+    assert limiter.state()['limit'] == 4
+
+
+def test_cancelled_request_keeps_the_limit():
+    limiter = ConcurrencyLimiter(8, initial_limit=8)
+    limiter.acquire()
+    limiter.cancel()
+    assert limiter.state() == {'limit': 8, 'inFlight': 0, 'waiting': 0, 'minLatency': None}
+
+
+def test_limit_grows_while_the_server_keeps_up():
+    limiter = ConcurrencyLimiter(8, initial_limit=1)
+    for i in range(10):
+        limiter.acquire()
+        limiter.release(0.01)
+    assert limiter.state()['limit'] > 1
+
+
+def test_limit_shrinks_when_requests_queue_on_the_server():
+    limiter = ConcurrencyLimiter(16, initial_limit=16)
+    limiter.acquire()
+    limiter.release(0.01)
+    limiter.acquire()
+    limiter.release(1.0)
+    assert limiter.state()['limit'] < 16
+
+
+# A server that closes every connection once it answered a request drops the
+# pooled connections while they are idle, which says nothing of its load
+@pytest.mark.parametrize('binary_results', [None, BinaryResults(CLASS_NAMES)])
+def test_connections_dropped_while_idle_are_not_failures(stand_in, binary_results):
+    server = stand_in(close_after_response=True)
+    pool = ConnectionPool(server.host, server.port, 1, timeout=5, failure_threshold=1, max_concurrency=8,
+                          binary_results=binary_results)
+    for i in range(10):
+        detections = pool.get_detections(make_image())
+        assert [detection['className'] for detection in detections] == ["person", "dog"]
+    assert pool.breaker.state == CLOSED
+    assert pool.limiter.state()['limit'] >= 4
+    assert pool.limiter.state()['inFlight'] == 0
+    pool.close()
+
+
+def test_timeout_is_a_failure(stand_in):
+    server = stand_in(latency=0.5)
+    pool = ConnectionPool(server.host, server.port, 1, timeout=0.1, failure_threshold=1, max_concurrency=8)
+    with pytest.raises(socket.timeout):
+        pool.get_detections(make_image())
+    assert pool.breaker.state == OPEN
+    assert pool.limiter.state() == {'limit': 2, 'inFlight': 0, 'waiting': 0, 'minLatency': None}
+    pool.close()
+
+
+# A timeout on a reused connection is the server being slow, not a connection
+# it dropped while idle
+def test_timeout_on_a_reused_connection_is_a_failure(stand_in):
+    server = stand_in()
+    pool = ConnectionPool(server.host, server.port, 1, timeout=0.1, failure_threshold=1, max_concurrency=8)
+    assert pool.get_detections(make_image()) == DETECTIONS
+    server.latency = 0.5
+    with pytest.raises(socket.timeout):
+        pool.get_detections(make_image())
+    assert pool.breaker.state == OPEN
+    assert pool.limiter.state()['limit'] == 2
+    pool.close()
@@ -0,0 +1,199 @@
+import itertools
+import os
+
+import pytest
+
+import autopsy
+from conftest import JPEG_DATA
+
+ImageClassification = autopsy.load_module()
+from java.lang import RuntimeException
+SEVERE = ImageClassification.Level.SEVERE
+WARNING = ImageClassification.Level.WARNING
+CLASSES_OF_INTEREST = [{'name': "person", 'enabled': True}, {'name': "dog", 'enabled': True}]
+
+_job_ids = itertools.count(1)
+
+
+def make_settings(server, **options):
+    settings = ImageClassification.AutopsyImageClassificationModuleWithUISettings()
+    settings.setServerHost(server.host)
+    settings.setServerPort(str(server.port))
+    settings.setImageFormats(["jpg", "jpeg", "png"])
+    settings.setClassesOfInterest(CLASSES_OF_INTEREST)
+    settings.setMinProbability(50)
+    settings.setCacheEnabled(False)
+    settings.setIsServerOnline(True)
+    for name, value in options.items():
+        getattr(settings, 'set' + name)(value)
+    return settings
+
+
+def make_files(first_id, nr_of_files):
+    return [autopsy.AbstractFile(file_id, "image%d.jpg" % file_id, JPEG_DATA, "image/jpeg")
+            for file_id in range(first_id, first_id + nr_of_files)]
+
+
+@pytest.fixture
+def case(tmp_path):
+    autopsy.Case.current = autopsy.Case(str(tmp_path))
+    del autopsy.Logger.records[:]
+    yield autopsy.Case.current
+    autopsy.Case.current = None
+
+
+def severe_records():
+    return [record for record in autopsy.Logger.records if record[0] is SEVERE]
+
+
+def warning_messages():
+    return [record[3] for record in autopsy.Logger.records if record[0] is WARNING]
+
+
+# Reader of ImageIO for a corrupt image, which throws an unchecked exception
+# as soon as the image is decoded
+class CorruptImageReader(object):
+
+    def setInput(self, *args):
+        pass
+
+    def getWidth(self, index):
+        raise RuntimeException("Invalid JPEG file structure")
+
+    def dispose(self):
+        pass
+
+
+class ImageReaders(object):
+
+    def __init__(self, readers):
+        self.readers = list(readers)
+
+    def hasNext(self):
+        return bool(self.readers)
+
+    def next(self):
+        return self.readers.pop(0)
+
+
+class ImageInputStream(object):
+
+    def close(self):
+        pass
+
+
+class CorruptImageIO(object):
+
+    @staticmethod
+    def createImageInputStream(stream):
+        return ImageInputStream()
+
+    @staticmethod
+    def getImageReaders(image_stream):
+        return ImageReaders([CorruptImageReader()])
+
+
+# Every module of the job shuts down as soon as it went through its files,
+# the first one while its images are still waiting for the server
+def ingest(settings, nr_of_modules, nr_of_files_per_module):
+    context = autopsy.IngestJobContext(next(_job_ids))
+    modules = [ImageClassification.AutopsyImageClassificationModule(settings) for i in range(nr_of_modules)]
+    for module in modules:
+        module.startUp(context)
+    files = []
+    for i, module in enumerate(modules):
+        module_files = make_files(i * nr_of_files_per_module, nr_of_files_per_module)
+        for file in module_files:
+            module.process(file)
+        files.extend(module_files)
+    for module in modules:
+        module.shutDown()
+    return context, files
+
+
+def test_async_results_of_a_shut_down_module_are_handled(stand_in, case):
+    server = stand_in(latency=0.01)
+    settings = make_settings(server, AsyncWorkers=2, BatchSize=4, ArtifactFlushSize=1000)
+    context, files = ingest(settings, 2, 20)
+    assert [file.titles() for file in files] == [["Person"]] * 40
+    assert len(case.blackboard.indexed) == 40
+    assert severe_records() == []
+    assert context.getJobId() not in ImageClassification.IngestJobResources._jobs
+
+
+# The last batch is only sent when the last module shuts down
+def test_batched_results_of_a_shut_down_module_are_handled(stand_in, case):
+    server = stand_in()
+    settings = make_settings(server, BatchSize=16, BatchMaxAge=60.0)
+    context, files = ingest(settings, 2, 3)
+    assert [file.titles() for file in files] == [["Person"]] * 6
+    assert os.path.isfile(os.path.join(case.getModuleDirectory(), "Image Classification",
+                                       "metrics-job-%d.json" % context.getJobId()))
+    assert severe_records() == []
+
+
+def test_files_that_are_not_images_are_not_journaled(stand_in, case):
+    server = stand_in()
+    settings = make_settings(server, JournalEnabled=True)
+    context = autopsy.IngestJobContext(next(_job_ids))
+    module = ImageClassification.AutopsyImageClassificationModule(settings)
+    module.startUp(context)
+    text_file = autopsy.AbstractFile(1, "notes.txt", b"text", "text/plain")
+    renamed_image = autopsy.AbstractFile(2, "image.dat", JPEG_DATA, "image/jpeg")
+    module.process(text_file)
+    module.process(renamed_image)
+    module.shutDown()
+    assert text_file.titles() == []
+    assert renamed_image.titles() == ["Person"]
+    with open(os.path.join(case.getModuleDirectory(), "Image Classification", "journal-1.txt")) as f:
+        journaled_ids = [line.split()[0] for line in f if not line.startswith("#")]
+    assert journaled_ids == ["2"]
+
+
+# A module that can not create the job resources does not hold them, so the
+# next module of the job can
+def test_failed_start_up_does_not_hold_the_job_resources(stand_in, case, tmp_path):
+    server = stand_in()
+    not_a_directory = tmp_path / "file"
+    not_a_directory.write_bytes(b"")
+    context = autopsy.IngestJobContext(next(_job_ids))
+    module = ImageClassification.AutopsyImageClassificationModule(
+        make_settings(server, SharedStorePath=str(not_a_directory / "store")))
+    with pytest.raises(OSError):
+        module.startUp(context)
+    module.shutDown()
+
+    module = ImageClassification.AutopsyImageClassificationModule(make_settings(server))
+    module.startUp(context)
+    file = make_files(1, 1)[0]
+    module.process(file)
+    module.shutDown()
+    assert file.titles() == ["Person"]
+    assert context.getJobId() not in ImageClassification.IngestJobResources._jobs
+
+
+def test_corrupt_image_is_sent_without_being_downscaled(stand_in, case, monkeypatch):
+    monkeypatch.setattr(ImageClassification, 'ImageIO', CorruptImageIO)
+    server = stand_in()
+    context = autopsy.IngestJobContext(next(_job_ids))
+    module = ImageClassification.AutopsyImageClassificationModule(make_settings(server, DownscaleMaxSide=16))
+    module.startUp(context)
+    file = make_files(1, 1)[0]
+    assert module.process(file) == ImageClassification.IngestModule.ProcessResult.OK
+    module.shutDown()
+    assert file.titles() == ["Person"]
+    assert server.nr_of_bytes_received >= len(JPEG_DATA)
+    assert [message for message in warning_messages() if message.startswith("Sending the original image")]
+
+
+def test_corrupt_image_is_classified_without_its_perceptual_hash(stand_in, case, monkeypatch):
+    monkeypatch.setattr(ImageClassification, 'ImageIO', CorruptImageIO)
+    server = stand_in()
+    context = autopsy.IngestJobContext(next(_job_ids))
+    module = ImageClassification.AutopsyImageClassificationModule(make_settings(server, NearDuplicates=True))
+    module.startUp(context)
+    file = make_files(1, 1)[0]
+    assert module.process(file) == ImageClassification.IngestModule.ProcessResult.OK
+    module.shutDown()
+    assert file.titles() == ["Person"]
+    assert [message for message in warning_messages() if message.startswith("Error decoding")]
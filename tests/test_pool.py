@@ -0,0 +1,132 @@
+import socket
+import threading
+
+import pytest
+
+from conftest import DETECTIONS, JPEG_DATA, UnreadableImage, make_image
+from image_classification import CircuitOpen, Compressor, ConnectionPool, ImageReadError, IngestMetrics, LocalImage
+from image_classification.breaker import CLOSED
+from image_classification.pool import CLOSING_SERVER_DROPS
+
+
+def test_connections_are_reused(stand_in):
+    server = stand_in()
+    pool = ConnectionPool(server.host, server.port, 1, timeout=5)
+    for i in range(5):
+        assert pool.get_detections(make_image()) == DETECTIONS
+    connection = pool.acquire()
+    assert connection.requests_sent == 5
+    pool.release(connection)
+    pool.close()
+
+
+def test_pool_size_limits_the_connections(stand_in):
+    server = stand_in(latency=0.02)
+    pool = ConnectionPool(server.host, server.port, 2, timeout=5)
+    connections = set()
+    lock = threading.Lock()
+
+    def classify(connection):
+        with lock:
+            connections.add(connection)
+        return connection.get_detections(make_image())
+
+    threads = [threading.Thread(target=lambda: pool.run(classify)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(connections) == 2
+    pool.close()
+
+
+def test_connection_dropped_while_idle_is_replaced(stand_in):
+    server = stand_in(close_after_response=True)
+    metrics = IngestMetrics()
+    pool = ConnectionPool(server.host, server.port, 1, timeout=5, metrics=metrics, max_retries=0)
+    for i in range(5):
+        assert pool.get_detections(make_image()) == DETECTIONS
+    # Once CLOSING_SERVER_DROPS connections were dropped after their first
+    # response, the connections are not reused and no request fails any more
+    counters = metrics.snapshot()['counters']
+    assert counters['retries'] == CLOSING_SERVER_DROPS
+    assert counters['connectionReuseStopped'] == 1
+    assert not pool.reuse_connections
+    pool.close()
+
+
+# A connection dropped after a later response does not stop the reuse
+def test_connections_of_a_server_keeping_them_open_are_still_reused(stand_in):
+    server = stand_in()
+    metrics = IngestMetrics()
+    pool = ConnectionPool(server.host, server.port, 1, timeout=5, metrics=metrics, max_retries=0)
+    for i in range(CLOSING_SERVER_DROPS + 1):
+        assert pool.get_detections(make_image()) == DETECTIONS
+        assert pool.get_detections(make_image()) == DETECTIONS
+        server.drop_connections()
+    assert metrics.snapshot()['counters']['retries'] == CLOSING_SERVER_DROPS
+    assert pool.reuse_connections
+    pool.close()
+
+
+def test_failed_requests_are_retried_then_raised(stand_in):
+    server = stand_in(failure_rate=1.0)
+    metrics = IngestMetrics()
+    pool = ConnectionPool(server.host, server.port, 1, timeout=5, metrics=metrics, max_retries=2)
+    with pytest.raises(socket.error):
+        pool.get_detections(make_image())
+    assert metrics.snapshot()['counters']['retries'] == 2
+    assert server.nr_of_failures == 3
+    pool.close()
+
+
+def test_circuit_opens_after_failures_in_a_row(stand_in):
+    server = stand_in()
+    pool = ConnectionPool(server.host, server.port, 1, timeout=5, failure_threshold=2, reset_timeout=60)
+    server.stop()
+    for i in range(2):
+        with pytest.raises(socket.error):
+            pool.get_detections(make_image())
+    with pytest.raises(CircuitOpen):
+        pool.get_detections(make_image())
+    pool.close()
+
+
+def test_closed_pool_refuses_requests(stand_in):
+    server = stand_in()
+    pool = ConnectionPool(server.host, server.port, 1, timeout=5)
+    pool.close()
+    with pytest.raises(socket.error):
+        pool.get_detections(make_image())
+
+
+
+# An image that can not be read says nothing of the server, even though on
+# Python 3 its IOError is a socket.error
+@pytest.mark.parametrize('compressor', [None, Compressor()])
+def test_unreadable_image_is_not_a_failure_of_the_server(stand_in, compressor):
+    server = stand_in()
+    metrics = IngestMetrics()
+    pool = ConnectionPool(server.host, server.port, 1, timeout=5, metrics=metrics, max_retries=2,
+                          failure_threshold=1, max_concurrency=8, compressor=compressor)
+    limit = pool.limiter.state()['limit']
+    with pytest.raises(ImageReadError):
+        pool.get_detections(UnreadableImage())
+    assert 'retries' not in metrics.snapshot()['counters']
+    assert pool.breaker.state == CLOSED
+    assert pool.limiter.state() == {'limit': limit, 'inFlight': 0, 'waiting': 0, 'minLatency': None}
+    assert pool.get_detections(make_image()) == DETECTIONS
+    pool.close()
+
+
+def test_local_file_removed_before_it_is_sent(stand_in, tmp_path):
+    server = stand_in()
+    path = tmp_path / "image.jpg"
+    path.write_bytes(JPEG_DATA)
+    image = LocalImage(str(path))
+    path.unlink()
+    pool = ConnectionPool(server.host, server.port, 1, timeout=5, max_retries=2, failure_threshold=1)
+    with pytest.raises(ImageReadError):
+        pool.get_detections(image)
+    assert pool.breaker.state == CLOSED
+    pool.close()
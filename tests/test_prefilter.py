@@ -0,0 +1,148 @@
+import struct
+
+import pytest
+
+from conftest import JPEG_DATA, make_image
+from image_classification import Prefilter
+from image_classification.prefilter import (SKIP_FILE_TOO_SMALL, SKIP_FORMAT_NOT_ENABLED, SKIP_IMAGE_TOO_SMALL,
+                                            SKIP_NOT_AN_IMAGE, image_dimensions, sniff_image_format)
+
+
+def png_data(width, height):
+    return b'\x89PNG\r\n\x1a\n' + struct.pack(">I", 13) + b'IHDR' + struct.pack(">II", width, height) + b'\x00' * 64
+
+
+def gif_data(width, height):
+    return b'GIF89a' + struct.pack("<HH", width, height) + b'\x00' * 64
+
+
+def bmp_data(width, height, header_size=40):
+    if header_size == 12:
+        dimensions = struct.pack("<HH", width, height)
+    else:
+        dimensions = struct.pack("<ii", width, height)
+    return b'BM' + b'\x00' * 12 + struct.pack("<I", header_size) + dimensions + b'\x00' * 64
+
+
+# The dimensions of a JPEG come after its other segments, e.g. EXIF
+def jpeg_data(width, height):
+    app1 = b'\xff\xe1' + struct.pack(">H", 18) + b'Exif\x00\x00' + b'\x00' * 10
+    start_of_frame = b'\xff\xc2\x00\x11\x08' + struct.pack(">HH", height, width) + b'\x03'
+    return b'\xff\xd8' + app1 + start_of_frame + b'\x00' * 64
+
+
+# Image that fails the test if its content is read
+class UnreadableImage(object):
+    name = "image.jpg"
+    extension = ".jpg"
+    size = 4096
+
+    def read_header(self, size):
+        raise AssertionError("The image was read")
+
+
+@pytest.mark.parametrize('data, image_format', [
+    (JPEG_DATA, 'jpeg'),
+    (png_data(1, 1), 'png'),
+    (b'GIF87a' + b'\x00' * 26, 'gif'),
+    (gif_data(1, 1), 'gif'),
+    (bmp_data(1, 1), 'bmp'),
+    (b'II*\x00' + b'\x00' * 28, 'tiff'),
+    (b'MM\x00*' + b'\x00' * 28, 'tiff'),
+    (b'RIFF\x00\x00\x00\x00WEBPVP8 ' + b'\x00' * 16, 'webp'),
+    (b'%PDF-1.4' + b'\x00' * 24, None),
+    (b'RIFF\x00\x00\x00\x00WAVEfmt ' + b'\x00' * 16, None),
+    # Too short for the header of a bitmap
+    (b'BM' + b'\x00' * 8, None),
+    (b'', None),
+])
+def test_image_formats_are_recognised_by_their_signature(data, image_format):
+    assert sniff_image_format(data[:32]) == image_format
+
+
+@pytest.mark.parametrize('image_format, data', [
+    ('png', png_data(640, 480)),
+    ('gif', gif_data(640, 480)),
+    ('bmp', bmp_data(640, 480)),
+    ('bmp', bmp_data(640, 480, header_size=12)),
+    # A bitmap stored top-down has a negative height
+    ('bmp', bmp_data(640, -480)),
+    ('jpeg', jpeg_data(640, 480)),
+])
+def test_image_dimensions(image_format, data):
+    assert image_dimensions(image_format, data) == (640, 480)
+
+
+@pytest.mark.parametrize('image_format, data', [
+    ('png', png_data(640, 480)[:20]),
+    ('gif', gif_data(640, 480)[:8]),
+    ('bmp', bmp_data(640, 480)[:22]),
+    ('jpeg', jpeg_data(640, 480)[:30]),
+    ('jpeg', b'\xff\xd8'),
+    # A segment that does not start with a marker
+    ('jpeg', b'\xff\xd8\x00\x00' + b'\x00' * 32),
+])
+def test_truncated_headers_have_no_dimensions(image_format, data):
+    assert image_dimensions(image_format, data) is None
+
+
+def test_files_too_small_are_skipped():
+    prefilter = Prefilter(["jpg"], min_file_size=len(JPEG_DATA) + 1)
+    assert prefilter.check(make_image()) == SKIP_FILE_TOO_SMALL
+    assert Prefilter(["jpg"]).check(make_image(data=b'')) == SKIP_FILE_TOO_SMALL
+
+
+def test_files_that_are_not_images_are_skipped():
+    prefilter = Prefilter(["jpg"])
+    assert prefilter.check(make_image(data=b'%PDF-1.4' + b'\x00' * 64)) == SKIP_NOT_AN_IMAGE
+    assert prefilter.check(make_image(), "application/pdf") == SKIP_NOT_AN_IMAGE
+
+
+def test_formats_not_enabled_are_skipped():
+    prefilter = Prefilter(["jpg"])
+    assert prefilter.check(make_image("image.png", png_data(640, 480))) == SKIP_FORMAT_NOT_ENABLED
+
+
+def test_images_smaller_than_the_min_side_are_skipped():
+    prefilter = Prefilter(["jpg", "png", "gif"], min_image_side=100)
+    assert prefilter.check(make_image("image.png", png_data(640, 99))) == SKIP_IMAGE_TOO_SMALL
+    assert prefilter.check(make_image("image.gif", gif_data(99, 640))) == SKIP_IMAGE_TOO_SMALL
+    assert prefilter.check(make_image(data=jpeg_data(64, 64))) == SKIP_IMAGE_TOO_SMALL
+    assert prefilter.check(make_image(data=jpeg_data(100, 100))) is None
+
+
+# Without dimensions the image is sent, the server knows better
+def test_images_without_dimensions_are_not_skipped():
+    prefilter = Prefilter(["jpg"], min_image_side=100)
+    assert prefilter.check(make_image(data=jpeg_data(64, 64)[:30])) is None
+
+
+def test_renamed_image_gets_the_extension_of_its_format():
+    prefilter = Prefilter(["jpg", "png"])
+    image = make_image("image.dat", png_data(640, 480))
+    assert prefilter.check(image) is None
+    assert image.extension == ".png"
+    image = make_image("image.jpeg")
+    assert prefilter.check(image) is None
+    assert image.extension == ".jpeg"
+
+
+def test_detected_mime_type_spares_reading_the_image():
+    prefilter = Prefilter(["jpg"])
+    assert prefilter.check(UnreadableImage(), "image/jpeg") is None
+    assert prefilter.check(UnreadableImage(), "image/png") == SKIP_FORMAT_NOT_ENABLED
+
+
+# Formats without a known signature are taken on their extension
+def test_formats_without_a_signature_are_accepted_on_their_extension():
+    prefilter = Prefilter(["jpg", "heic"])
+    assert prefilter.check(make_image("image.heic", b'\x00' * 64)) is None
+
+
+def test_candidates_by_name_or_type():
+    prefilter = Prefilter(["jpg", "PNG"])
+    assert prefilter.is_candidate("IMAGE.JPG")
+    assert prefilter.is_candidate("image.png")
+    assert prefilter.is_candidate("image.dat", "image/jpeg")
+    assert not prefilter.is_candidate("notes.txt", "text/plain")
+    assert not prefilter.is_candidate("image")
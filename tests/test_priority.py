@@ -0,0 +1,70 @@
+import threading
+import time
+
+from conftest import JPEG_DATA, make_image
+from image_classification import AsyncClassifier, ConnectionPool, Prioritizer
+from image_classification.priority import LARGE_IMAGE_SIZE, SMALL_IMAGE_SIZE, has_exif
+
+# JPEG starting with an EXIF segment, as the photos of cameras and phones do
+EXIF_DATA = b'\xff\xd8\xff\xe1\x00\x10Exif\x00\x00' + b'\x00' * 32
+# JPEG with a JFIF segment before its EXIF segment
+JFIF_EXIF_DATA = b'\xff\xd8\xff\xe0\x00\x10JFIF\x00' + b'\x00' * 9 + b'\xff\xe1\x00\x10Exif' + b'\x00' * 32
+MEDIUM_SIZE = (SMALL_IMAGE_SIZE + LARGE_IMAGE_SIZE) // 2
+
+
+def test_exif_segment_is_found():
+    assert has_exif(EXIF_DATA[:32])
+    assert has_exif(JFIF_EXIF_DATA[:32])
+    assert not has_exif(JPEG_DATA[:32])
+    assert not has_exif(b'\x89PNG\r\n\x1a\n' + b'\x00' * 24)
+
+
+def test_priority_of_the_path():
+    prioritizer = Prioritizer()
+    image = make_image(data=b'\x00' * MEDIUM_SIZE)
+    assert prioritizer.priority(image, "C:\\Users\\john\\Pictures\\image.jpg") == 2
+    assert prioritizer.priority(image, "/img_data/image.jpg") == 0
+    assert prioritizer.priority(image, "/windows/web/image.jpg") == -2
+    # A cache inside a user directory is still a cache
+    assert prioritizer.priority(image, "/Users/john/AppData/Local/Google/Chrome/Cache/image.jpg") == -2
+
+
+def test_priority_of_the_size_and_exif():
+    prioritizer = Prioritizer()
+    assert prioritizer.priority(make_image(data=b'\x00' * 1024), "/image.jpg") == -1
+    assert prioritizer.priority(make_image(data=b'\x00' * LARGE_IMAGE_SIZE), "/image.jpg") == 1
+    assert prioritizer.priority(make_image(data=EXIF_DATA + b'\x00' * LARGE_IMAGE_SIZE), "/dcim/image.jpg") == 5
+    # Only JPEG images are looked at for EXIF
+    assert prioritizer.priority(make_image("image.png", EXIF_DATA + b'\x00' * MEDIUM_SIZE), "/image.png") == 0
+
+
+def test_configured_paths_replace_the_default_ones():
+    prioritizer = Prioritizer(["\\Evidence\\"], [])
+    image = make_image(data=b'\x00' * MEDIUM_SIZE)
+    assert prioritizer.priority(image, "/evidence/image.jpg") == 2
+    assert prioritizer.priority(image, "/windows/image.jpg") == 0
+
+
+# While the worker waits for the server, the images submitted are queued,
+# and sent highest priority first, then in the order they were submitted
+def test_waiting_images_are_sent_highest_priority_first(stand_in):
+    server = stand_in(latency=0.1)
+    pool = ConnectionPool(server.host, server.port, 1, timeout=5)
+    classifier = AsyncClassifier(pool, 1, max_pending=10)
+    order = []
+    lock = threading.Lock()
+
+    def submit(name, priority):
+        def callback(detections):
+            with lock:
+                order.append(name)
+        classifier.submit(make_image(name), callback, priority)
+
+    submit("first", 0)
+    while not server.nr_of_bytes_received:
+        time.sleep(0.001)
+    for name, priority in [("low", -2), ("normal 1", 0), ("high", 5), ("normal 2", 0), ("medium", 2)]:
+        submit(name, priority)
+    classifier.close()
+    assert order == ["first", "high", "medium", "normal 1", "normal 2", "low"]
+    pool.close()
@@ -0,0 +1,144 @@
+import struct
+
+import pytest
+
+from conftest import CLASS_NAMES, DETECTIONS, make_image
+from image_classification import (BinaryResults, Compressor, IngestMetrics, ResultFilter, ServerConnection,
+                                  fetch_capabilities, merge_classes_of_interest)
+from stand_in_server import ERROR_RESULT
+
+CLASSES_OF_INTEREST = [{'name': "person", 'enabled': True}, {'name': "bicycle", 'enabled': True},
+                       {'name': "dog", 'enabled': False}]
+
+
+def connect(server, **options):
+    return ServerConnection(server.host, server.port, timeout=5, **options)
+
+
+def class_names(detections):
+    return [detection['className'] for detection in detections]
+
+
+def test_lockstep_request(stand_in):
+    server = stand_in()
+    connection = connect(server)
+    assert connection.get_detections(make_image()) == DETECTIONS
+    assert connection.get_detections(make_image()) == DETECTIONS
+    assert connection.requests_sent == 2
+    connection.close()
+
+
+def test_json_batch(stand_in):
+    server = stand_in()
+    connection = connect(server)
+    assert connection.get_batch_detections([make_image(), make_image()]) == [DETECTIONS, DETECTIONS]
+    connection.close()
+
+
+def test_binary_batch(stand_in):
+    server = stand_in()
+    connection = connect(server, binary_results=BinaryResults(CLASS_NAMES))
+    results = connection.get_batch_detections([make_image(), make_image(), make_image()])
+    assert results == [DETECTIONS] * 3
+    assert server.nr_of_images == 3
+    connection.close()
+
+
+def test_binary_batch_with_errors(stand_in):
+    server = stand_in(error_rate=1.0)
+    connection = connect(server, binary_results=BinaryResults(CLASS_NAMES))
+    assert connection.get_batch_detections([make_image(), make_image()]) == [ERROR_RESULT] * 2
+    connection.close()
+
+
+def test_pipelined_batches_come_back_in_order(stand_in):
+    server = stand_in()
+    connection = connect(server, binary_results=BinaryResults(CLASS_NAMES))
+    for nr_of_images in (1, 2, 3):
+        assert connection.send_batch_request([make_image()] * nr_of_images)
+    for nr_of_images in (1, 2, 3):
+        assert connection.receive_batch_response(nr_of_images) == [DETECTIONS] * nr_of_images
+    connection.close()
+
+
+@pytest.mark.parametrize('binary_results', [None, BinaryResults(CLASS_NAMES)])
+def test_compressed_batch(stand_in, binary_results):
+    server = stand_in()
+    metrics = IngestMetrics()
+    connection = connect(server, binary_results=binary_results, compressor=Compressor(metrics=metrics))
+    # Only the bitmap is compressed, JPEG images would barely shrink
+    bitmap = make_image("image.bmp", b'BM' + b'\x00' * 8192)
+    results = connection.get_batch_detections([make_image(), bitmap])
+    assert results == [DETECTIONS] * 2
+    counters = metrics.snapshot()['counters']
+    assert counters['uncompressedBytes'] == bitmap.size
+    assert counters['compressedBytes'] < bitmap.size // 10
+    connection.close()
+
+
+@pytest.mark.parametrize('binary_results', [None, BinaryResults(CLASS_NAMES)])
+def test_filtered_batch(stand_in, binary_results):
+    server = stand_in()
+    server_filter = ResultFilter(50, CLASSES_OF_INTEREST).server_filter(CLASS_NAMES)
+    connection = connect(server, binary_results=binary_results, server_filter=server_filter)
+    results = connection.get_batch_detections([make_image(), make_image()])
+    assert [class_names(detections) for detections in results] == [["person"], ["person"]]
+    connection.close()
+
+
+def test_server_filter_encoding():
+    server_filter = ResultFilter(50.5, CLASSES_OF_INTEREST).server_filter(CLASS_NAMES)
+    assert server_filter.encoded == struct.pack("!Hi", 5050, 1) + b'\x03'
+
+
+def test_binary_results_round_trip():
+    binary_results = BinaryResults(CLASS_NAMES)
+    results = [DETECTIONS, [], ERROR_RESULT]
+    data = binary_results.encode(results)
+    assert binary_results.decode(data, len(data), 3) == results
+
+
+def test_truncated_binary_results_are_refused():
+    binary_results = BinaryResults(CLASS_NAMES)
+    data = binary_results.encode([DETECTIONS])
+    with pytest.raises(ValueError):
+        binary_results.decode(data, len(data) - 1, 1)
+    with pytest.raises(ValueError):
+        binary_results.decode(data, len(data), 2)
+
+
+def test_capabilities(stand_in):
+    server = stand_in(max_batch_size=16, model_version="2")
+    connection = connect(server)
+    capabilities = connection.get_capabilities()
+    assert capabilities['classNames'] == CLASS_NAMES
+    assert capabilities['maxBatchSize'] == 16
+    assert capabilities['modelVersion'] == "2"
+    connection.close()
+
+
+def test_no_capabilities_from_a_server_without_the_handshake(stand_in):
+    server = stand_in(handshake=False)
+    connection = connect(server)
+    assert connection.get_capabilities() is None
+    assert connection.broken
+
+
+def test_fetched_capabilities_cap_the_batch_size(stand_in):
+    server = stand_in(max_batch_size=16, model_version="2")
+    capabilities = fetch_capabilities(server.host, server.port, 5)
+    assert capabilities.model == "stand-in 2"
+    assert capabilities.supports_binary_results()
+    assert capabilities.supports_compression()
+    assert capabilities.batch_size(64) == 16
+    assert capabilities.batch_size(4) == 4
+    assert capabilities.unknown_classes(["person", "cat"]) == ["cat"]
+    server = stand_in(handshake=False)
+    assert fetch_capabilities(server.host, server.port, 5) is None
+
+
+# The classes of interest follow the classes of the model, keeping whether they were enabled
+def test_classes_of_interest_are_merged_with_the_classes_of_the_model():
+    classes_of_interest = [{'name': "cat", 'enabled': True}, {'name': "dog", 'enabled': False}]
+    assert merge_classes_of_interest(classes_of_interest, CLASS_NAMES) == [
+        {'name': "person", 'enabled': True}, {'name': "bicycle", 'enabled': True}, {'name': "dog", 'enabled': False}]
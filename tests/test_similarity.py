@@ -0,0 +1,114 @@
+import random
+
+import pytest
+
+from conftest import DETECTIONS
+from image_classification import NearDuplicateIndex, difference_hash
+from image_classification.similarity import HammingIndex, hamming_distance
+
+MAX_DISTANCE = 4
+
+
+# Grayscale image of 'width' x 'height' pixels getting darker to the right
+def gradient(width, height):
+    return [255 - 255 * x // width for y in range(height) for x in range(width)]
+
+
+# Flips the given bits of the hash
+def flip(image_hash, bits):
+    for bit in bits:
+        image_hash ^= 1 << bit
+    return image_hash
+
+
+# First bit of every chunk of an index, the chunks split the bits evenly
+def chunk_starts(max_distance, nr_of_bits=64):
+    nr_of_chunks = max_distance + 1
+    return [i * nr_of_bits // nr_of_chunks for i in range(nr_of_chunks)]
+
+
+def test_difference_hash_of_a_gradient():
+    assert difference_hash(gradient(9, 8), 9, 8) == (1 << 64) - 1
+    assert difference_hash([128] * 72, 9, 8) == 0
+
+
+# The image is averaged down to 9x8, so a bigger copy hashes the same
+def test_resized_image_has_the_same_hash():
+    generator = random.Random(1)
+    pixels = [generator.randint(0, 255) for i in range(72)]
+    bigger = [pixels[(y // 4) * 9 + x // 4] for y in range(32) for x in range(36)]
+    assert difference_hash(bigger, 36, 32) == difference_hash(pixels, 9, 8)
+
+
+def test_image_too_small_to_hash():
+    with pytest.raises(ValueError):
+        difference_hash([0] * 64, 8, 8)
+
+
+def test_hashes_within_the_distance_are_found():
+    index = HammingIndex(MAX_DISTANCE)
+    image_hash = 0x0123456789abcdef
+    index.add(image_hash, "original")
+    assert index.find(image_hash) == [(0, image_hash, "original")]
+    near_hash = flip(image_hash, [0, 20, 40, 63])
+    assert index.find(near_hash) == [(4, image_hash, "original")]
+    assert index.find(flip(image_hash, [0, 20, 40, 50, 63])) == []
+
+
+# Every chunk holds a different bit, so the hashes share no chunk at all
+def test_hashes_differing_in_every_chunk_are_not_found():
+    index = HammingIndex(MAX_DISTANCE)
+    index.add(0, "original")
+    assert index.find(flip(0, chunk_starts(MAX_DISTANCE))) == []
+
+
+# The bits on both sides of the boundary between two chunks belong to
+# different chunks, so the other chunks still match
+@pytest.mark.parametrize('max_distance', [1, 4, 7, 10])
+def test_bits_at_the_chunk_boundaries(max_distance):
+    index = HammingIndex(max_distance)
+    index.add(0, "original")
+    for start in chunk_starts(max_distance)[1:]:
+        assert index.find(flip(0, [start - 1, start])) == ([(2, 0, "original")] if max_distance >= 2 else [])
+    assert index.find(flip(0, [63])) == [(1, 0, "original")]
+    # All the differing bits in a single chunk
+    assert index.find(flip(0, range(max_distance))) == [(max_distance, 0, "original")]
+
+
+def test_closest_hash_comes_first():
+    index = HammingIndex(MAX_DISTANCE)
+    index.add(flip(0, [1, 2, 3]), "far")
+    index.add(flip(0, [1]), "close")
+    index.add(flip(0, [1, 2, 3, 4, 5, 6]), "too far")
+    assert [value for distance, key, value in index.find(0)] == ["close", "far"]
+
+
+def test_index_finds_what_comparing_every_hash_finds():
+    generator = random.Random(7)
+    hashes = [generator.getrandbits(64) for i in range(200)]
+    # Near duplicates of some of them
+    hashes += [flip(image_hash, generator.sample(range(64), generator.randint(1, 6))) for image_hash in hashes[:100]]
+    index = HammingIndex(MAX_DISTANCE)
+    for i, image_hash in enumerate(hashes):
+        index.add(image_hash, i)
+    for image_hash in hashes:
+        expected = sorted(i for i, other_hash in enumerate(hashes)
+                          if hamming_distance(image_hash, other_hash) <= MAX_DISTANCE)
+        assert sorted(value for distance, key, value in index.find(image_hash)) == expected
+
+
+def test_detections_of_a_near_duplicate_are_scaled_to_its_size():
+    index = NearDuplicateIndex(MAX_DISTANCE)
+    index.add(0, "photo.jpg", 640, 480, DETECTIONS)
+    name, distance, detections = index.find(flip(0, [5]), 1280, 960)
+    assert (name, distance) == ("photo.jpg", 1)
+    assert detections[1]['box'] == {"x": 10, "y": 12, "width": 14, "height": 16}
+    # The stored detections are left as they were
+    assert DETECTIONS[1]['box'] == {"x": 5, "y": 6, "width": 7, "height": 8}
+
+
+def test_image_of_another_aspect_ratio_is_not_a_near_duplicate():
+    index = NearDuplicateIndex(MAX_DISTANCE)
+    index.add(0, "photo.jpg", 640, 480, DETECTIONS)
+    assert index.find(0, 480, 480) is None
+    assert index.find(flip(0, range(MAX_DISTANCE + 1)), 640, 480) is None
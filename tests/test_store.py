@@ -0,0 +1,57 @@
+import json
+import os
+
+from conftest import CLASS_NAMES, DETECTIONS
+from image_classification import KnownFiles, SharedDetectionStore, model_key
+from image_classification.store import MODEL_FILE_NAME
+
+CONTENT_HASH = "0123456789ABCDEF0123456789ABCDEF"
+
+
+def test_stored_detections_are_found_by_another_store(tmp_path):
+    directory = str(tmp_path)
+    SharedDetectionStore(directory, "1", CLASS_NAMES).put(CONTENT_HASH, DETECTIONS)
+
+    store = SharedDetectionStore(directory, "1", CLASS_NAMES)
+    assert store.get(CONTENT_HASH.lower()) == DETECTIONS
+    assert store.get("f" * 32) is None
+    assert (store.hits, store.misses) == (1, 1)
+
+
+def test_detections_are_kept_apart_per_model(tmp_path):
+    directory = str(tmp_path)
+    SharedDetectionStore(directory, "1", CLASS_NAMES).put(CONTENT_HASH, DETECTIONS)
+    assert SharedDetectionStore(directory, "2", CLASS_NAMES).get(CONTENT_HASH) is None
+    assert SharedDetectionStore(directory, "1", list(reversed(CLASS_NAMES))).get(CONTENT_HASH) is None
+
+
+def test_layout_of_the_store(tmp_path):
+    store = SharedDetectionStore(str(tmp_path), "1", CLASS_NAMES)
+    store.put(CONTENT_HASH, [])
+    model_directory = os.path.join(str(tmp_path), model_key("1", CLASS_NAMES))
+    with open(os.path.join(model_directory, MODEL_FILE_NAME)) as f:
+        assert json.load(f) == {'modelVersion': "1", 'classNames': CLASS_NAMES}
+    assert os.listdir(os.path.join(model_directory, "01")) == [CONTENT_HASH.lower() + ".json"]
+    assert store.get(CONTENT_HASH) == []
+
+
+# A file being written by another workstation is not complete yet
+def test_unreadable_detections_are_a_miss(tmp_path):
+    store = SharedDetectionStore(str(tmp_path), "1", CLASS_NAMES)
+    store.put(CONTENT_HASH, DETECTIONS)
+    with open(store._path(CONTENT_HASH), 'w') as f:
+        f.write('[{"className": ')
+    assert store.get(CONTENT_HASH) is None
+
+
+def test_known_files_from_a_hash_list_or_an_nsrl_file(tmp_path):
+    path = tmp_path / "known.txt"
+    path.write_text(u'"SHA-1","MD5","CRC32","FileName"\n'
+                    u'"0000000000000000000000000000000000000000","%s","00000000","image.jpg"\n'
+                    u'fedcba9876543210fedcba9876543210\n'
+                    u'not a hash\n' % CONTENT_HASH)
+    known_files = KnownFiles(str(path))
+    assert len(known_files) == 2
+    assert CONTENT_HASH.lower() in known_files
+    assert "FEDCBA9876543210FEDCBA9876543210" in known_files
+    assert "f" * 32 not in known_files